@@ -1,15 +1,16 @@
 import React, { useState, useEffect, useRef } from 'react';
+import { useAuth } from '../context/AuthContext';
 
 const GlobalChatWindow = ({ userData }) => {
     const [messages, setMessages] = useState([]);
     const [newMessage, setNewMessage] = useState('');
     const ws = useRef(null);
     const messagesEndRef = useRef(null);
+    const { user } = useAuth();
 
     useEffect(() => {
-        // Establish WebSocket connection for the global chat.
-        // We pass the user ID as a query param for potential server-side logic, though not strictly needed for broadcasting.
-        ws.current = new WebSocket(`ws://localhost:8000/ws/chat/global?user_id=${userData.id}`);
+        // Establish WebSocket connection for the global chat, authenticated by the access token.
+        ws.current = new WebSocket(`ws://localhost:8000/ws/chat/global?token=${encodeURIComponent(user?.token || '')}`);
 
         ws.current.onopen = () => console.log('Global chat WebSocket connected');
         
@@ -32,7 +33,7 @@ const GlobalChatWindow = ({ userData }) => {
                 ws.current.close();
             }
         };
-    }, [userData.id]);
+    }, [userData.id, user?.token]);
 
     useEffect(() => {
         // Scroll to the bottom whenever the messages array is updated
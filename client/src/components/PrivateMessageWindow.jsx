@@ -1,5 +1,6 @@
 import React, { useState, useEffect, useRef } from 'react';
 import api from '../services/api';
+import { useAuth } from '../context/AuthContext';
 
 const PrivateMessageWindow = ({ room, userData, friends, onBack, onNotification }) => {
     const [messages, setMessages] = useState([]);
@@ -8,12 +9,13 @@ const PrivateMessageWindow = ({ room, userData, friends, onBack, onNotification
     const [selectedFriends, setSelectedFriends] = useState([]);
     const ws = useRef(null);
     const messagesEndRef = useRef(null);
+    const { user } = useAuth();
 
     useEffect(() => {
         if (!room) return;
 
         // Establish WebSocket connection for the selected private room
-        ws.current = new WebSocket(`ws://localhost:8000/ws/chat/${room.id}?user_id=${userData.id}`);
+        ws.current = new WebSocket(`ws://localhost:8000/ws/chat/${room.id}?token=${encodeURIComponent(user?.token || '')}`);
 
         ws.current.onopen = () => console.log(`Private chat WS connected to room ${room.id}`);
         
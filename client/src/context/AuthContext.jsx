@@ -25,7 +25,8 @@ export const AuthProvider = ({ children }) => {
 
     const login = async (credentials) => {
         const response = await api.post('/auth/login', credentials);
-        const userData = response.data.user;
+        // The access token authenticates the native WebSocket endpoints
+        const userData = { ...response.data.user, token: response.data.access_token };
         localStorage.setItem('user', JSON.stringify(userData));
         setUser(userData);
         navigate('/dashboard');
@@ -33,7 +34,7 @@ export const AuthProvider = ({ children }) => {
 
     const register = async (details) => {
         const response = await api.post('/auth/register', details);
-        const userData = response.data.user;
+        const userData = { ...response.data.user, token: response.data.access_token };
         localStorage.setItem('user', JSON.stringify(userData));
         setUser(userData);
         navigate('/dashboard');
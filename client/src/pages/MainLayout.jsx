@@ -46,7 +46,7 @@ const ToastNotification = ({ notification, onDismiss }) => {
 
 
 const MainLayout = () => {
-    const { logout } = useContext(AuthContext);
+    const { user, logout } = useContext(AuthContext);
     const [userData, setUserData] = useState(null);
     const [friends, setFriends] = useState([]);
     const [notifications, setNotifications] = useState([]);
@@ -66,12 +66,24 @@ const MainLayout = () => {
                 setFriends(friendsRes.data);
                 
                 const userId = userRes.data.id;
-                const ws = new WebSocket(`ws://localhost:8000/ws/notifications/${userId}`);
+                const ws = new WebSocket(`ws://localhost:8000/ws/notifications/${userId}?token=${encodeURIComponent(user?.token || '')}`);
 
                 ws.onopen = () => console.log('Notification WebSocket connected');
                 ws.onmessage = (event) => {
                     try {
                         const notification = JSON.parse(event.data);
+                        if (notification.type === 'notifications') {
+                            // Queued while we were offline, delivered in batches: show them, then
+                            // acknowledge the whole batch so the server stops redelivering it.
+                            const queued = notification.items.map(item => (
+                                typeof item.payload === 'string'
+                                    ? { type: item.type, message: item.payload }
+                                    : { type: item.type, ...item.payload }
+                            ));
+                            setNotifications(prev => [...queued.reverse(), ...prev]);
+                            ws.send(JSON.stringify({ ack: notification.items.map(item => item.id) }));
+                            return;
+                        }
                         setNotifications(prev => [notification, ...prev]);
                         if (notification.type === 'friend_request') {
                             setToast({ type: 'success', message: notification.message });
@@ -1,23 +1,67 @@
+import click
 from flask import Flask, jsonify
 from flask_pymongo import PyMongo
 from flask_login import LoginManager
 from flask_cors import CORS
 from flask_socketio import SocketIO
 from config import Config
-from bson.objectid import ObjectId
+from app import serialization
+from app.cache import UserCache
+from app.indexes import ensure_indexes
+from app.migrations import complete_fresh_migrations
+from app.persistence import MessageWriter
+from app.pubsub import socketio_queue_options
+from app.typeahead import UsernameIndex
+from app.hashing import PasswordHasher
+from app.ratelimit import RateLimiter
+from app.history import GlobalHistory
+from app.rooms import RoomMembership
+from app.presence import PresenceTracker
+from app.notifications import NotificationOutbox
+from app.security import init_session_tokens
+from app.mongo_metrics import MongoMetrics
 
 mongo = PyMongo()
 login = LoginManager()
 socketio = SocketIO()
+user_cache = UserCache()
+message_writer = MessageWriter()
+username_index = UsernameIndex()
+password_hasher = PasswordHasher()
+limiter = RateLimiter()
+global_history = GlobalHistory()
+room_members = RoomMembership()
+presence = PresenceTracker()
+notifications = NotificationOutbox()
+mongo_metrics = MongoMetrics()
 
 @login.user_loader
 def load_user(user_id):
     from app.models import User
-    user_doc = mongo.db.users.find_one({"_id": ObjectId(user_id)})
+    # Public projection only, served from the per-process TTL cache
+    user_doc = user_cache.load_session_user(user_id)
     if user_doc:
         return User(user_doc)
     return None
 
+@login.request_loader
+def load_user_from_token(request):
+    """
+    Authenticates 'Authorization: Bearer <access token>' requests from the
+    signed claims alone, with no database read.
+    """
+    from app.models import User
+    from app.security import decode_session_token, session_tokens_enabled
+    if not session_tokens_enabled():
+        return None
+    header = request.headers.get('Authorization', '')
+    if not header.startswith('Bearer '):
+        return None
+    claims = decode_session_token(header[len('Bearer '):])
+    if not claims:
+        return None
+    return User.from_claims(claims)
+
 @login.unauthorized_handler
 def unauthorized():
     return jsonify({'error': 'Unauthorized access'}), 401
@@ -29,11 +73,29 @@ def create_app(config_class=Config):
     # Dynamic CORS config
     frontend_urls = app.config.get('FRONTEND_URLS', '')
     origins = [url.strip() for url in frontend_urls.split(',')] if frontend_urls else []
-    CORS(app, origins=origins, supports_credentials=True)
+    CORS(app, origins=origins, supports_credentials=True,
+         expose_headers=['X-Prev-Cursor', 'X-Next-Cursor'])
 
-    mongo.init_app(app)
+    init_session_tokens(app)
+    mongo_metrics.init_app(app)
+    mongo.init_app(app, **mongo_metrics.client_options(app.config))
+    password_hasher.init_app(app)
+    limiter.init_app(app)
+    user_cache.init_app(app, mongo)
+    ensure_indexes(mongo.db, global_ttl=app.config.get('GLOBAL_MESSAGE_TTL', 3600),
+                   notification_ttl=app.config.get('NOTIFICATION_TTL', 7 * 24 * 3600))
+    complete_fresh_migrations(mongo.db)
+    message_writer.init_app(app, mongo)
+    username_index.init_app(app, mongo, socketio)
+    global_history.init_app(app, mongo, user_cache)
+    room_members.init_app(app, mongo)
+    presence.init_app(app, mongo, socketio)
+    notifications.init_app(app, mongo, socketio)
     login.init_app(app)
-    socketio.init_app(app, cors_allowed_origins=origins)
+    socketio.init_app(app, cors_allowed_origins=origins,
+                      async_mode=app.config.get('SOCKETIO_ASYNC_MODE', 'threading'),
+                      json=serialization,
+                      **socketio_queue_options(app.config))
 
     # Register Blueprints
     from app.routes.auth import bp as auth_bp
@@ -47,7 +109,49 @@ def create_app(config_class=Config):
     
     from app.routes.users import bp as users_bp
     app.register_blueprint(users_bp, url_prefix='/api/users')
+
+    from app.routes.chat import bp as chat_bp
+    app.register_blueprint(chat_bp, url_prefix='/api/chatrooms')
+
+    from app.routes.metrics import bp as metrics_bp
+    app.register_blueprint(metrics_bp, url_prefix='/api/metrics')
     
     from . import events
 
+    @app.cli.command('backfill-conversations')
+    @click.option('--batch-size', default=1000, help='Messages updated per batch.')
+    @click.option('--pause', default=0.0, help='Seconds to sleep between batches.')
+    def backfill_conversations(batch_size, pause):
+        """Adds conversation_id to existing private messages (resumable)."""
+        from app.migrations import backfill_conversation_ids
+        updated = backfill_conversation_ids(mongo.db, batch_size=batch_size, pause=pause)
+        print(f"Conversation backfill complete: {updated} messages updated.")
+
+    @app.cli.command('backfill-usernames')
+    @click.option('--batch-size', default=1000, help='Users updated per batch.')
+    @click.option('--pause', default=0.0, help='Seconds to sleep between batches.')
+    def backfill_usernames(batch_size, pause):
+        """Adds username_lower to existing users (resumable)."""
+        from app.migrations import backfill_username_lower
+        updated = backfill_username_lower(mongo.db, batch_size=batch_size, pause=pause)
+        print(f"Username backfill complete: {updated} users updated.")
+
+    @app.cli.command('migrate-friendships')
+    @click.option('--batch-size', default=500, help='Users migrated per batch.')
+    @click.option('--drop-arrays', is_flag=True, help='Unset the embedded friends arrays after the migration completes.')
+    def migrate_friendships(batch_size, drop_arrays):
+        """Copies embedded friends arrays into the friendships edge collection (resumable)."""
+        from app.friendships import migrate_friend_arrays
+        processed = migrate_friend_arrays(mongo.db, batch_size=batch_size, drop_arrays=drop_arrays)
+        print(f"Friendship migration complete: {processed} users processed.")
+
+    @app.cli.command('typeahead-snapshot')
+    @click.argument('path', required=False)
+    def typeahead_snapshot(path):
+        """Builds the username typeahead index and writes a snapshot for fast restarts."""
+        if not username_index.ready:
+            username_index.load()
+        count = username_index.save_snapshot(path)
+        print(f"Typeahead snapshot written: {count} usernames.")
+
     return app, socketio
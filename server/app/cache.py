@@ -0,0 +1,230 @@
+# In-process caches used to keep hot read paths off MongoDB.
+
+import threading
+import time
+from collections import OrderedDict, deque
+from bson.objectid import ObjectId
+
+# Only these fields are cached; anything sensitive (password hash, email) stays in Mongo.
+PUBLIC_PROFILE_FIELDS = {'username': 1}
+
+
+class RateCounter:
+    """
+    Counts events in one-second buckets and reports the average rate over a
+    sliding window, or over the time since startup while that is shorter.
+    """
+    def __init__(self, window=60):
+        self.window = window
+        self._started = int(time.monotonic())
+        self._buckets = deque()  # [second, count]
+        self._lock = threading.Lock()
+
+    def add(self, count=1):
+        if not count:
+            return
+        now = int(time.monotonic())
+        with self._lock:
+            if self._buckets and self._buckets[-1][0] == now:
+                self._buckets[-1][1] += count
+            else:
+                self._buckets.append([now, count])
+            self._expire(now)
+
+    def rate(self):
+        now = int(time.monotonic())
+        with self._lock:
+            self._expire(now)
+            elapsed = max(1, min(self.window, now - self._started + 1))  # + 1: the current bucket
+            return sum(count for _, count in self._buckets) / elapsed
+
+    def _expire(self, now):
+        while self._buckets and self._buckets[0][0] <= now - self.window:
+            self._buckets.popleft()
+
+
+class UserCache:
+    """
+    Bounded LRU cache mapping user id -> public profile ({'_id', 'username'}).
+    Entries expire after a TTL and are dropped explicitly whenever a user
+    document is written. A secondary username index serves profile lookups.
+    """
+    def __init__(self, maxsize=10000, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._mongo = None
+        self._saved_reads = RateCounter()
+        self._loader_hits = 0
+        self._loader_misses = 0
+        self._entries = OrderedDict()  # str(user_id) -> (expires_at, profile)
+        self._by_username = {}         # username -> str(user_id)
+        self._lock = threading.Lock()
+
+    def init_app(self, app, mongo):
+        """Reads sizing from the app config and binds the cache to the Mongo extension."""
+        self.maxsize = app.config.get('USER_CACHE_SIZE', self.maxsize)
+        self.ttl = app.config.get('USER_CACHE_TTL', self.ttl)
+        self._mongo = mongo
+
+    @property
+    def _users(self):
+        return self._mongo.db.users
+
+    # --- Internal helpers (callers must hold the lock) ---
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, profile = entry
+        if expires_at < time.monotonic():
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return profile
+
+    def _store(self, profile):
+        key = str(profile['_id'])
+        self._drop(key)
+        self._entries[key] = (time.monotonic() + self.ttl, profile)
+        self._by_username[profile['username']] = key
+        while len(self._entries) > self.maxsize:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            username = entry[1]['username']
+            if self._by_username.get(username) == key:
+                del self._by_username[username]
+
+    # --- Public API ---
+
+    def get(self, user_id):
+        """Returns the public profile for one user id, or None if the user does not exist."""
+        return self.get_many([user_id]).get(str(user_id))
+
+    def get_many(self, user_ids):
+        """
+        Returns {str(user_id): profile} for the given ids. Misses are resolved
+        with a single $in query; ids that do not exist are simply absent.
+        """
+        return self._get_many(user_ids)[0]
+
+    async def get_many_async(self, users, user_ids):
+        """
+        get_many for the asyncio entry point (main.py): the same cache, with
+        misses resolved by one $in query on the given Motor collection.
+        """
+        found, missing = self._cached(user_ids)
+        if missing:
+            docs = await users.find(
+                {'_id': {'$in': [ObjectId(uid) for uid in missing]}},
+                PUBLIC_PROFILE_FIELDS
+            ).to_list(None)
+            found.update(self._remember(docs))
+        return found
+
+    def _get_many(self, user_ids):
+        """get_many that also reports how many of the ids were cache hits."""
+        found, missing = self._cached(user_ids)
+        hit_count = len(found)
+        if missing:
+            docs = list(self._users.find(
+                {'_id': {'$in': [ObjectId(uid) for uid in missing]}},
+                PUBLIC_PROFILE_FIELDS
+            ))
+            found.update(self._remember(docs))
+        return found, hit_count
+
+    def _cached(self, user_ids):
+        """Splits user_ids into ({str(user_id): profile} cache hits, [missing ids])."""
+        found, missing = {}, []
+        with self._lock:
+            for user_id in {str(uid) for uid in user_ids}:
+                profile = self._lookup(user_id)
+                if profile is None:
+                    missing.append(user_id)
+                else:
+                    found[user_id] = profile
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, missing
+
+    def _remember(self, docs):
+        """Caches the fetched user documents; returns them as {str(user_id): profile}."""
+        found = {}
+        with self._lock:
+            for doc in docs:
+                profile = {'_id': doc['_id'], 'username': doc['username']}
+                self._store(profile)
+                found[str(doc['_id'])] = profile
+        return found
+
+    def get_by_username(self, username):
+        """Returns the public profile for a username, or None if no such user exists."""
+        with self._lock:
+            key = self._by_username.get(username)
+            profile = self._lookup(key) if key else None
+            hit = profile is not None and profile['username'] == username
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if hit:
+            return profile
+
+        doc = self._users.find_one({'username': username}, PUBLIC_PROFILE_FIELDS)
+        if not doc:
+            return None
+        profile = {'_id': doc['_id'], 'username': doc['username']}
+        with self._lock:
+            self._store(profile)
+        return profile
+
+    def load_session_user(self, user_id):
+        """
+        Profile lookup for the flask_login user loader, which runs on every
+        authenticated request and Socket.IO event. Only the public projection
+        is cached, never the password hash or friends. Loader hits and misses
+        are counted separately from other cache traffic.
+        """
+        found, hit_count = self._get_many([user_id])
+        with self._lock:
+            if hit_count:
+                self._loader_hits += 1
+            else:
+                self._loader_misses += 1
+        if hit_count:
+            # Each loader hit is one users.find_one the request did not make
+            self._saved_reads.add()
+        return found.get(str(user_id))
+
+    def invalidate(self, *user_ids):
+        """Drops cached entries; call this after writing to a user document."""
+        with self._lock:
+            for user_id in user_ids:
+                self._drop(str(user_id))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_username.clear()
+
+    def stats(self):
+        """Hit/miss counters and current size, used to size the cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'loader_hits': self._loader_hits,
+                'loader_misses': self._loader_misses,
+                'db_reads_saved_per_sec': round(self._saved_reads.rate(), 2),
+            }
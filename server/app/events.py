@@ -1,77 +1,203 @@
 from flask import request
 from flask_login import current_user
 from flask_socketio import emit, join_room, leave_room
-from app import mongo, socketio
+from app import mongo, socketio, message_writer, limiter, global_history, room_members, presence, notifications
+from app.rooms import room_channel, serialize_room_message
+from app.models import User, conversation_id
+from app.security import decode_session_token, session_tokens_enabled
+from app.history import serialize_global_message
 from bson.objectid import ObjectId
 from datetime import datetime, timezone
 
 GLOBAL_ROOM = 'global_chat'
 
-@socketio.on('connect')
-def handle_connect():
+# Users authenticated by access token at connect time, keyed by Socket.IO sid.
+# Event handlers read identity from here instead of loading the user per event.
+token_users = {}
+
+def socket_user():
+    """Returns the authenticated user for the current socket, or None."""
+    user = token_users.get(request.sid)
+    if user is not None:
+        return user
     if current_user.is_authenticated:
-        join_room(current_user.get_id())
+        return current_user
+    return None
+
+def persist_message(message_doc):
+    """
+    Stores a message document. With write-behind enabled it is queued for a
+    batched insert_many. Otherwise, under eventlet/gevent the insert runs in a
+    background green thread so delivery does not wait on the DB round trip,
+    and under threading it is written inline before the message is emitted.
+    """
+    if message_writer.enabled:
+        message_writer.submit(message_doc)
+    elif socketio.async_mode in ('eventlet', 'gevent'):
+        socketio.start_background_task(insert_message, message_doc)
+    else:
+        mongo.db.messages.insert_one(message_doc)
+
+def insert_message(message_doc):
+    try:
+        mongo.db.messages.insert_one(message_doc)
+    except Exception as e:
+        print(f"Failed to persist message {message_doc['_id']}: {e}")
+
+@socketio.on('connect')
+def handle_connect(auth=None):
+    # In token mode clients may authenticate with {'token': <access token>} instead of the session cookie
+    token = auth.get('token') if isinstance(auth, dict) and session_tokens_enabled() else None
+    if token:
+        claims = decode_session_token(token)
+        if not claims:
+            return False
+        token_users[request.sid] = User.from_claims(claims)
+
+    user = socket_user()
+    if user:
+        join_room(user.get_id())
+        presence.connect(user.get_id(), request.sid)
+        notifications.deliver_pending(user.get_id(), request.sid)
     join_room(GLOBAL_ROOM)
 
 @socketio.on('disconnect')
 def handle_disconnect():
-    if current_user.is_authenticated:
-        leave_room(current_user.get_id())
+    user = socket_user()
+    if user:
+        leave_room(user.get_id())
+    presence.disconnect(request.sid)
+    token_users.pop(request.sid, None)
+
+@socketio.on('ack_notifications')
+def handle_ack_notifications(data):
+    user = socket_user()
+    if not user: return
+    try:
+        notifications.ack(user.get_id(), (data or {}).get('ids') or [])
+    except ValueError:
+        return
 
 @socketio.on('send_message')
 def handle_send_message(data):
-    if not current_user.is_authenticated: return
+    user = socket_user()
+    if not user: return
+    if not limiter.allow('send_message', user.get_id()):
+        emit('rate_limited', {'event': 'send_message'})
+        return
 
     recipient_id = ObjectId(data.get('recipient_unique_id'))
     content = data.get('content')
     if not recipient_id or not content: return
 
-    sender_id = ObjectId(current_user.get_id())
+    sender_id = ObjectId(user.get_id())
     
     message_doc = {
+        '_id': ObjectId(),
         'sender_id': sender_id,
         'recipient_id': recipient_id,
+        'conversation_id': conversation_id(sender_id, recipient_id),
         'content': content,
         'timestamp': datetime.now(timezone.utc),
         'is_global': False
     }
-    result = mongo.db.messages.insert_one(message_doc)
-    
+    # The id is generated client-side so the payload is stable before the write lands
+    persist_message(message_doc)
+
     message_data = {
-        'id': str(result.inserted_id),
+        'id': str(message_doc['_id']),
         'sender_id': str(sender_id),
         'recipient_id': str(recipient_id),
         'content': content,
         'timestamp': message_doc['timestamp'].isoformat()
     }
 
-    emit('receive_message', message_data, room=str(recipient_id))
-    emit('receive_message', message_data, room=str(sender_id))
+    # One emit to both rooms: the packet is encoded once and each sid receives it once
+    emit('receive_message', message_data, to=[str(recipient_id), str(sender_id)])
+
+def allow_global_message(user_id):
+    """
+    Per-user and whole-room rate limits shared by every transport that posts to
+    global chat. A message the room limit turns away gives the sender's token back.
+    """
+    if not limiter.allow('send_global_message', user_id):
+        return False
+    if not limiter.allow('global_room', GLOBAL_ROOM):
+        limiter.refund('send_global_message', user_id)
+        return False
+    return True
+
+def new_global_message(user_id, username, content):
+    """
+    Builds a global message document and its wire payload, and adds the
+    payload to the in-memory history buffer. The caller persists and delivers it.
+    """
+    sender_id = ObjectId(user_id)
+    message_doc = {
+        '_id': ObjectId(),
+        'sender_id': sender_id,
+        'recipient_id': None,
+        'content': content,
+        'timestamp': datetime.now(timezone.utc),
+        'is_global': True
+    }
+    message_data = serialize_global_message(message_doc, {'_id': sender_id, 'username': username})
+    global_history.append(message_doc['timestamp'], message_data)
+    return message_doc, message_data
 
 @socketio.on('send_global_message')
 def handle_send_global_message(data):
-    if not current_user.is_authenticated: return
+    user = socket_user()
+    if not user: return
+    if not allow_global_message(user.get_id()):
+        emit('rate_limited', {'event': 'send_global_message'})
+        return
 
     content = data.get('content')
     if not content: return
 
-    sender_id = ObjectId(current_user.get_id())
+    message_doc, message_data = new_global_message(user.get_id(), user.username, content)
+    persist_message(message_doc)
+    emit('receive_global_message', message_data, room=GLOBAL_ROOM)
+
+@socketio.on('join_chatroom')
+def handle_join_chatroom(data):
+    user = socket_user()
+    if not user: return
+    room_id = data.get('room_id')
+    if not room_id or not room_members.is_member(room_id, user.get_id()): return
+    join_room(room_channel(room_id))
+
+@socketio.on('leave_chatroom')
+def handle_leave_chatroom(data):
+    room_id = data.get('room_id')
+    if room_id:
+        leave_room(room_channel(room_id))
+
+@socketio.on('send_room_message')
+def handle_send_room_message(data):
+    user = socket_user()
+    if not user: return
+    room_id = data.get('room_id')
+    content = data.get('content')
+    if not room_id or not content: return
+
+    # Authorization is a set lookup against the cached membership, not a DB read
+    if not room_members.is_member(room_id, user.get_id()): return
+    if not limiter.allow('send_room_message', user.get_id()):
+        emit('rate_limited', {'event': 'send_room_message'})
+        return
 
     message_doc = {
-        'sender_id': sender_id,
+        '_id': ObjectId(),
+        'room_id': ObjectId(room_id),
+        'sender_id': ObjectId(user.get_id()),
         'recipient_id': None,
         'content': content,
         'timestamp': datetime.now(timezone.utc),
-        'is_global': True
+        'is_global': False
     }
-    result = mongo.db.messages.insert_one(message_doc)
+    persist_message(message_doc)
 
-    message_data = {
-        'id': str(result.inserted_id),
-        'content': content,
-        'timestamp': message_doc['timestamp'].isoformat(),
-        'is_global': True,
-        'sender': {'id': str(sender_id), 'username': current_user.username}
-    }
-    
-    emit('receive_global_message', message_data, room=GLOBAL_ROOM)
\ No newline at end of file
+    emit('receive_room_message', serialize_room_message(message_doc, user.username),
+         room=room_channel(room_id))
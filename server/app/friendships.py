@@ -0,0 +1,144 @@
+# Friend graph stored as an edge collection instead of embedded user arrays.
+
+from datetime import datetime, timezone
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from app.migrations import is_complete, mark_complete, STATE_COLLECTION
+
+FRIENDSHIP_MIGRATION = 'friendships_from_arrays'
+# Users whose embedded friends array has not been copied yet.
+UNMIGRATED_USERS = {'friends.0': {'$exists': True}}
+
+# Each friendship is two directed edges, {user_id, friend_id, created_at},
+# so "list my friends" and "are A and B friends" are both a prefix seek on
+# the unique (user_id, friend_id) index.
+
+
+def edges_ready(db):
+    """True once the embedded friends arrays have been copied into the edge collection."""
+    return is_complete(db, FRIENDSHIP_MIGRATION)
+
+
+def add_friendship(db, user_a, user_b):
+    """Records a mutual friendship; idempotent thanks to the unique index."""
+    now = datetime.now(timezone.utc)
+    db.friendships.bulk_write([
+        UpdateOne({'user_id': user_a, 'friend_id': user_b},
+                  {'$setOnInsert': {'created_at': now}}, upsert=True),
+        UpdateOne({'user_id': user_b, 'friend_id': user_a},
+                  {'$setOnInsert': {'created_at': now}}, upsert=True),
+    ], ordered=False)
+
+
+def remove_friendship(db, user_a, user_b):
+    """Deletes both directed edges of a friendship."""
+    db.friendships.delete_many({'$or': [
+        {'user_id': user_a, 'friend_id': user_b},
+        {'user_id': user_b, 'friend_id': user_a},
+    ]})
+
+
+def are_friends(db, user_a, user_b):
+    """Single index point lookup."""
+    return db.friendships.find_one({'user_id': user_a, 'friend_id': user_b}, {'_id': 1}) is not None
+
+
+def friends_among(db, user_id, candidate_ids):
+    """The subset of candidate_ids that are friends of user_id, in one query."""
+    candidate_ids = list(candidate_ids)
+    if not candidate_ids:
+        return set()
+    if edges_ready(db):
+        edges = db.friendships.find({'user_id': user_id, 'friend_id': {'$in': candidate_ids}},
+                                    {'friend_id': 1, '_id': 0})
+        return {edge['friend_id'] for edge in edges}
+    user_doc = db.users.find_one({'_id': user_id}, {'friends': 1}) or {}
+    return set(user_doc.get('friends', [])) & set(candidate_ids)
+
+
+def list_friend_ids(db, user_id, after=None, limit=500):
+    """Returns up to limit friend ids in id order, starting after the given friend id."""
+    query = {'user_id': user_id}
+    if after is not None:
+        query['friend_id'] = {'$gt': after}
+    cursor = db.friendships.find(query, {'friend_id': 1, '_id': 0}).sort('friend_id', 1).limit(limit)
+    return [edge['friend_id'] for edge in cursor]
+
+
+def friend_ids_of_many(db, user_ids):
+    """Returns {user_id: [friend ids]} for several users with one query."""
+    result = {user_id: [] for user_id in user_ids}
+    if not user_ids:
+        return result
+    if edges_ready(db):
+        for edge in db.friendships.find({'user_id': {'$in': list(user_ids)}}, {'user_id': 1, 'friend_id': 1}):
+            result[edge['user_id']].append(edge['friend_id'])
+    else:
+        for user in db.users.find({'_id': {'$in': list(user_ids)}}, {'friends': 1}):
+            result[user['_id']] = user.get('friends', [])
+    return result
+
+
+def migrate_friend_arrays(db, batch_size=500, drop_arrays=False):
+    """
+    Copies every user's embedded friends array into the edge collection,
+    resuming from the last processed user _id. With drop_arrays the arrays
+    are $unset in a second pass, once the migration is marked done and reads
+    have switched to the edges. Returns the number of users processed.
+    """
+    state = db[STATE_COLLECTION].find_one({'_id': FRIENDSHIP_MIGRATION}) or {}
+    last_id = state.get('last_id')
+    processed = 0
+
+    while True:
+        query = dict(UNMIGRATED_USERS)
+        if last_id is not None:
+            query['_id'] = {'$gt': last_id}
+        batch = list(db.users.find(query, {'friends': 1}).sort('_id', 1).limit(batch_size))
+        if not batch:
+            break
+
+        now = datetime.now(timezone.utc)
+        operations = [
+            UpdateOne({'user_id': user['_id'], 'friend_id': friend_id},
+                      {'$setOnInsert': {'created_at': now}}, upsert=True)
+            for user in batch for friend_id in user['friends']
+        ]
+        try:
+            db.friendships.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # Duplicate-key races with live writes are harmless; anything else is not
+            if any(err.get('code') != 11000 for err in e.details.get('writeErrors', [])):
+                raise
+
+        processed += len(batch)
+        last_id = batch[-1]['_id']
+        db[STATE_COLLECTION].update_one(
+            {'_id': FRIENDSHIP_MIGRATION}, {'$set': {'last_id': last_id}}, upsert=True
+        )
+        print(f"Migrated friends of {processed} users (last _id {last_id}).")
+
+    mark_complete(db, FRIENDSHIP_MIGRATION)
+    if drop_arrays:
+        drop_friend_arrays(db, batch_size=batch_size)
+    return processed
+
+
+def drop_friend_arrays(db, batch_size=500):
+    """
+    Unsets the embedded friends arrays. Only runs once the migration is
+    complete, since until then the arrays are what every read uses.
+    Returns the number of users updated.
+    """
+    if not edges_ready(db):
+        raise RuntimeError("Friendship migration has not completed; refusing to drop the arrays")
+    dropped = 0
+    while True:
+        batch = [user['_id'] for user in
+                 db.users.find({'friends': {'$exists': True}}, {'_id': 1}).limit(batch_size)]
+        if not batch:
+            break
+        db.users.update_many({'_id': {'$in': batch}}, {'$unset': {'friends': ''}})
+        dropped += len(batch)
+        print(f"Dropped friends arrays of {dropped} users.")
+    return dropped
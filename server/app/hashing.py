@@ -0,0 +1,100 @@
+# Runs bcrypt hashing off the request workers in a bounded process pool.
+
+import atexit
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import bcrypt
+
+
+class HasherBusy(Exception):
+    """Raised when the hashing queue is full; callers should answer 503."""
+
+
+def _hash_password(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def _check_password(password, hashed_password):
+    return bcrypt.checkpw(password, hashed_password)
+
+
+def hash_rounds(hashed_password):
+    """Returns the cost factor encoded in a bcrypt hash ($2b$<rounds>$...)."""
+    try:
+        return int(hashed_password.split(b'$')[2])
+    except (IndexError, ValueError):
+        return 0
+
+
+class PasswordHasher:
+    """
+    Offloads bcrypt to a process pool so a burst of logins cannot stall the
+    other requests on a worker. At most max_pending jobs may be queued or
+    running; beyond that submit waits queue_timeout seconds and then raises
+    HasherBusy. With workers = 0 hashing runs inline (e.g. serverless). If
+    the platform cannot start a process pool (no POSIX semaphores), hashing
+    falls back to inline instead of failing every login.
+    """
+    def __init__(self, rounds=12, workers=2, max_pending=32, queue_timeout=2.0):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.rounds = app.config.get('BCRYPT_ROUNDS', self.rounds)
+        self.workers = app.config.get('HASH_POOL_WORKERS', self.workers)
+        self.max_pending = app.config.get('HASH_POOL_MAX_PENDING', self.max_pending)
+        self.queue_timeout = app.config.get('HASH_POOL_QUEUE_TIMEOUT', self.queue_timeout)
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+
+    def _pool(self):
+        # Created lazily so the pool is forked from the serving process, not the importer
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                atexit.register(self._executor.shutdown)
+            return self._executor
+
+    def _discard_pool(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise HasherBusy("Password hashing queue is full")
+        try:
+            try:
+                executor = self._pool()
+            except OSError as e:
+                print(f"Process pool unavailable, hashing passwords inline: {e}")
+                self.workers = 0
+                return fn(*args)
+            try:
+                return executor.submit(fn, *args).result()
+            except BrokenProcessPool:
+                # A worker died; this job runs inline and the next one gets a fresh pool
+                self._discard_pool(executor)
+                return fn(*args)
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        """Hashes a plain-text password with the configured work factor."""
+        return self._run(_hash_password, password.encode('utf-8'), self.rounds)
+
+    def check(self, password, hashed_password):
+        """Verifies a plain-text password against a stored bcrypt hash."""
+        return self._run(_check_password, password.encode('utf-8'), hashed_password)
+
+    def needs_rehash(self, hashed_password):
+        """True if the stored hash uses a lower work factor than configured."""
+        return hash_rounds(hashed_password) < self.rounds
@@ -0,0 +1,122 @@
+# Hot in-memory buffer of the most recent global chat messages.
+
+import threading
+import time
+from collections import deque
+from datetime import timedelta, timezone
+
+
+class GlobalHistory:
+    """
+    Ring buffer of the last N global messages, already serialized with their
+    sender's username, so the global history endpoint needs no DB I/O.
+
+    Consistency modes (GLOBAL_HISTORY_MODE):
+      'local'   - filled at startup, then only from messages sent through this
+                  process. Right for a single worker.
+      'refresh' - as 'local', but a read older than refresh_interval first
+                  pulls messages written by other workers since the newest
+                  buffered timestamp (minus skew), deduplicated by id.
+      'off'     - disabled; the endpoint reads MongoDB.
+    """
+    def __init__(self, size=100, mode='local', refresh_interval=1.0, skew=5.0):
+        self.size = size
+        self.mode = mode
+        self.refresh_interval = refresh_interval
+        self.skew = skew
+        self.ready = False
+        self._mongo = None
+        self._user_cache = None
+        self._entries = deque(maxlen=size)  # (timestamp, id, payload), oldest first
+        self._ids = set()
+        self._last_refresh = 0.0
+        self._lock = threading.Lock()
+
+    def init_app(self, app, mongo, user_cache):
+        self._mongo = mongo
+        self._user_cache = user_cache
+        self.size = app.config.get('GLOBAL_HISTORY_SIZE', self.size)
+        self.mode = app.config.get('GLOBAL_HISTORY_MODE', self.mode)
+        self.refresh_interval = app.config.get('GLOBAL_HISTORY_REFRESH_INTERVAL', self.refresh_interval)
+        self.skew = app.config.get('GLOBAL_HISTORY_SKEW', self.skew)
+        self._entries = deque(maxlen=self.size)
+        if self.mode == 'off':
+            return
+        try:
+            self.load()
+        except Exception as e:
+            print(f"Global history buffer unavailable, falling back to MongoDB: {e}")
+
+    def load(self):
+        """Fills the buffer with the newest messages from the database."""
+        docs = list(self._mongo.db.messages.find({'is_global': True})
+                    .sort([('timestamp', -1), ('_id', -1)]).limit(self.size))
+        self._merge(docs)
+        self._last_refresh = time.monotonic()
+        self.ready = True
+
+    def append(self, timestamp, payload):
+        """Adds a message sent through this process."""
+        with self._lock:
+            self._add(timestamp, payload)
+
+    def recent(self):
+        """Returns the buffered messages, oldest first."""
+        if self.mode == 'refresh' and time.monotonic() - self._last_refresh >= self.refresh_interval:
+            self._refresh()
+        with self._lock:
+            return [payload for _, _, payload in self._entries]
+
+    def _refresh(self):
+        self._last_refresh = time.monotonic()
+        with self._lock:
+            newest = self._entries[-1][0] if self._entries else None
+        query = {'is_global': True}
+        if newest is not None:
+            query['timestamp'] = {'$gte': newest - timedelta(seconds=self.skew)}
+        docs = list(self._mongo.db.messages.find(query)
+                    .sort([('timestamp', -1), ('_id', -1)]).limit(self.size))
+        self._merge(docs)
+
+    def _merge(self, docs):
+        docs = [doc for doc in docs if str(doc['_id']) not in self._ids]
+        if not docs:
+            return
+        senders = self._user_cache.get_many(doc['sender_id'] for doc in docs)
+        with self._lock:
+            for doc in docs:
+                sender = senders.get(str(doc['sender_id']))
+                if sender:
+                    self._add(doc['timestamp'], serialize_global_message(doc, sender))
+            # Messages from other workers can arrive out of order; keep the buffer sorted
+            ordered = sorted(self._entries, key=lambda entry: (entry[0], entry[1]))
+            self._entries = deque(ordered[-self.size:], maxlen=self.size)
+            self._ids = {entry[1] for entry in self._entries}
+
+    def _add(self, timestamp, payload):
+        if payload['id'] in self._ids:
+            return
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        if len(self._entries) == self._entries.maxlen:
+            self._ids.discard(self._entries[0][1])
+        self._entries.append((timestamp, payload['id'], payload))
+        self._ids.add(payload['id'])
+
+    def stats(self):
+        with self._lock:
+            return {'mode': self.mode, 'ready': self.ready, 'size': len(self._entries), 'capacity': self.size}
+
+
+def serialize_global_message(msg, sender):
+    """The wire format shared by the history endpoint and the receive_global_message event."""
+    return {
+        "id": str(msg['_id']),
+        "content": msg['content'],
+        "timestamp": msg['timestamp'].isoformat(),
+        "is_global": True,
+        "sender": {
+            "id": str(sender['_id']),
+            "username": sender['username']
+        }
+    }
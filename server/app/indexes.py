@@ -0,0 +1,165 @@
+# Creates the MongoDB indexes the Flask app's query paths rely on.
+
+import pymongo
+
+# Global chat messages written by events.py carry is_global/timestamp.
+GLOBAL_ONLY = {"is_global": True}
+
+# (collection, keys, options) for every index the app's queries depend on.
+INDEXES = [
+    # --- Users Collection ---
+    # Case-insensitive prefix search is a range scan over the lowercased username.
+    ("users", [("username_lower", pymongo.ASCENDING)], {"name": "username_lower"}),
+
+    # --- Messages Collection ---
+    # Private history is an $or of (sender, recipient) pairs sorted by (timestamp, _id);
+    # each branch becomes a range scan over this index.
+    ("messages",
+     [("sender_id", pymongo.ASCENDING), ("recipient_id", pymongo.ASCENDING),
+      ("timestamp", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)],
+     {"name": "sender_recipient_timestamp"}),
+    # Once conversation_id is backfilled, a DM history page is a single seek on this index.
+    ("messages",
+     [("conversation_id", pymongo.ASCENDING), ("timestamp", pymongo.ASCENDING),
+      ("_id", pymongo.ASCENDING)],
+     {"name": "conversation_timestamp"}),
+    # Global history: {is_global: true} sorted by (timestamp, _id), indexing only global messages.
+    ("messages",
+     [("is_global", pymongo.ASCENDING), ("timestamp", pymongo.ASCENDING),
+      ("_id", pymongo.ASCENDING)],
+     {"name": "global_timestamp", "partialFilterExpression": GLOBAL_ONLY}),
+    # Group chat history, paged by (timestamp, _id); only room messages are indexed.
+    ("messages",
+     [("room_id", pymongo.ASCENDING), ("timestamp", pymongo.ASCENDING),
+      ("_id", pymongo.ASCENDING)],
+     {"name": "room_timestamp", "partialFilterExpression": {"room_id": {"$exists": True}}}),
+
+    # --- Chatrooms Collection ---
+    # Multikey index: "rooms I belong to" is a single seek.
+    ("chatrooms", [("members", pymongo.ASCENDING)], {"name": "members"}),
+
+    # --- Friend Requests Collection ---
+    # Pending requests for a user, paged by _id.
+    ("friend_requests",
+     [("to_user_id", pymongo.ASCENDING), ("status", pymongo.ASCENDING),
+      ("_id", pymongo.ASCENDING)],
+     {"name": "to_user_status"}),
+
+    # --- Friendships Collection ---
+    # One document per directed edge; the unique index makes check and list single seeks.
+    ("friendships",
+     [("user_id", pymongo.ASCENDING), ("friend_id", pymongo.ASCENDING)],
+     {"name": "user_friend", "unique": True}),
+
+    # --- Notifications Collection ---
+    # A user's pending outbox in delivery order.
+    ("notifications",
+     [("user_id", pymongo.ASCENDING), ("created_at", pymongo.ASCENDING),
+      ("_id", pymongo.ASCENDING)],
+     {"name": "user_created_at"}),
+
+    # --- Refresh Tokens Collection ---
+    # Expired refresh tokens are removed by MongoDB itself.
+    ("refresh_tokens", [("expires_at", pymongo.ASCENDING)],
+     {"name": "expires_at_ttl", "expireAfterSeconds": 0}),
+    ("refresh_tokens", [("user_id", pymongo.ASCENDING)], {"name": "user_id"}),
+]
+
+# Indexes superseded by the ones above: the single-field to_user_id and room_id
+# indexes are prefixes of to_user_status and room_timestamp, and the
+# createdAt/room_id TTL never matched any document because messages are
+# written with timestamp/is_global.
+OBSOLETE_INDEXES = [
+    ("friend_requests", "to_user_id_1"),
+    ("messages", "room_id_1"),
+    ("messages", "createdAt_1_global_ttl"),
+]
+
+GLOBAL_TTL_INDEX = "timestamp_global_ttl"
+NOTIFICATION_TTL_INDEX = "created_at_ttl"
+
+# Filled by check_indexes(); reported on the metrics endpoint.
+missing_indexes = []
+
+
+def ensure_indexes(db, global_ttl=3600, notification_ttl=7 * 24 * 3600):
+    """
+    Creates the indexes backing the app's hot queries. create_index is a no-op
+    when an identical index already exists, so this is safe on every startup.
+    global_ttl and notification_ttl are the retention of global chat messages
+    and of unacknowledged notifications in seconds (0 keeps them forever).
+    """
+    for collection, keys, options in INDEXES:
+        try:
+            db[collection].create_index(keys, **options)
+        except Exception as e:
+            print(f"An error occurred while creating index {options['name']} on {collection}: {e}")
+
+    for collection, name in OBSOLETE_INDEXES:
+        try:
+            if name in db[collection].index_information():
+                db[collection].drop_index(name)
+                print(f"Dropped obsolete index {name} on {collection}.")
+        except Exception as e:
+            print(f"An error occurred while dropping index {name} on {collection}: {e}")
+
+    try:
+        ensure_global_ttl(db, global_ttl)
+    except Exception as e:
+        print(f"An error occurred while configuring the global message TTL: {e}")
+    try:
+        ensure_ttl(db, "notifications", NOTIFICATION_TTL_INDEX, "created_at", notification_ttl)
+    except Exception as e:
+        print(f"An error occurred while configuring the notification TTL: {e}")
+
+    check_indexes(db, global_ttl, notification_ttl)
+
+
+def ensure_ttl(db, collection, name, field, ttl, partial=None):
+    """
+    Keeps a TTL index in line with the configured retention, adjusting
+    expireAfterSeconds in place with collMod when it changes. A ttl of 0
+    drops the index, so documents are kept forever.
+    """
+    existing = db[collection].index_information().get(name)
+    if not ttl:
+        if existing:
+            db[collection].drop_index(name)
+        return
+    if existing is None:
+        options = {"name": name, "expireAfterSeconds": ttl}
+        if partial:
+            options["partialFilterExpression"] = partial
+        db[collection].create_index([(field, pymongo.ASCENDING)], **options)
+    elif existing.get('expireAfterSeconds') != ttl:
+        db.command('collMod', collection, index={'name': name, 'expireAfterSeconds': ttl})
+
+
+def ensure_global_ttl(db, global_ttl):
+    """Expires global chat messages (only those) global_ttl seconds after they were sent."""
+    ensure_ttl(db, "messages", GLOBAL_TTL_INDEX, "timestamp", global_ttl, partial=GLOBAL_ONLY)
+
+
+def check_indexes(db, global_ttl=3600, notification_ttl=7 * 24 * 3600):
+    """Reports every expected index that is not present, e.g. because creation was refused."""
+    expected = [(collection, options['name']) for collection, _, options in INDEXES]
+    if global_ttl:
+        expected.append(("messages", GLOBAL_TTL_INDEX))
+    if notification_ttl:
+        expected.append(("notifications", NOTIFICATION_TTL_INDEX))
+
+    missing = []
+    present = {}
+    for collection, name in expected:
+        try:
+            if collection not in present:
+                present[collection] = set(db[collection].index_information())
+            if name not in present[collection]:
+                missing.append(f"{collection}.{name}")
+        except Exception as e:
+            missing.append(f"{collection}.{name} (check failed: {e})")
+
+    missing_indexes[:] = missing
+    if missing:
+        print(f"WARNING: missing MongoDB indexes: {', '.join(missing)}")
+    return missing
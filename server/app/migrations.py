@@ -0,0 +1,145 @@
+# Online data migrations for the MongoDB collections, run via the Flask CLI.
+
+import time
+from pymongo import UpdateOne
+from app.models import conversation_id
+
+# Progress documents live here so an interrupted job resumes where it stopped.
+STATE_COLLECTION = 'migration_state'
+CONVERSATION_BACKFILL = 'conversation_id_backfill'
+USERNAME_LOWER_BACKFILL = 'username_lower_backfill'
+
+# Documents each backfill still has to touch.
+UNFILLED_MESSAGES = {'is_global': False, 'room_id': {'$exists': False}, 'conversation_id': {'$exists': False}}
+UNFILLED_USERS = {'username_lower': {'$exists': False}}
+
+_completed = set()
+
+
+def is_complete(db, name):
+    """Returns True once the named migration has finished; cached in-process after that."""
+    if name in _completed:
+        return True
+    state = db[STATE_COLLECTION].find_one({'_id': name}, {'done': 1})
+    if state and state.get('done'):
+        _completed.add(name)
+        return True
+    return False
+
+
+async def is_complete_async(db, name):
+    """is_complete for a Motor database; shares the same in-process cache."""
+    if name in _completed:
+        return True
+    state = await db[STATE_COLLECTION].find_one({'_id': name}, {'done': 1})
+    if state and state.get('done'):
+        _completed.add(name)
+        return True
+    return False
+
+
+def mark_complete(db, name):
+    """Records that the named migration has finished."""
+    db[STATE_COLLECTION].update_one({'_id': name}, {'$set': {'done': True}}, upsert=True)
+    _completed.add(name)
+
+
+def complete_if_nothing_to_migrate(db, name, collection, query):
+    """
+    Marks a migration done when no document matches its work query, so a
+    fresh deploy never pays the per-request progress lookup. Returns True
+    when the migration is complete.
+    """
+    if is_complete(db, name):
+        return True
+    if db[collection].find_one(query, {'_id': 1}) is None:
+        mark_complete(db, name)
+        return True
+    return False
+
+
+def complete_fresh_migrations(db):
+    """Startup check: records every migration that has nothing left to do."""
+    from app.friendships import FRIENDSHIP_MIGRATION, UNMIGRATED_USERS
+    for name, collection, query in (
+        (CONVERSATION_BACKFILL, 'messages', UNFILLED_MESSAGES),
+        (USERNAME_LOWER_BACKFILL, 'users', UNFILLED_USERS),
+        (FRIENDSHIP_MIGRATION, 'users', UNMIGRATED_USERS),
+    ):
+        try:
+            complete_if_nothing_to_migrate(db, name, collection, query)
+        except Exception as e:
+            print(f"An error occurred while checking migration {name}: {e}")
+
+
+def backfill_conversation_ids(db, batch_size=1000, pause=0.0):
+    """
+    Adds conversation_id to private messages written before the field existed.
+    Documents are walked in _id order and the last processed _id is saved
+    after every batch, so the job can be stopped and restarted safely while
+    the app keeps serving traffic. Returns the number of documents updated.
+    """
+    state = db[STATE_COLLECTION].find_one({'_id': CONVERSATION_BACKFILL}) or {}
+    last_id = state.get('last_id')
+    updated = 0
+
+    while True:
+        query = dict(UNFILLED_MESSAGES)
+        if last_id is not None:
+            query['_id'] = {'$gt': last_id}
+        batch = list(db.messages.find(query, {'sender_id': 1, 'recipient_id': 1})
+                     .sort('_id', 1).limit(batch_size))
+        if not batch:
+            break
+
+        db.messages.bulk_write([
+            UpdateOne({'_id': msg['_id']},
+                      {'$set': {'conversation_id': conversation_id(msg['sender_id'], msg['recipient_id'])}})
+            for msg in batch
+        ], ordered=False)
+        updated += len(batch)
+        last_id = batch[-1]['_id']
+        db[STATE_COLLECTION].update_one(
+            {'_id': CONVERSATION_BACKFILL}, {'$set': {'last_id': last_id}}, upsert=True
+        )
+        print(f"Backfilled {updated} messages (last _id {last_id}).")
+        if pause:
+            time.sleep(pause)
+
+    mark_complete(db, CONVERSATION_BACKFILL)
+    return updated
+
+
+def backfill_username_lower(db, batch_size=1000, pause=0.0):
+    """
+    Adds username_lower to users registered before the field existed, using
+    the same resumable _id-ordered batching as the conversation backfill.
+    Returns the number of documents updated.
+    """
+    state = db[STATE_COLLECTION].find_one({'_id': USERNAME_LOWER_BACKFILL}) or {}
+    last_id = state.get('last_id')
+    updated = 0
+
+    while True:
+        query = dict(UNFILLED_USERS)
+        if last_id is not None:
+            query['_id'] = {'$gt': last_id}
+        batch = list(db.users.find(query, {'username': 1}).sort('_id', 1).limit(batch_size))
+        if not batch:
+            break
+
+        db.users.bulk_write([
+            UpdateOne({'_id': user['_id']}, {'$set': {'username_lower': user['username'].lower()}})
+            for user in batch
+        ], ordered=False)
+        updated += len(batch)
+        last_id = batch[-1]['_id']
+        db[STATE_COLLECTION].update_one(
+            {'_id': USERNAME_LOWER_BACKFILL}, {'$set': {'last_id': last_id}}, upsert=True
+        )
+        print(f"Backfilled {updated} users (last _id {last_id}).")
+        if pause:
+            time.sleep(pause)
+
+    mark_complete(db, USERNAME_LOWER_BACKFILL)
+    return updated
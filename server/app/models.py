@@ -1,16 +1,26 @@
 from flask_login import UserMixin
-import bcrypt
+from bson.objectid import ObjectId
+
+def conversation_id(user_a, user_b):
+    """Canonical key for a direct conversation: the two user ids, sorted and joined."""
+    return '_'.join(sorted([str(user_a), str(user_b)]))
 
 class User(UserMixin):
     def __init__(self, user_doc):
         self.user_doc = user_doc
 
+    @classmethod
+    def from_claims(cls, claims):
+        """Builds a user from verified access-token claims without touching the database."""
+        return cls({'_id': ObjectId(claims['sub']), 'username': claims.get('username')})
+
     def get_id(self):
         return str(self.user_doc['_id'])
 
     def check_password(self, password_to_check):
+        from app import password_hasher
         hashed_password = self.user_doc.get('password', b'')
-        return bcrypt.checkpw(password_to_check.encode('utf-8'), hashed_password)
+        return password_hasher.check(password_to_check, hashed_password)
     
     @property
     def username(self):
@@ -0,0 +1,232 @@
+# MongoDB driver instrumentation: per-command latency and connection pool usage.
+
+import asyncio
+import threading
+import time
+from bisect import bisect_left
+from pymongo import monitoring
+
+try:
+    import greenlet
+except ImportError:  # only present with the eventlet/gevent runtimes
+    greenlet = None
+
+# Upper bounds of the latency buckets, in milliseconds; the last bucket is open-ended.
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+def mongo_client_options(config, event_listeners=()):
+    """
+    MongoClient keyword arguments from the app config, shared by PyMongo and
+    Motor so both pools are sized the same way. Zero means "driver default".
+    """
+    options = {
+        'maxPoolSize': config['MONGO_MAX_POOL_SIZE'],
+        'minPoolSize': config['MONGO_MIN_POOL_SIZE'],
+        'serverSelectionTimeoutMS': config['MONGO_SERVER_SELECTION_TIMEOUT_MS'],
+        'connectTimeoutMS': config['MONGO_CONNECT_TIMEOUT_MS'],
+        'readPreference': config['MONGO_READ_PREFERENCE'],
+    }
+    for option, key in (('maxIdleTimeMS', 'MONGO_MAX_IDLE_TIME_MS'),
+                        ('waitQueueTimeoutMS', 'MONGO_WAIT_QUEUE_TIMEOUT_MS'),
+                        ('socketTimeoutMS', 'MONGO_SOCKET_TIMEOUT_MS')):
+        if config[key]:
+            options[option] = config[key]
+    if event_listeners:
+        options['event_listeners'] = list(event_listeners)
+    return options
+
+
+class LatencyHistogram:
+    """Cumulative bucketed latencies; callers hold the owning listener's lock."""
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms):
+        self.counts[bisect_left(LATENCY_BUCKETS_MS, ms)] += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def snapshot(self):
+        count = sum(self.counts)
+        labels = [f'le_{bound}' for bound in LATENCY_BUCKETS_MS] + ['inf']
+        return {
+            'count': count,
+            'avg_ms': round(self.total_ms / count, 3) if count else 0.0,
+            'max_ms': round(self.max_ms, 3),
+            'buckets': dict(zip(labels, self.counts)),
+        }
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """Latency histogram and failure count per command name (find, insert, update, ...)."""
+    def __init__(self):
+        self._latency = {}
+        self._failures = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._observe(event.command_name, event.duration_micros)
+
+    def failed(self, event):
+        self._observe(event.command_name, event.duration_micros)
+        with self._lock:
+            self._failures[event.command_name] = self._failures.get(event.command_name, 0) + 1
+
+    def _observe(self, name, duration_micros):
+        with self._lock:
+            histogram = self._latency.get(name)
+            if histogram is None:
+                histogram = self._latency[name] = LatencyHistogram()
+            histogram.observe(duration_micros / 1000)
+
+    def stats(self):
+        with self._lock:
+            return {
+                name: {**histogram.snapshot(), 'failures': self._failures.get(name, 0)}
+                for name, histogram in self._latency.items()
+            }
+
+
+def current_waiter():
+    """Who is checking out a connection: the asyncio task, else the greenlet, else the thread."""
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:  # no running event loop
+        task = None
+    if task is not None:
+        return id(task)
+    if greenlet is not None:
+        return id(greenlet.getcurrent())
+    return threading.get_ident()
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """
+    Connection counts and checkout wait time across every pool in the
+    process. Wait time is the duration the driver reports on each
+    checked-out / check-out-failed event. Older drivers report none; it is
+    then measured from check_out_started, keyed by pool address and by the
+    task, greenlet or thread that is waiting, since many of those can share
+    one OS thread.
+    """
+    def __init__(self):
+        self.open = 0
+        self.in_use = 0
+        self.max_in_use = 0
+        self.checkouts = 0
+        self.checkout_timeouts = 0
+        self.checkout_failures = 0
+        self.pool_clears = 0
+        self._wait = LatencyHistogram()
+        self._waiting = {}  # (address, waiter) -> checkout start; only for drivers without durations
+        self._lock = threading.Lock()
+
+    def _wait_started(self, event):
+        with self._lock:
+            self._waiting[(event.address, current_waiter())] = time.perf_counter()
+
+    def _wait_finished(self, event):
+        # Callers hold the lock
+        started = self._waiting.pop((event.address, current_waiter()), None)
+        duration = getattr(event, 'duration', None)
+        if duration is not None:
+            self._wait.observe(duration * 1000)
+        elif started is not None:
+            self._wait.observe((time.perf_counter() - started) * 1000)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open = max(0, self.open - 1)
+
+    def connection_check_out_started(self, event):
+        self._wait_started(event)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self._wait_finished(event)
+            if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+                self.checkout_timeouts += 1
+            else:
+                self.checkout_failures += 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self._wait_finished(event)
+            self.checkouts += 1
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use = max(0, self.in_use - 1)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'open_connections': self.open,
+                'in_use': self.in_use,
+                'max_in_use': self.max_in_use,
+                'checkouts': self.checkouts,
+                'checkout_timeouts': self.checkout_timeouts,
+                'checkout_failures': self.checkout_failures,
+                'pool_clears': self.pool_clears,
+                'checkout_wait': self._wait.snapshot(),
+            }
+
+
+class MongoMetrics:
+    """
+    Owns the listeners passed to every MongoClient in the process. Rising
+    checkout wait with in_use pinned at max_pool_size means the workers are
+    starving for connections.
+    """
+    def __init__(self):
+        self.enabled = True
+        self.max_pool_size = None
+        self.commands = CommandMetrics()
+        self.pool = PoolMetrics()
+
+    def init_app(self, app):
+        self.enabled = app.config.get('MONGO_MONITORING_ENABLED', self.enabled)
+        self.max_pool_size = app.config.get('MONGO_MAX_POOL_SIZE')
+
+    def client_options(self, config):
+        """MongoClient kwargs for the configured pool, with the listeners when enabled."""
+        listeners = (self.commands, self.pool) if self.enabled else ()
+        return mongo_client_options(config, listeners)
+
+    def stats(self):
+        if not self.enabled:
+            return {'enabled': False}
+        return {
+            'enabled': True,
+            'max_pool_size': self.max_pool_size,
+            'pool': self.pool.stats(),
+            'commands': self.commands.stats(),
+        }
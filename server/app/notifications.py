@@ -0,0 +1,112 @@
+# Persisted per-user notification outbox with batched delivery and bulk acks.
+#
+# Client protocol: notifications arrive as lists of {id, type, payload, created_at},
+# on the Socket.IO 'notifications' event or, on /ws/notifications, as
+# {"type": "notifications", "items": [...]} frames. Everything delivered is
+# redelivered on every reconnect until the client acknowledges it, either with
+# the Socket.IO 'ack_notifications' event ({"ids": [...]}), a POST to
+# /api/friends/notifications/ack ({"ids": [...]}) or {"ack": [...]} on
+# /ws/notifications. Unacknowledged items expire after NOTIFICATION_TTL.
+
+from datetime import datetime, timezone
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+
+# Items per delivery frame: 500 pending notifications arrive in 3 frames, not 500.
+FRAME_SIZE = 200
+# Upper bound on what one reconnect drains; the rest follows after the client acks.
+MAX_PENDING_DELIVERY = 1000
+
+
+def new_notification(user_id, kind, payload):
+    return {
+        '_id': ObjectId(),
+        'user_id': ObjectId(user_id),
+        'type': kind,
+        'payload': payload,
+        'created_at': datetime.now(timezone.utc)
+    }
+
+
+def serialize_notification(doc):
+    return {
+        'id': str(doc['_id']),
+        'type': doc['type'],
+        'payload': doc['payload'],
+        'created_at': doc['created_at'].isoformat()
+    }
+
+
+def frames(items, frame_size=FRAME_SIZE):
+    """Splits serialized notifications into delivery frames."""
+    return [items[start:start + frame_size] for start in range(0, len(items), frame_size)]
+
+
+def pending_query(user_id):
+    return {'user_id': ObjectId(user_id)}
+
+
+def ack_query(user_id, ids):
+    """Filter removing the acknowledged items; raises ValueError on a malformed id."""
+    try:
+        object_ids = [ObjectId(item_id) for item_id in ids]
+    except (InvalidId, TypeError):
+        raise ValueError("Invalid notification id")
+    return {'user_id': ObjectId(user_id), '_id': {'$in': object_ids}}
+
+
+class NotificationOutbox:
+    """
+    Notifications are written to the notifications collection first and
+    stay there until the client acknowledges them, so nothing is lost while
+    a user is offline. Live users get them immediately over Socket.IO;
+    reconnecting users get everything pending in a few batched frames.
+    """
+    def __init__(self):
+        self._mongo = None
+        self._socketio = None
+        self.frame_size = FRAME_SIZE
+        self.max_delivery = MAX_PENDING_DELIVERY
+        self.enqueued = 0
+        self.delivered = 0
+        self.frames_sent = 0
+        self.acknowledged = 0
+
+    def init_app(self, app, mongo, socketio):
+        self._mongo = mongo
+        self._socketio = socketio
+        self.frame_size = app.config.get('NOTIFICATION_FRAME_SIZE', self.frame_size)
+        self.max_delivery = app.config.get('NOTIFICATION_MAX_DELIVERY', self.max_delivery)
+
+    def notify(self, user_id, kind, payload):
+        """Persists a notification and pushes it to the user's room if they are connected."""
+        doc = new_notification(user_id, kind, payload)
+        self._mongo.db.notifications.insert_one(doc)
+        self.enqueued += 1
+        self._socketio.emit('notifications', [serialize_notification(doc)], to=str(user_id))
+
+    def deliver_pending(self, user_id, sid):
+        """Sends everything pending for a user to one connection, a frame at a time."""
+        docs = self._mongo.db.notifications.find(pending_query(user_id)) \
+            .sort([('created_at', 1), ('_id', 1)]).limit(self.max_delivery)
+        for frame in frames([serialize_notification(doc) for doc in docs], self.frame_size):
+            self._socketio.emit('notifications', frame, to=sid)
+            self.delivered += len(frame)
+            self.frames_sent += 1
+
+    def ack(self, user_id, ids):
+        """Removes acknowledged notifications in one delete; returns how many were removed."""
+        if not ids:
+            return 0
+        removed = self._mongo.db.notifications.delete_many(ack_query(user_id, ids)).deleted_count
+        self.acknowledged += removed
+        return removed
+
+    def stats(self):
+        return {
+            'frame_size': self.frame_size,
+            'enqueued': self.enqueued,
+            'delivered_on_reconnect': self.delivered,
+            'frames_sent': self.frames_sent,
+            'acknowledged': self.acknowledged,
+        }
@@ -0,0 +1,145 @@
+# Write-behind buffer that batches chat message inserts into insert_many calls.
+
+import atexit
+import queue
+import threading
+import time
+from pymongo.errors import BulkWriteError, PyMongoError
+
+
+class MessageWriter:
+    """
+    Collects message documents from the Socket.IO handlers and flushes them
+    with insert_many(ordered=False) once a batch fills up or the flush
+    interval elapses. Documents must already carry their own ObjectId so the
+    emitted payload is stable before the flush.
+
+    The queue is bounded: when it is full, submit() blocks for up to
+    put_timeout seconds (backpressure) and then writes the document inline
+    rather than dropping it. Pending documents are flushed on shutdown.
+    """
+    def __init__(self, batch_size=500, flush_interval=0.05, max_queue=10000, put_timeout=1.0):
+        self.enabled = False
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.put_timeout = put_timeout
+        self._mongo = None
+        self._queue = None
+        self._thread = None
+        self._stopping = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._flushed = 0
+        self._batches = 0
+        self._failed = 0
+        self._inline_writes = 0
+        self._last_flush_ms = 0.0
+        self._max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    def init_app(self, app, mongo):
+        """Reads settings from the app config and starts the flusher if write-behind is enabled."""
+        self._mongo = mongo
+        self.enabled = app.config.get('MESSAGE_WRITE_BEHIND', False)
+        self.batch_size = app.config.get('MESSAGE_WRITE_BATCH_SIZE', self.batch_size)
+        self.flush_interval = app.config.get('MESSAGE_WRITE_FLUSH_INTERVAL', self.flush_interval)
+        self.max_queue = app.config.get('MESSAGE_WRITE_QUEUE_SIZE', self.max_queue)
+        self.put_timeout = app.config.get('MESSAGE_WRITE_PUT_TIMEOUT', self.put_timeout)
+        if self.enabled:
+            self.start()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='message-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self, timeout=5.0):
+        """Stops the flusher and writes everything still queued."""
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        self._thread = None
+        remaining = []
+        while True:
+            try:
+                remaining.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        for start in range(0, len(remaining), self.batch_size):
+            self._write(remaining[start:start + self.batch_size])
+
+    def submit(self, message_doc):
+        """Queues a message document for the next batch."""
+        try:
+            self._queue.put(message_doc, timeout=self.put_timeout)
+        except queue.Full:
+            # Backpressure exhausted: persist inline rather than lose the message
+            with self._stats_lock:
+                self._inline_writes += 1
+            self._write([message_doc])
+
+    def _run(self):
+        while not self._stopping.is_set():
+            batch = self._next_batch()
+            if batch:
+                self._write(batch)
+
+    def _next_batch(self):
+        """Blocks for the first document, then gathers more until the batch is full or the interval ends."""
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        if not batch:
+            return
+        started = time.perf_counter()
+        failed = 0
+        try:
+            self._mongo.db.messages.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            failed = len(e.details.get('writeErrors', []))
+            print(f"Message batch partially failed: {failed} of {len(batch)} documents not written.")
+        except PyMongoError as e:
+            failed = len(batch)
+            print(f"Message batch of {len(batch)} failed: {e}")
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._stats_lock:
+            self._batches += 1
+            self._flushed += len(batch) - failed
+            self._failed += failed
+            self._last_flush_ms = elapsed_ms
+            self._max_flush_ms = max(self._max_flush_ms, elapsed_ms)
+            self._total_flush_ms += elapsed_ms
+
+    def stats(self):
+        """Queue depth and flush latency, exposed on the metrics endpoint."""
+        with self._stats_lock:
+            return {
+                'enabled': self.enabled,
+                'queue_depth': self._queue.qsize() if self._queue is not None else 0,
+                'max_queue': self.max_queue,
+                'flushed': self._flushed,
+                'failed': self._failed,
+                'inline_writes': self._inline_writes,
+                'batches': self._batches,
+                'last_flush_ms': round(self._last_flush_ms, 3),
+                'max_flush_ms': round(self._max_flush_ms, 3),
+                'avg_flush_ms': round(self._total_flush_ms / self._batches, 3) if self._batches else 0.0,
+            }
@@ -0,0 +1,241 @@
+# Presence tracking: who is online, with debounced friend-only broadcasts.
+
+import threading
+import uuid
+from bson.objectid import ObjectId
+from app.friendships import friend_ids_of_many
+
+
+class MemoryPresenceStore:
+    """Per-process connection counts; correct for a single worker."""
+    def __init__(self):
+        self._counts = {}
+        self._announced = set()
+        self._lock = threading.Lock()
+
+    def incr(self, user_id):
+        with self._lock:
+            self._counts[user_id] = self._counts.get(user_id, 0) + 1
+            return self._counts[user_id]
+
+    def decr(self, user_id):
+        with self._lock:
+            count = self._counts.get(user_id, 0) - 1
+            if count <= 0:
+                self._counts.pop(user_id, None)
+                return 0
+            self._counts[user_id] = count
+            return count
+
+    def online_many(self, user_ids):
+        with self._lock:
+            return {user_id for user_id in user_ids if self._counts.get(user_id)}
+
+    def announce(self, states):
+        """Records {user_id: online} as broadcast; returns only the entries that changed."""
+        changes = {}
+        with self._lock:
+            for user_id, online in states.items():
+                if online and user_id not in self._announced:
+                    self._announced.add(user_id)
+                    changes[user_id] = True
+                elif not online and user_id in self._announced:
+                    self._announced.discard(user_id)
+                    changes[user_id] = False
+        return changes
+
+    def heartbeat(self, local_counts):
+        return set()
+
+
+class RedisPresenceStore:
+    """
+    Presence shared by every worker through Redis. Each worker keeps its
+    connection counts in its own hash, which expires unless the worker's
+    heartbeat refreshes it, so counts left behind by a crashed worker
+    disappear after worker_ttl seconds. A user is online while any live
+    worker counts a connection for them. The last-broadcast state is shared
+    too, so whichever worker sees the final disconnect announces it.
+    """
+    ALIVE_FIELD = '__alive__'
+
+    def __init__(self, url, prefix='presence', worker_ttl=30, client=None):
+        self.worker_id = uuid.uuid4().hex
+        self.worker_ttl = worker_ttl
+        self.workers_key = f'{prefix}:workers'
+        self.announced_key = f'{prefix}:announced'
+        self._prefix = prefix
+        self.counts_key = self._counts_key(self.worker_id)
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self._client = client
+
+    def _counts_key(self, worker_id):
+        return f'{self._prefix}:connections:{worker_id}'
+
+    def _register(self, pipe):
+        pipe.hset(self.counts_key, self.ALIVE_FIELD, 1)
+        pipe.expire(self.counts_key, self.worker_ttl)
+        pipe.sadd(self.workers_key, self.worker_id)
+
+    def incr(self, user_id):
+        pipe = self._client.pipeline()
+        pipe.hincrby(self.counts_key, user_id, 1)
+        self._register(pipe)
+        return pipe.execute()[0]
+
+    def decr(self, user_id):
+        count = self._client.hincrby(self.counts_key, user_id, -1)
+        if count <= 0:
+            self._client.hdel(self.counts_key, user_id)
+            return 0
+        return count
+
+    def online_many(self, user_ids):
+        user_ids = list(user_ids)
+        if not user_ids:
+            return set()
+        workers = [worker.decode() for worker in self._client.smembers(self.workers_key)]
+        pipe = self._client.pipeline()
+        for worker_id in workers:
+            pipe.hmget(self._counts_key(worker_id), user_ids)
+        online = set()
+        for counts in pipe.execute():
+            online.update(user_id for user_id, count in zip(user_ids, counts) if count and int(count) > 0)
+        return online
+
+    def announce(self, states):
+        # HSETNX / HDEL report whether they changed anything, so of several
+        # workers flushing the same user only one sees the transition
+        user_ids = list(states)
+        pipe = self._client.pipeline()
+        for user_id in user_ids:
+            if states[user_id]:
+                pipe.hsetnx(self.announced_key, user_id, 1)
+            else:
+                pipe.hdel(self.announced_key, user_id)
+        return {user_id: states[user_id] for user_id, changed in zip(user_ids, pipe.execute()) if changed}
+
+    def heartbeat(self, local_counts):
+        """
+        Keeps this worker's counts alive (rewriting them if they expired during
+        a stall) and reaps workers whose counts have expired. When one has,
+        every announced user is returned so their state can be re-checked.
+        """
+        if not self._client.expire(self.counts_key, self.worker_ttl) and local_counts:
+            pipe = self._client.pipeline()
+            pipe.hset(self.counts_key, mapping=local_counts)
+            self._register(pipe)
+            pipe.execute()
+        workers = [worker.decode() for worker in self._client.smembers(self.workers_key)]
+        pipe = self._client.pipeline()
+        for worker_id in workers:
+            pipe.exists(self._counts_key(worker_id))
+        dead = [worker_id for worker_id, alive in zip(workers, pipe.execute())
+                if not alive and worker_id != self.worker_id]
+        if not dead:
+            return set()
+        self._client.srem(self.workers_key, *dead)
+        return {user_id.decode() for user_id in self._client.hkeys(self.announced_key)}
+
+
+class PresenceTracker:
+    """
+    Registry of live Socket.IO connections per user. A user whose first
+    connection opens or last connection closes on this worker is queued for
+    a check; checks are coalesced for `debounce` seconds (so a page reload
+    that reconnects immediately produces no broadcast at all), resolved
+    against the store across all workers, and the real transitions are sent
+    in one 'presence' event per friend, listing every friend that changed.
+    """
+    def __init__(self, debounce=2.0):
+        self.debounce = debounce
+        self._mongo = None
+        self._socketio = None
+        self._store = MemoryPresenceStore()
+        self._sids = {}        # sid -> user_id (this process only)
+        self._pending = set()  # user ids whose state must be re-checked
+        self._flusher_started = False
+        self._lock = threading.Lock()
+
+    def init_app(self, app, mongo, socketio):
+        self._mongo = mongo
+        self._socketio = socketio
+        self.debounce = app.config.get('PRESENCE_DEBOUNCE', self.debounce)
+        url = app.config.get('PRESENCE_STORE_URL')
+        if url:
+            self._store = RedisPresenceStore(url, worker_ttl=app.config.get('PRESENCE_WORKER_TTL', 30))
+        else:
+            self._store = MemoryPresenceStore()
+
+    def connect(self, user_id, sid):
+        user_id = str(user_id)
+        with self._lock:
+            self._sids[sid] = user_id
+        if self._store.incr(user_id) == 1:
+            self._mark(user_id)
+
+    def disconnect(self, sid):
+        with self._lock:
+            user_id = self._sids.pop(sid, None)
+        if user_id is not None and self._store.decr(user_id) == 0:
+            self._mark(user_id)
+
+    def online(self, user_ids):
+        """Bulk check: the subset of user_ids with at least one live connection on any worker."""
+        return self._store.online_many([str(user_id) for user_id in user_ids])
+
+    def _mark(self, user_id):
+        with self._lock:
+            self._pending.add(user_id)
+            if not self._flusher_started:
+                self._flusher_started = True
+                self._socketio.start_background_task(self._flush_loop)
+
+    def _flush_loop(self):
+        while True:
+            self._socketio.sleep(self.debounce)
+            try:
+                self.heartbeat()
+                self.flush()
+            except Exception as e:
+                print(f"Presence flush failed: {e}")
+
+    def heartbeat(self):
+        """Keeps this worker's counts alive; users of a crashed worker are queued for a check."""
+        with self._lock:
+            local_counts = {}
+            for user_id in self._sids.values():
+                local_counts[user_id] = local_counts.get(user_id, 0) + 1
+        recheck = self._store.heartbeat(local_counts)
+        if recheck:
+            with self._lock:
+                self._pending.update(recheck)
+
+    def flush(self):
+        """Broadcasts coalesced presence changes, one event per affected friend."""
+        with self._lock:
+            pending, self._pending = self._pending, set()
+        if not pending:
+            return
+        online = self._store.online_many(pending)
+        changes = self._store.announce({user_id: user_id in online for user_id in pending})
+        if not changes:
+            return
+
+        friends_of = friend_ids_of_many(self._mongo.db, [ObjectId(user_id) for user_id in changes])
+        updates = {}  # friend id -> [{user_id, online}]
+        for user_id, friend_ids in friends_of.items():
+            update = {'user_id': str(user_id), 'online': changes[str(user_id)]}
+            for friend_id in friend_ids:
+                updates.setdefault(str(friend_id), []).append(update)
+        for friend_id, batch in updates.items():
+            self._socketio.emit('presence', batch, to=friend_id)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'local_connections': len(self._sids),
+                'pending_changes': len(self._pending),
+            }
@@ -0,0 +1,143 @@
+# Cross-process pub/sub backends for Socket.IO fan-out between workers.
+
+import atexit
+import errno
+import json
+import os
+import socket
+import time
+import uuid
+from urllib.parse import urlparse
+
+import socketio
+
+# Largest datagram we read; chat payloads are far below this.
+MAX_DATAGRAM = 256 * 1024
+# Lost events are logged at most this often; the counters in stats() are exact.
+LOSS_LOG_INTERVAL = 1.0
+# The peer list is re-read when the directory changes, and at least this often
+# in case two workers started within the filesystem's timestamp granularity.
+PEER_RESCAN_INTERVAL = 1.0
+
+
+class LocalSocketManager(socketio.PubSubManager):
+    """
+    Broker-less Socket.IO client manager for workers on a single host.
+
+    Every worker binds a Unix datagram socket inside a shared directory, and
+    publishing sends the event to every socket found there (including the
+    sender's own, which is how PubSubManager delivers locally). Configure it
+    with a URL such as local:///tmp/chatsphere-pubsub. It needs no outside
+    services, so tests and single-host deployments can run several workers.
+    Multi-host deployments should use redis:// or amqp:// instead.
+
+    Sends never block: a worker whose receive queue is full (it has fallen
+    behind) loses that datagram instead of stalling every publisher. Events
+    too large for one datagram are not sent at all. Both losses are logged
+    and counted in stats(), which /api/metrics reports.
+    """
+    name = 'localsocket'
+
+    def __init__(self, url='local:///tmp/chatsphere-pubsub', channel='socketio',
+                 write_only=False, logger=None):
+        self.directory = os.path.join(urlparse(url).path or '/tmp/chatsphere-pubsub', channel)
+        os.makedirs(self.directory, exist_ok=True)
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sender.setblocking(False)
+        self._peers = []
+        self._peers_version = None
+        self._peers_scanned = 0.0
+        self.published = 0
+        self.dropped = 0
+        self.oversized = 0
+        self.last_lost = None
+        self._loss_logged = 0.0
+        self._receiver = None
+        self._path = None
+        if not write_only:
+            self._path = os.path.join(self.directory, f'{os.getpid()}-{uuid.uuid4().hex[:8]}.sock')
+            self._receiver = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._receiver.bind(self._path)
+            atexit.register(self.close)
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+
+    def close(self):
+        if self._receiver is not None:
+            self._receiver.close()
+            self._receiver = None
+        if self._path and os.path.exists(self._path):
+            os.unlink(self._path)
+
+    def _peer_paths(self):
+        """Worker sockets in the shared directory, re-listed only when the directory changes."""
+        version = os.stat(self.directory).st_mtime_ns
+        now = time.monotonic()
+        if version != self._peers_version or now - self._peers_scanned >= PEER_RESCAN_INTERVAL:
+            self._peers = [entry.path for entry in os.scandir(self.directory)]
+            self._peers_version = version
+            self._peers_scanned = now
+        return self._peers
+
+    def _publish(self, data):
+        payload = json.dumps(data).encode('utf-8')
+        self.published += 1
+        for path in self._peer_paths():
+            try:
+                self._sender.sendto(payload, path)
+            except BlockingIOError:
+                # The receiver's queue is full; drop rather than block every emit
+                self.dropped += 1
+                self._lost(data, 'worker queue full')
+            except ConnectionRefusedError:
+                # The worker that owned this socket has exited without cleaning up
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                if e.errno != errno.EMSGSIZE:
+                    raise
+                # Too big for any peer, so there is no point trying the rest
+                self.oversized += 1
+                self._lost(data, f'{len(payload)} bytes exceeds the datagram limit')
+                return
+
+    def _lost(self, data, reason):
+        self.last_lost = {'event': data.get('event'), 'room': data.get('room'), 'reason': reason,
+                          'at': time.time()}
+        now = time.monotonic()
+        if now - self._loss_logged >= LOSS_LOG_INTERVAL:
+            self._loss_logged = now
+            print(f"Socket.IO fan-out lost '{data.get('event')}' for room {data.get('room')}: {reason} "
+                  f"({self.dropped} dropped, {self.oversized} oversized so far)")
+
+    def stats(self):
+        return {
+            'peers': len(self._peers),
+            'published': self.published,
+            'dropped_datagrams': self.dropped,
+            'oversized': self.oversized,
+            'last_lost': self.last_lost,
+        }
+
+    def _listen(self):
+        while self._receiver is not None:
+            yield self._receiver.recv(MAX_DATAGRAM)
+
+
+def socketio_queue_options(config):
+    """
+    Builds the SocketIO.init_app keyword arguments for the configured backend.
+    SOCKETIO_MESSAGE_QUEUE may be empty (single process), a local:// path
+    (LocalSocketManager) or any URL python-socketio understands (redis://,
+    amqp://, kafka://, zmq+tcp://).
+    """
+    url = config.get('SOCKETIO_MESSAGE_QUEUE')
+    channel = config.get('SOCKETIO_CHANNEL', 'flask-socketio')
+    if not url:
+        return {}
+    if url.startswith('local://'):
+        return {'client_manager': LocalSocketManager(url, channel=channel)}
+    return {'message_queue': url, 'channel': channel}
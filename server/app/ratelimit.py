@@ -0,0 +1,137 @@
+# Token-bucket rate limiting for Socket.IO events and REST endpoints.
+
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import jsonify, request
+from flask_login import current_user
+
+# Atomic token bucket for the shared Redis backend. KEYS[1] = bucket key;
+# ARGV = rate (tokens/s), burst, now (s), cost. Returns 1 if allowed; a negative
+# cost refunds tokens, up to burst.
+REDIS_BUCKET_SCRIPT = """
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local rate, burst, now, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local tokens = tonumber(bucket[1]) or burst
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + (now - ts) * rate)
+local allowed = 0
+if tokens >= cost then
+    tokens = math.min(burst, tokens - cost)
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return allowed
+"""
+
+
+class MemoryBucketStore:
+    """
+    Per-process buckets, kept in least-recently-used order and capped at
+    max_keys. Once the table is full, idle buckets are swept and, if that is
+    not enough, the least recently used ones are evicted.
+    """
+    IDLE_SECONDS = 60
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> [tokens, last_refill], oldest first
+        self._lock = threading.Lock()
+
+    def consume(self, key, rate, burst, cost=1):
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    self._evict(now)
+                bucket = self._buckets[key] = [burst, now]
+            else:
+                self._buckets.move_to_end(key)
+            tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            allowed = tokens >= cost
+            bucket[0] = min(burst, tokens - cost) if allowed else tokens
+            bucket[1] = now
+            return allowed
+
+    def _evict(self, now):
+        # Every access moves a bucket to the end, so the front is both the least
+        # recently used and the longest idle. A bucket idle long enough to have
+        # refilled completely carries no state worth keeping.
+        while self._buckets:
+            key, bucket = next(iter(self._buckets.items()))
+            if len(self._buckets) < self.max_keys and now - bucket[1] < self.IDLE_SECONDS:
+                break
+            del self._buckets[key]
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class RedisBucketStore:
+    """Shared buckets for multi-worker deployments; one round trip per check."""
+    def __init__(self, url, prefix='ratelimit:'):
+        import redis
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+        self._script = self._client.register_script(REDIS_BUCKET_SCRIPT)
+
+    def consume(self, key, rate, burst, cost=1):
+        return bool(self._script(keys=[self.prefix + key], args=[rate, burst, time.time(), cost]))
+
+
+class RateLimiter:
+    """
+    Token buckets keyed by (rule, subject). Rules map a name such as
+    'send_message' to (tokens per second, burst). Checks never touch MongoDB,
+    so rejecting a flood is as cheap as a dict lookup.
+    """
+    def __init__(self):
+        self.enabled = True
+        self.rules = {}
+        self.rejected = 0
+        self._store = MemoryBucketStore()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.enabled = app.config.get('RATE_LIMIT_ENABLED', True)
+        self.rules = dict(app.config.get('RATE_LIMITS', {}))
+        url = app.config.get('RATE_LIMIT_STORAGE_URL')
+        self._store = RedisBucketStore(url) if url else MemoryBucketStore()
+
+    def allow(self, rule, subject, cost=1):
+        """Takes cost tokens from the (rule, subject) bucket; False if it is empty."""
+        if not self.enabled or rule not in self.rules:
+            return True
+        rate, burst = self.rules[rule]
+        allowed = self._store.consume(f"{rule}:{subject}", rate, burst, cost)
+        if not allowed:
+            with self._lock:
+                self.rejected += 1
+        return allowed
+
+    def refund(self, rule, subject, cost=1):
+        """Returns tokens taken by allow() for an action that was not carried out."""
+        if not self.enabled or rule not in self.rules:
+            return
+        rate, burst = self.rules[rule]
+        self._store.consume(f"{rule}:{subject}", rate, burst, -cost)
+
+    def limit(self, rule):
+        """Decorator for REST endpoints; keys on the logged-in user, else the client address."""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                subject = current_user.get_id() if current_user.is_authenticated else request.remote_addr
+                if not self.allow(rule, subject):
+                    response = jsonify({'error': 'Too many requests'})
+                    response.headers['Retry-After'] = '1'
+                    return response, 429
+                return view(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def stats(self):
+        return {'enabled': self.enabled, 'rejected': self.rejected}
@@ -0,0 +1,87 @@
+# In-memory membership sets for group chat rooms.
+
+import threading
+import time
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+
+
+def room_channel(room_id):
+    """Socket.IO room name for a group chat, kept apart from per-user rooms."""
+    return f"chatroom:{room_id}"
+
+
+def serialize_room_message(msg, sender_username=None):
+    """Wire format of a group chat message, shared by the REST history and both live transports."""
+    data = {
+        'id': str(msg['_id']),
+        'room_id': str(msg['room_id']),
+        'sender_id': str(msg['sender_id']),
+        'content': msg['content'],
+        'timestamp': msg['timestamp'].isoformat()
+    }
+    if sender_username is not None:
+        data['sender'] = {'id': str(msg['sender_id']), 'username': sender_username}
+    return data
+
+
+class RoomMembership:
+    """
+    Caches each chat room's members as a set of user id strings so a group
+    send is authorized with an O(1) lookup instead of a DB read. Entries are
+    loaded on first use and updated in place by create/invite on this
+    process. A negative answer on an entry older than recheck_after seconds
+    reloads it once, which picks up invites made on other workers; ttl
+    bounds how long any entry is trusted.
+    """
+    def __init__(self, ttl=300, recheck_after=5.0, maxsize=50000):
+        self.ttl = ttl
+        self.recheck_after = recheck_after
+        self.maxsize = maxsize
+        self._mongo = None
+        self._rooms = {}  # str(room_id) -> (loaded_at, set of str(user_id))
+        self._lock = threading.Lock()
+
+    def init_app(self, app, mongo):
+        self._mongo = mongo
+        self.ttl = app.config.get('ROOM_MEMBERSHIP_TTL', self.ttl)
+        self.recheck_after = app.config.get('ROOM_MEMBERSHIP_RECHECK', self.recheck_after)
+
+    def _load(self, room_id):
+        try:
+            room = self._mongo.db.chatrooms.find_one({'_id': ObjectId(room_id)}, {'members': 1})
+        except InvalidId:
+            room = None
+        members = {str(member) for member in room['members']} if room else set()
+        with self._lock:
+            if len(self._rooms) >= self.maxsize:
+                self._rooms.clear()
+            self._rooms[room_id] = (time.monotonic(), members)
+        return members
+
+    def is_member(self, room_id, user_id):
+        room_id, user_id = str(room_id), str(user_id)
+        with self._lock:
+            entry = self._rooms.get(room_id)
+        now = time.monotonic()
+        if entry is None or now - entry[0] > self.ttl:
+            return user_id in self._load(room_id)
+        if user_id in entry[1]:
+            return True
+        if now - entry[0] > self.recheck_after:
+            return user_id in self._load(room_id)
+        return False
+
+    def set_members(self, room_id, members):
+        with self._lock:
+            self._rooms[str(room_id)] = (time.monotonic(), {str(member) for member in members})
+
+    def add_members(self, room_id, user_ids):
+        with self._lock:
+            entry = self._rooms.get(str(room_id))
+            if entry is not None:
+                entry[1].update(str(user_id) for user_id in user_ids)
+
+    def stats(self):
+        with self._lock:
+            return {'rooms': len(self._rooms)}
@@ -1,13 +1,52 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_login import login_user, logout_user
-from app import mongo
+from app import mongo, username_index, password_hasher, limiter
+from app.hashing import HasherBusy
+from app.sync import conversation_digest
 from app.models import User
-import bcrypt
+from app.security import create_session_tokens, decode_session_token
 from bson.objectid import ObjectId
+from datetime import datetime, timezone
 
 bp = Blueprint('auth', __name__)
 
+
+def issue_tokens(user_id, username):
+    """Creates an access/refresh pair and records the refresh token's jti for rotation."""
+    tokens = create_session_tokens(str(user_id), username)
+    mongo.db.refresh_tokens.insert_one({
+        '_id': tokens['refresh_jti'],
+        'user_id': ObjectId(user_id),
+        'used': False,
+        'expires_at': tokens['refresh_expires_at']
+    })
+    return {
+        'access_token': tokens['access_token'],
+        'refresh_token': tokens['refresh_token'],
+        'token_type': 'bearer'
+    }
+
+
+def busy_response():
+    response = jsonify({'error': 'Server is busy, please try again shortly'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+
+def auth_response(message, user_id, username, status, **extra):
+    """Builds the login/register response, adding tokens when token mode is enabled."""
+    body = {
+        'message': message,
+        'user': { 'id': str(user_id), 'username': username, 'unique_id': str(user_id) },
+        **extra
+    }
+    if current_app.config.get('AUTH_TOKENS_ENABLED'):
+        body.update(issue_tokens(user_id, username))
+    return jsonify(body), status
+
+
 @bp.route('/register', methods=['POST'])
+@limiter.limit('auth')
 def register():
     data = request.get_json(force=True)
     username = data.get('username')
@@ -22,24 +61,94 @@ def register():
     if mongo.db.users.find_one({"email": email}):
         return jsonify({'error': 'Email already registered'}), 409
     
-    # Hash the password
-    hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    # Hash the password in the bounded hashing pool
+    try:
+        hashed_password = password_hasher.hash(password)
+    except HasherBusy:
+        return busy_response()
 
     # Insert the new user document into the 'users' collection
     user_id = mongo.db.users.insert_one({
         'username': username,
+        'username_lower': username.lower(),
         'email': email,
-        'password': hashed_password,
-        'friends': [] # Start with an empty list of friends
+        'password': hashed_password
     }).inserted_id
+    if username_index.ready:
+        username_index.add(user_id, username)
 
     # Log the user in immediately
     user_doc = mongo.db.users.find_one({"_id": user_id})
     user_obj = User(user_doc)
     login_user(user_obj, remember=True)
     
-    return jsonify({
-        'message': 'User registered successfully',
-        'user': { 'id': str(user_id), 'username': username, 'unique_id': str(user_id) }
-    }), 201
+    return auth_response('User registered successfully', user_id, username, 201)
+
+
+@bp.route('/login', methods=['POST'])
+@limiter.limit('auth')
+def login():
+    data = request.get_json(force=True)
+    username = data.get('username')
+    password = data.get('password')
+
+    if not all([username, password]):
+        return jsonify({'error': 'Missing required fields'}), 400
+
+    user_doc = mongo.db.users.find_one({"username": username})
+    try:
+        if not user_doc or not User(user_doc).check_password(password):
+            return jsonify({'error': 'Invalid username or password'}), 401
+
+        # Upgrade hashes created with an older work factor while we have the plain text
+        if password_hasher.needs_rehash(user_doc['password']):
+            mongo.db.users.update_one(
+                {'_id': user_doc['_id']},
+                {'$set': {'password': password_hasher.hash(password)}}
+            )
+    except HasherBusy:
+        return busy_response()
+
+    login_user(User(user_doc), remember=True)
+    # Newest message per conversation, so the client can sync only what it is missing
+    digest = conversation_digest(mongo.db, user_doc['_id'])
+    return auth_response('Logged in successfully', user_doc['_id'], user_doc['username'], 200,
+                         digest=digest)
+
+
+@bp.route('/refresh', methods=['POST'])
+def refresh():
+    """
+    Exchanges a refresh token for a new access/refresh pair. Each refresh
+    token is single-use: presenting one that was already rotated is treated
+    as theft and revokes every refresh token of that user.
+    """
+    data = request.get_json(force=True, silent=True) or {}
+    claims = decode_session_token(data.get('refresh_token', ''), token_type='refresh')
+    if not claims:
+        return jsonify({'error': 'Invalid refresh token'}), 401
+
+    record = mongo.db.refresh_tokens.find_one_and_update(
+        {'_id': claims['jti'], 'used': False},
+        {'$set': {'used': True, 'used_at': datetime.now(timezone.utc)}}
+    )
+    if not record:
+        mongo.db.refresh_tokens.delete_many({'user_id': ObjectId(claims['sub'])})
+        return jsonify({'error': 'Refresh token reuse detected; please log in again'}), 401
+
+    user_doc = mongo.db.users.find_one({'_id': record['user_id']}, {'username': 1})
+    if not user_doc:
+        return jsonify({'error': 'Invalid refresh token'}), 401
+    return jsonify(issue_tokens(user_doc['_id'], user_doc['username'])), 200
+
+
+@bp.route('/logout', methods=['POST'])
+def logout():
+    """Ends the cookie session and revokes the given refresh token, if any."""
+    data = request.get_json(force=True, silent=True) or {}
+    claims = decode_session_token(data.get('refresh_token', ''), token_type='refresh')
+    if claims:
+        mongo.db.refresh_tokens.delete_one({'_id': claims['jti']})
+    logout_user()
+    return jsonify({'message': 'Logged out successfully'}), 200
 
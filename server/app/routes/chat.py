@@ -1,80 +1,128 @@
-# API endpoints for creating and managing chat rooms.
-
-from fastapi import APIRouter, Depends, HTTPException, status, Request
-from typing import List
-from bson import ObjectId
-
-from models import ChatRoom, ChatRoomCreate, UserInDB
-from security import verify_token
-from database import AsyncIOMotorDatabase
-from .users import get_current_user # Import dependency from sibling router
-
-router = APIRouter()
-
-# --- Dependency to get DB instance ---
-def get_database(request: Request) -> AsyncIOMotorDatabase:
-    return request.app.db
-
-# --- Endpoints ---
-
-@router.post("/create", response_model=ChatRoom, status_code=status.HTTP_201_CREATED)
-async def create_chatroom(
-    chatroom_data: ChatRoomCreate,
-    current_user: UserInDB = Depends(get_current_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
-):
-    """
-    Creates a new private chatroom. The creator is automatically a member.
-    """
-    new_chatroom = ChatRoom(
-        name=chatroom_data.name,
-        created_by=current_user.id,
-        members=[current_user.id]
-    )
-    
-    created_room = await db.chatrooms.insert_one(new_chatroom.dict(exclude={"id"}))
-    
-    # Fetch the created room to return it with the generated ID
-    db_room = await db.chatrooms.find_one({"_id": created_room.inserted_id})
-    return ChatRoom(**db_room)
-
-
-@router.post("/{room_id}/invite", status_code=status.HTTP_200_OK)
-async def invite_to_chatroom(
-    room_id: str,
-    user_ids_to_invite: List[str],
-    current_user: UserInDB = Depends(get_current_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
-):
-    """
-    Invites users (from the current user's friends list) to a private chatroom.
-    """
+# API endpoints for creating and managing group chat rooms.
+
+from flask import Blueprint, request, jsonify
+from flask_login import login_required, current_user
+from pymongo import ReturnDocument
+from app import mongo, room_members
+from app.friendships import edges_ready
+from app.rooms import serialize_room_message
+from app.sync import encode_cursor, decode_cursor, keyset_branches
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+from datetime import datetime, timezone
+
+bp = Blueprint('chat', __name__)
+
+
+def serialize_room(room):
+    return {
+        'id': str(room['_id']),
+        'name': room['name'],
+        'created_by': str(room['created_by']),
+        'members': [str(member) for member in room['members']]
+    }
+
+
+@bp.route('/', methods=['GET'])
+@login_required
+def list_chatrooms():
+    """Returns the rooms the current user belongs to (multikey members index)."""
+    user_id = ObjectId(current_user.get_id())
+    rooms = mongo.db.chatrooms.find({'members': user_id}).sort('_id', 1)
+    return jsonify([serialize_room(room) for room in rooms])
+
+
+@bp.route('/create', methods=['POST'])
+@login_required
+def create_chatroom():
+    """Creates a new private chatroom. The creator is automatically a member."""
+    data = request.get_json(force=True, silent=True) or {}
+    name = (data.get('name') or '').strip()
+    if not name:
+        return jsonify({'error': 'Room name is required'}), 400
+
+    user_id = ObjectId(current_user.get_id())
+    room = {
+        'name': name,
+        'created_by': user_id,
+        'members': [user_id],
+        'created_at': datetime.now(timezone.utc)
+    }
+    room['_id'] = mongo.db.chatrooms.insert_one(room).inserted_id
+    room_members.set_members(room['_id'], room['members'])
+    return jsonify(serialize_room(room)), 201
+
+
+@bp.route('/<string:room_id>/invite', methods=['POST'])
+@login_required
+def invite_to_chatroom(room_id):
+    """Invites users (from the current user's friends list) to a private chatroom."""
+    user_ids_to_invite = request.get_json(force=True, silent=True) or []
     try:
         room_obj_id = ObjectId(room_id)
-        user_obj_ids = [ObjectId(uid) for uid in user_ids_to_invite]
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid Room or User ID format")
-
-    # Verify the chatroom exists and the current user is a member
-    chatroom = await db.chatrooms.find_one({"_id": room_obj_id})
-    if not chatroom or current_user.id not in chatroom["members"]:
-        raise HTTPException(status_code=403, detail="Not authorized to invite users to this room")
-
-    # Verify that the users to be invited are friends with the current user
-    for user_id in user_obj_ids:
-        if user_id not in current_user.friends:
-            raise HTTPException(
-                status_code=403, 
-                detail=f"User with ID {user_id} is not in your friends list."
-            )
-
-    # Add new members to the chatroom
-    result = await db.chatrooms.update_one(
-        {"_id": room_obj_id},
-        {"$addToSet": {"members": {"$each": user_obj_ids}}}
+        user_obj_ids = {ObjectId(uid) for uid in user_ids_to_invite}
+    except (InvalidId, TypeError):
+        return jsonify({'error': 'Invalid Room or User ID format'}), 400
+
+    user_id = ObjectId(current_user.get_id())
+    if not room_members.is_member(room_obj_id, user_id):
+        return jsonify({'error': 'Not authorized to invite users to this room'}), 403
+    if not user_obj_ids:
+        return jsonify({'message': 'No users to invite.'}), 200
+
+    # Friends among the invitees in one query, then a set difference
+    if edges_ready(mongo.db):
+        friends = {edge['friend_id'] for edge in mongo.db.friendships.find(
+            {'user_id': user_id, 'friend_id': {'$in': list(user_obj_ids)}}, {'friend_id': 1})}
+    else:
+        user_doc = mongo.db.users.find_one({'_id': user_id}, {'friends': 1}) or {}
+        friends = set(user_doc.get('friends', [])) & user_obj_ids
+    not_friends = user_obj_ids - friends
+    if not_friends:
+        return jsonify({
+            'error': 'Some users are not in your friends list.',
+            'user_ids': sorted(str(uid) for uid in not_friends)
+        }), 403
+
+    # Add new members to the chatroom. modified_count is per document, so the
+    # members actually added are read from the pre-update member list instead.
+    before = mongo.db.chatrooms.find_one_and_update(
+        {'_id': room_obj_id},
+        {'$addToSet': {'members': {'$each': list(user_obj_ids)}}},
+        projection={'members': 1},
+        return_document=ReturnDocument.BEFORE
     )
+    if before is None:
+        return jsonify({'error': 'Chatroom not found'}), 404
+    room_members.add_members(room_obj_id, user_obj_ids)
+
+    added = user_obj_ids - set(before.get('members', []))
+    if not added:
+        return jsonify({'message': 'Users were already members or no new users were invited.'}), 200
+    return jsonify({'message': f'Successfully invited {len(added)} member(s).'}), 200
+
+
+@bp.route('/<string:room_id>/messages')
+@login_required
+def get_room_messages(room_id):
+    """Returns a page of a room's messages, oldest first; ?before=<cursor> pages back."""
+    user_id = current_user.get_id()
+    if not room_members.is_member(room_id, user_id):
+        return jsonify({'error': 'Not a member of this room'}), 403
+
+    branches = [{'room_id': ObjectId(room_id)}]
+    before = request.args.get('before')
+    if before:
+        try:
+            branches = keyset_branches(branches, *decode_cursor(before), '$lt')
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    limit = max(1, min(request.args.get('limit', 50, type=int), 200))
+    messages = list(mongo.db.messages.find({'$or': branches})
+                    .sort([('timestamp', -1), ('_id', -1)]).limit(limit))
+    messages.reverse()
 
-    if result.modified_count == 0:
-        return {"message": "Users were already members or no new users were invited."}
-        
-    return {"message": f"Successfully invited {result.modified_count} new member(s)."}
+    response = jsonify([serialize_room_message(msg) for msg in messages])
+    if messages:
+        response.headers['X-Prev-Cursor'] = encode_cursor(messages[0])
+    return response
@@ -1,54 +1,159 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_login import login_required, current_user
-from app import mongo
+from app import mongo, user_cache, username_index, limiter, presence, notifications
+from app.migrations import is_complete, USERNAME_LOWER_BACKFILL
+from app.friendships import (edges_ready, add_friendship, remove_friendship, are_friends, list_friend_ids,
+                             friends_among)
 from bson.objectid import ObjectId
+from bson.errors import InvalidId
+import re
 
 bp = Blueprint('friends', __name__)
 
+
+def prefix_range(prefix):
+    """Returns a {$gte, $lt} range matching every string that starts with prefix."""
+    last = prefix[-1]
+    if ord(last) == 0x10FFFF:
+        return {'$gte': prefix}
+    return {'$gte': prefix, '$lt': prefix[:-1] + chr(ord(last) + 1)}
+
+
+def is_friend(user_id, other_id):
+    """Friendship check against the edge collection, or the embedded array until it is migrated."""
+    if edges_ready(mongo.db):
+        return are_friends(mongo.db, user_id, other_id)
+    return mongo.db.users.find_one({'_id': user_id, 'friends': other_id}, {'_id': 1}) is not None
+
+
+def between(user_a, user_b):
+    """Matches friend requests sent in either direction between two users."""
+    return {'$or': [
+        {'from_user_id': user_a, 'to_user_id': user_b},
+        {'from_user_id': user_b, 'to_user_id': user_a}
+    ]}
+
+
 @bp.route('/list')
 @login_required
 def get_friends():
-    """Returns the current user's list of friends using MongoDB."""
+    """
+    Returns the current user's friends, ordered by id. Large lists are paged:
+    pass ?after=<unique_id> from the X-Next-Cursor header; ?limit sets the page size.
+    """
     user_id = ObjectId(current_user.get_id())
-    
-    # MongoDB Aggregation Pipeline to find friends and get their details
-    pipeline = [
-        # 1. Start with the current user
-        {'$match': {'_id': user_id}},
-        # 2. Deconstruct the 'friends' array
-        {'$unwind': '$friends'},
-        # 3. "Join" with the users collection to get friend details
-        {'$lookup': {
-            'from': 'users',
-            'localField': 'friends',
-            'foreignField': '_id',
-            'as': 'friend_details'
-        }},
-        # 4. Deconstruct the resulting friend_details array
-        {'$unwind': '$friend_details'},
-        # 5. Format the output
-        {'$project': {
-            '_id': 0,
-            'username': '$friend_details.username',
-            'unique_id': {'$toString': '$friend_details._id'}
-        }}
-    ]
-    friends_list = list(mongo.db.users.aggregate(pipeline))
-    return jsonify(friends_list)
+    default = current_app.config.get('FRIENDS_PAGE_SIZE', 500)
+    maximum = current_app.config.get('FRIENDS_PAGE_SIZE_MAX', 1000)
+    limit = max(1, min(request.args.get('limit', default, type=int), maximum))
+    after = request.args.get('after')
+    try:
+        after = ObjectId(after) if after else None
+    except InvalidId:
+        return jsonify({'error': f'Invalid cursor: {after}'}), 400
+
+    if edges_ready(mongo.db):
+        friend_ids = list_friend_ids(mongo.db, user_id, after=after, limit=limit)
+    else:
+        # Until the edge migration finishes, read the embedded array
+        user_doc = mongo.db.users.find_one({'_id': user_id}, {'friends': 1}) or {}
+        friend_ids = sorted(f for f in user_doc.get('friends', []) if after is None or f > after)[:limit]
+
+    # Friend profiles come from the user cache; misses are fetched with one $in query
+    profiles = user_cache.get_many(friend_ids)
+    friends_list = [{
+        'username': profiles[str(friend_id)]['username'],
+        'unique_id': str(friend_id)
+    } for friend_id in friend_ids if str(friend_id) in profiles]
+
+    response = jsonify(friends_list)
+    if len(friend_ids) == limit:
+        response.headers['X-Next-Cursor'] = str(friend_ids[-1])
+    return response
+
+
+@bp.route('/online', methods=['GET', 'POST'])
+@login_required
+def get_online_friends():
+    """
+    Returns which of the user's friends are online. POST {"user_ids": [...]}
+    checks a given set (at most FRIENDS_PAGE_SIZE_MAX; ids that are not
+    friends are ignored); GET checks all of the user's friends.
+    """
+    maximum = current_app.config.get('FRIENDS_PAGE_SIZE_MAX', 1000)
+    user_id = ObjectId(current_user.get_id())
+    if request.method == 'POST':
+        user_ids = (request.get_json(force=True, silent=True) or {}).get('user_ids') or []
+        if not isinstance(user_ids, list) or len(user_ids) > maximum:
+            return jsonify({'error': f'user_ids must be a list of at most {maximum} ids'}), 400
+        try:
+            candidates = {ObjectId(candidate) for candidate in user_ids}
+        except (InvalidId, TypeError):
+            return jsonify({'error': 'user_ids must be user ids'}), 400
+        # Presence is only disclosed for friends
+        user_ids = friends_among(mongo.db, user_id, candidates)
+    else:
+        if edges_ready(mongo.db):
+            user_ids = list_friend_ids(mongo.db, user_id, limit=maximum)
+        else:
+            user_doc = mongo.db.users.find_one({'_id': user_id}, {'friends': 1}) or {}
+            user_ids = user_doc.get('friends', [])[:maximum]
+    return jsonify({'online': sorted(presence.online(user_ids))})
+
+
+@bp.route('/check/<string:user_unique_id>')
+@login_required
+def check_friendship(user_unique_id):
+    """Returns whether the current user is friends with another user."""
+    user_id = ObjectId(current_user.get_id())
+    other_id = ObjectId(user_unique_id)
+    return jsonify({'unique_id': user_unique_id, 'is_friend': is_friend(user_id, other_id)})
+
+
+@bp.route('/<string:user_unique_id>', methods=['DELETE'])
+@login_required
+def remove_friend(user_unique_id):
+    """Removes a friendship in both directions."""
+    user_id = ObjectId(current_user.get_id())
+    other_id = ObjectId(user_unique_id)
+    remove_friendship(mongo.db, user_id, other_id)
+    # The accepted request is history now; leaving it would block a new request between the pair
+    mongo.db.friend_requests.delete_many(between(user_id, other_id))
+    if not edges_ready(mongo.db):
+        mongo.db.users.update_one({'_id': user_id}, {'$pull': {'friends': other_id}})
+        mongo.db.users.update_one({'_id': other_id}, {'$pull': {'friends': user_id}})
+        user_cache.invalidate(user_id, other_id)
+    return jsonify({'message': 'Friend removed'}), 200
 
 
 @bp.route('/pending')
 @login_required
 def get_pending_requests():
-    """Returns pending friend requests for the current user."""
+    """
+    Returns pending friend requests for the current user, oldest first.
+    Pages are keyed on the request id: pass ?after=<request_id> from the
+    X-Next-Cursor header to fetch the next page; ?limit sets the page size.
+    """
     user_id = ObjectId(current_user.get_id())
-    
-    # Find requests where the current user is the recipient
-    requests = mongo.db.friend_requests.find({'to_user_id': user_id, 'status': 'pending'})
-    
+    default = current_app.config.get('PENDING_PAGE_SIZE', 50)
+    maximum = current_app.config.get('PENDING_PAGE_SIZE_MAX', 500)
+    limit = max(1, min(request.args.get('limit', default, type=int), maximum))
+
+    # Find requests where the current user is the recipient; served by the (to_user_id, status, _id) index
+    query = {'to_user_id': user_id, 'status': 'pending'}
+    after = request.args.get('after')
+    if after:
+        try:
+            query['_id'] = {'$gt': ObjectId(after)}
+        except InvalidId:
+            return jsonify({'error': f'Invalid cursor: {after}'}), 400
+    requests = list(mongo.db.friend_requests.find(query, {'from_user_id': 1}).sort('_id', 1).limit(limit))
+
+    # All senders resolved in one batch: cache hits plus a single $in for the misses
+    senders = user_cache.get_many(req['from_user_id'] for req in requests)
+
     pending_list = []
     for req in requests:
-        from_user = mongo.db.users.find_one({'_id': req['from_user_id']})
+        from_user = senders.get(str(req['from_user_id']))
         if from_user:
             pending_list.append({
                 'request_id': str(req['_id']),
@@ -57,7 +162,11 @@ def get_pending_requests():
                     'unique_id': str(from_user['_id'])
                 }
             })
-    return jsonify(pending_list)
+
+    response = jsonify(pending_list)
+    if len(requests) == limit:
+        response.headers['X-Next-Cursor'] = str(requests[-1]['_id'])
+    return response
 
 
 @bp.route('/send_request/<string:user_unique_id>', methods=['POST'])
@@ -70,20 +179,21 @@ def send_friend_request(user_unique_id):
     if from_user_id == to_user_id:
         return jsonify({'error': 'You cannot send a friend request to yourself'}), 400
 
-    # Check if a request already exists or if they are already friends
-    if mongo.db.friend_requests.find_one({
-        '$or': [
-            {'from_user_id': from_user_id, 'to_user_id': to_user_id},
-            {'from_user_id': to_user_id, 'to_user_id': from_user_id}
-        ]
-    }):
+    # Check if a request is already pending or if they are already friends
+    if mongo.db.friend_requests.find_one({**between(from_user_id, to_user_id), 'status': 'pending'}) \
+            or is_friend(from_user_id, to_user_id):
         return jsonify({'error': 'A friend request is already pending or you are already friends'}), 409
 
     # Create a new friend request document
-    mongo.db.friend_requests.insert_one({
+    request_id = mongo.db.friend_requests.insert_one({
         'from_user_id': from_user_id,
         'to_user_id': to_user_id,
         'status': 'pending'
+    }).inserted_id
+
+    notifications.notify(to_user_id, 'friend_request', {
+        'request_id': str(request_id),
+        'from_user': {'username': current_user.username, 'unique_id': str(from_user_id)}
     })
 
     return jsonify({'message': 'Friend request sent successfully'}), 201
@@ -97,7 +207,9 @@ def respond_to_request(request_id):
     req_obj_id = ObjectId(request_id)
     user_id = ObjectId(current_user.get_id())
 
-    friend_request = mongo.db.friend_requests.find_one({'_id': req_obj_id, 'to_user_id': user_id})
+    friend_request = mongo.db.friend_requests.find_one(
+        {'_id': req_obj_id, 'to_user_id': user_id, 'status': 'pending'}
+    )
 
     if not friend_request:
         return jsonify({'error': 'Invalid request'}), 404
@@ -109,8 +221,17 @@ def respond_to_request(request_id):
         # Add each user to the other's friends list
         from_user_id = friend_request['from_user_id']
         to_user_id = friend_request['to_user_id']
-        mongo.db.users.update_one({'_id': from_user_id}, {'$addToSet': {'friends': to_user_id}})
-        mongo.db.users.update_one({'_id': to_user_id}, {'$addToSet': {'friends': from_user_id}})
+        add_friendship(mongo.db, from_user_id, to_user_id)
+        if not edges_ready(mongo.db):
+            # Dual-write the embedded arrays until the edge migration has finished
+            mongo.db.users.update_one({'_id': from_user_id}, {'$addToSet': {'friends': to_user_id}})
+            mongo.db.users.update_one({'_id': to_user_id}, {'$addToSet': {'friends': from_user_id}})
+            user_cache.invalidate(from_user_id, to_user_id)
+
+        notifications.notify(from_user_id, 'friend_request_accepted', {
+            'request_id': request_id,
+            'friend': {'username': current_user.username, 'unique_id': str(to_user_id)}
+        })
         
         return jsonify({'message': 'Friend request accepted'}), 200
     else:
@@ -119,8 +240,21 @@ def respond_to_request(request_id):
         return jsonify({'message': 'Friend request declined'}), 200
 
 
+@bp.route('/notifications/ack', methods=['POST'])
+@login_required
+def ack_notifications():
+    """Acknowledges delivered notifications in bulk: {"ids": [...]}."""
+    ids = (request.get_json(force=True, silent=True) or {}).get('ids') or []
+    try:
+        removed = notifications.ack(current_user.get_id(), ids)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'acknowledged': removed}), 200
+
+
 @bp.route('/search')
 @login_required
+@limiter.limit('search_users')
 def search_users():
     """Searches for users by username."""
     query = request.args.get('username', '')
@@ -128,12 +262,24 @@ def search_users():
         return jsonify([]), 200
     
     current_user_id = ObjectId(current_user.get_id())
+
+    # Served from the in-memory typeahead index when it is loaded
+    if username_index.ready:
+        return jsonify(username_index.search(query, limit=10, exclude_id=current_user_id))
     
     # Find users whose username starts with the query, case-insensitive, and is not the current user
-    users_cursor = mongo.db.users.find({
-        'username': {'$regex': f'^{query}', '$options': 'i'},
-        '_id': {'$ne': current_user_id}
-    }).limit(10)
+    if is_complete(mongo.db, USERNAME_LOWER_BACKFILL):
+        # Index range scan over username_lower
+        users_cursor = mongo.db.users.find({
+            'username_lower': prefix_range(query.lower()),
+            '_id': {'$ne': current_user_id}
+        }, {'username': 1}).sort('username_lower', 1).limit(10)
+    else:
+        # Until the backfill finishes, fall back to an escaped regex
+        users_cursor = mongo.db.users.find({
+            'username': {'$regex': f'^{re.escape(query)}', '$options': 'i'},
+            '_id': {'$ne': current_user_id}
+        }, {'username': 1}).limit(10)
     
     user_list = [{
         'unique_id': str(user['_id']),
@@ -1,54 +1,138 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, request, current_app
 from flask_login import login_required, current_user
-from app import mongo
+from app import mongo, user_cache, global_history
+from app.history import serialize_global_message
+from app.sync import (encode_cursor, decode_cursor, keyset_branches, conversation_branches,
+                      serialize_private_message, resolve_positions, messages_since,
+                      global_since, conversation_digest)
 from bson.objectid import ObjectId
+from bson.errors import InvalidId
 
 bp = Blueprint('messages', __name__)
 
+
+def page_size():
+    default = current_app.config.get('MESSAGE_PAGE_SIZE', 50)
+    maximum = current_app.config.get('MESSAGE_PAGE_SIZE_MAX', 200)
+    limit = request.args.get('limit', default, type=int)
+    return max(1, min(limit, maximum))
+
+
 @bp.route('/global')
 @login_required
 def get_global_message_history():
-    """Fetches the global message history from MongoDB."""
-    messages_cursor = mongo.db.messages.find({'is_global': True}).sort('timestamp', 1).limit(100)
-    
-    message_list = []
-    for msg in messages_cursor:
-        sender = mongo.db.users.find_one({'_id': msg['sender_id']})
-        if sender:
-            message_list.append({
-                "id": str(msg['_id']),
-                "content": msg['content'],
-                "timestamp": msg['timestamp'].isoformat(),
-                "is_global": True,
-                "sender": {
-                    "id": str(sender['_id']),
-                    "username": sender['username']
-                }
-            })
+    """Returns the most recent global messages, oldest first."""
+    if global_history.ready:
+        return jsonify(global_history.recent())
+
+    messages = list(mongo.db.messages.find({'is_global': True})
+                    .sort([('timestamp', -1), ('_id', -1)]).limit(100))
+    messages.reverse()
+
+    # Resolve every distinct sender through the user cache; misses cost a single $in query
+    senders = user_cache.get_many(msg['sender_id'] for msg in messages)
+
+    message_list = [
+        serialize_global_message(msg, senders[str(msg['sender_id'])])
+        for msg in messages if str(msg['sender_id']) in senders
+    ]
     return jsonify(message_list)
 
+@bp.route('/sync', methods=['POST'])
+@login_required
+def sync_messages():
+    """
+    Delta sync for reconnecting clients. The body names the last message the
+    client has seen per conversation and for the global room:
+
+        {"global": "<message id or cursor>",
+         "conversations": {"<friend unique_id>": "<message id or cursor>", ...}}
+
+    Only newer messages are returned, in one response, capped per
+    conversation; has_more tells the client to page with the history
+    endpoint. A null marker returns the latest page.
+    """
+    data = request.get_json(force=True, silent=True) or {}
+    conversations = data.get('conversations') or {}
+    limit = page_size()
+    max_conversations = current_app.config.get('SYNC_MAX_CONVERSATIONS', 100)
+    if not isinstance(conversations, dict) or len(conversations) > max_conversations:
+        return jsonify({'error': f'conversations must be an object with at most {max_conversations} entries'}), 400
+
+    user_id = ObjectId(current_user.get_id())
+    last_seen = {f'dm:{friend}': marker for friend, marker in conversations.items()}
+    if 'global' in data:
+        last_seen['global'] = data.get('global')
+    try:
+        friend_ids = {friend: ObjectId(friend) for friend in conversations}
+        positions = resolve_positions(mongo.db, last_seen)
+    except (ValueError, InvalidId) as e:
+        return jsonify({'error': str(e)}), 400
+
+    result = {'conversations': {}}
+    for friend, friend_id in friend_ids.items():
+        branches = conversation_branches(mongo.db, user_id, friend_id)
+        docs, has_more = messages_since(mongo.db, branches, positions[f'dm:{friend}'], limit)
+        if docs or has_more:
+            result['conversations'][friend] = {
+                'messages': [serialize_private_message(doc) for doc in docs],
+                'has_more': has_more
+            }
+    if 'global' in last_seen:
+        messages, has_more = global_since(mongo.db, global_history, user_cache, positions['global'], limit)
+        result['global'] = {'messages': messages, 'has_more': has_more}
+    return jsonify(result)
+
+
+@bp.route('/digest')
+@login_required
+def get_digest():
+    """Newest message id and timestamp for each of the current user's conversations."""
+    user_id = ObjectId(current_user.get_id())
+    latest_global = global_history.recent()[-1:] if global_history.ready else []
+    return jsonify({
+        'conversations': conversation_digest(mongo.db, user_id),
+        'global_last_message_id': latest_global[0]['id'] if latest_global else None
+    })
+
 @bp.route('/<string:friend_unique_id>')
 @login_required
 def get_message_history(friend_unique_id):
-    """Fetches private message history with a specific friend."""
+    """
+    Fetches one page of private message history with a specific friend.
+
+    Without a cursor the newest page is returned. Pass ?before=<cursor> for
+    older messages or ?after=<cursor> for newer ones; ?limit sets the page size.
+    Messages are always returned oldest first, and the cursors for the
+    adjacent pages are sent in the X-Prev-Cursor / X-Next-Cursor headers.
+    """
     user_id = ObjectId(current_user.get_id())
     friend_id = ObjectId(friend_unique_id)
+    before = request.args.get('before')
+    after = request.args.get('after')
+    limit = page_size()
+
+    branches = conversation_branches(mongo.db, user_id, friend_id)
+    try:
+        if after:
+            branches = keyset_branches(branches, *decode_cursor(after), '$gt')
+        elif before:
+            branches = keyset_branches(branches, *decode_cursor(before), '$lt')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-    # Find messages between the two users
-    messages_cursor = mongo.db.messages.find({
+    direction = 1 if after else -1
+    messages = list(mongo.db.messages.find({
         'is_global': False,
-        '$or': [
-            {'sender_id': user_id, 'recipient_id': friend_id},
-            {'sender_id': friend_id, 'recipient_id': user_id}
-        ]
-    }).sort('timestamp', 1)
-
-    message_list = [{
-        "id": str(msg['_id']),
-        "sender_id": str(msg['sender_id']),
-        "recipient_id": str(msg['recipient_id']),
-        "content": msg['content'],
-        "timestamp": msg['timestamp'].isoformat()
-    } for msg in messages_cursor]
-
-    return jsonify(message_list)
\ No newline at end of file
+        '$or': branches
+    }).sort([('timestamp', direction), ('_id', direction)]).limit(limit))
+    if direction == -1:
+        messages.reverse()
+
+    message_list = [serialize_private_message(msg) for msg in messages]
+
+    response = jsonify(message_list)
+    if messages:
+        response.headers['X-Prev-Cursor'] = encode_cursor(messages[0])
+        response.headers['X-Next-Cursor'] = encode_cursor(messages[-1])
+    return response
@@ -0,0 +1,45 @@
+import hmac
+from flask import Blueprint, jsonify, request, current_app, abort
+from app import socketio, user_cache, message_writer, username_index, limiter, global_history, room_members, presence, notifications, mongo_metrics
+from app.indexes import missing_indexes
+
+bp = Blueprint('metrics', __name__)
+
+@bp.before_request
+def require_metrics_token():
+    """
+    Metrics are only served to callers presenting METRICS_TOKEN in the
+    X-Metrics-Token header; without a configured token the endpoints do not exist.
+    """
+    expected = current_app.config.get('METRICS_TOKEN', '')
+    if not expected:
+        abort(404)
+    if not hmac.compare_digest(request.headers.get('X-Metrics-Token', ''), expected):
+        return jsonify({'error': 'Unauthorized access'}), 401
+
+def socketio_queue_stats():
+    """Counters of the cross-process client manager, when it keeps any."""
+    manager = getattr(socketio.server, 'manager', None)
+    return manager.stats() if hasattr(manager, 'stats') else None
+
+@bp.route('/')
+def get_metrics():
+    """Returns in-process counters used to size caches and spot bottlenecks."""
+    return jsonify({
+        'user_cache': user_cache.stats(),
+        'message_writer': message_writer.stats(),
+        'typeahead': username_index.stats(),
+        'rate_limiter': limiter.stats(),
+        'global_history': global_history.stats(),
+        'room_membership': room_members.stats(),
+        'presence': presence.stats(),
+        'notifications': notifications.stats(),
+        'mongo': mongo_metrics.stats(),
+        'socketio_queue': socketio_queue_stats(),
+        'missing_indexes': list(missing_indexes)
+    })
+
+@bp.route('/mongo')
+def get_mongo_metrics():
+    """Driver-level pool and command latency metrics, cheap enough to poll on their own."""
+    return jsonify(mongo_metrics.stats())
@@ -1,13 +1,12 @@
 from flask import Blueprint, jsonify
-from app import mongo
-from bson.objectid import ObjectId
+from app import user_cache
 
 bp = Blueprint('users', __name__)
 
 @bp.route('/<string:username>')
 def get_user_profile(username):
-    # Use mongo.db.users.find_one() instead of the old SQL query
-    user_doc = mongo.db.users.find_one({"username": username})
+    # Served from the in-process user cache; only misses reach MongoDB
+    user_doc = user_cache.get_by_username(username)
     
     if not user_doc:
         return jsonify({"error": "User not found"}), 404
@@ -1,6 +1,7 @@
 # Handles password hashing, JWT creation, and token verification.
 
 import os
+import uuid
 from datetime import datetime, timedelta
 from typing import Optional
 from passlib.context import CryptContext
@@ -13,6 +14,7 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "a_super_secret_key_that_should_be_in_env")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "14"))
 
 # --- Password Hashing ---
 # Use bcrypt for hashing passwords
@@ -68,4 +70,78 @@ def verify_token(token: str, credentials_exception) -> Optional[dict]:
             raise credentials_exception
         return payload
     except JWTError:
-        raise credentials_exception
\ No newline at end of file
+        raise credentials_exception
+
+# --- Stateless session tokens for the Flask app ---
+# Signed with the Flask app's SECRET_KEY; None while token mode is disabled,
+# in which case no token is issued or accepted anywhere.
+_session_key: Optional[str] = None
+
+# Fallback secrets that ship in this repository and must never sign tokens.
+INSECURE_SECRET_KEYS = {"", "dev_key", "a_super_secret_key_that_should_be_in_env"}
+
+def init_session_tokens(app) -> None:
+    """
+    Enables session tokens when AUTH_TOKENS_ENABLED is set, signing them with
+    app.config['SECRET_KEY']. Refuses to start with a default or empty secret,
+    since anyone could then forge a token for any user.
+    """
+    global _session_key
+    if not app.config.get("AUTH_TOKENS_ENABLED"):
+        _session_key = None
+        return
+    secret = app.config.get("SECRET_KEY") or ""
+    if secret in INSECURE_SECRET_KEYS:
+        raise RuntimeError("AUTH_TOKENS_ENABLED requires SECRET_KEY to be set to a private value")
+    _session_key = secret
+
+def session_tokens_enabled() -> bool:
+    return _session_key is not None
+
+def create_session_tokens(user_id: str, username: str) -> dict:
+    """
+    Issues an access/refresh token pair for a user. The access token carries
+    the user id (sub) and username, so verifying it needs no database read.
+    The refresh token carries a unique jti that the caller must record so
+    it can be rotated and revoked.
+
+    Returns:
+        dict: access_token, refresh_token, refresh_jti and refresh_expires_at.
+    """
+    if _session_key is None:
+        raise RuntimeError("Session tokens are disabled")
+    access_token = jwt.encode(
+        {"sub": user_id, "username": username, "type": "access",
+         "exp": datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)},
+        _session_key, algorithm=ALGORITHM
+    )
+    refresh_jti = uuid.uuid4().hex
+    refresh_expires_at = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    refresh_token = jwt.encode(
+        {"sub": user_id, "type": "refresh", "jti": refresh_jti, "exp": refresh_expires_at},
+        _session_key, algorithm=ALGORITHM
+    )
+    return {
+        "access_token": access_token,
+        "refresh_token": refresh_token,
+        "refresh_jti": refresh_jti,
+        "refresh_expires_at": refresh_expires_at,
+    }
+
+def decode_session_token(token: str, token_type: str = "access") -> Optional[dict]:
+    """
+    Verifies a token issued by create_session_tokens.
+
+    Returns:
+        Optional[dict]: The claims if token mode is enabled and the signature,
+        expiry and type are valid, otherwise None.
+    """
+    if _session_key is None:
+        return None
+    try:
+        payload = jwt.decode(token, _session_key, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    if payload.get("type") != token_type or not payload.get("sub"):
+        return None
+    return payload
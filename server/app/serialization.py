@@ -0,0 +1,25 @@
+# Fast JSON encoding shared by Socket.IO and the WebSocket managers.
+# Passed to python-socketio as its json module, so it mirrors json.dumps/json.loads.
+
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the standard library
+    orjson = None
+
+
+def dumps(obj, **kwargs):
+    """Encodes obj to a JSON str, using orjson when available."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj).decode('utf-8')
+        except TypeError:
+            pass  # e.g. non-str dict keys; let the stdlib handle or reject it
+    return json.dumps(obj, separators=(',', ':'), **kwargs)
+
+
+def loads(data, **kwargs):
+    if orjson is not None and not kwargs:
+        return orjson.loads(data)
+    return json.loads(data, **kwargs)
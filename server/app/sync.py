@@ -0,0 +1,178 @@
+# Cursor helpers and the delta-sync / digest queries for message history.
+
+from datetime import datetime, timezone
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+from app.friendships import edges_ready, list_friend_ids
+from app.history import serialize_global_message
+from app.migrations import is_complete, CONVERSATION_BACKFILL
+from app.models import conversation_id
+
+
+def encode_cursor(msg):
+    """Encodes a message's (timestamp, _id) sort key as an opaque cursor string."""
+    timestamp = msg['timestamp']
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return f"{int(timestamp.timestamp() * 1000)}_{msg['_id']}"
+
+
+def decode_cursor(cursor):
+    """Decodes a cursor into (timestamp, ObjectId); raises ValueError if malformed."""
+    try:
+        millis, object_id = cursor.split('_', 1)
+        timestamp = datetime.fromtimestamp(int(millis) / 1000, tz=timezone.utc)
+        return timestamp, ObjectId(object_id)
+    except (ValueError, InvalidId):
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
+def keyset_branches(branches, timestamp, object_id, op):
+    """
+    Expands each $or branch into two so that every branch stays a plain range
+    scan on (..., timestamp, _id): strictly past the timestamp, or on it with a
+    tie-breaking _id.
+    """
+    expanded = []
+    for branch in branches:
+        expanded.append({**branch, 'timestamp': {op: timestamp}})
+        expanded.append({**branch, 'timestamp': timestamp, '_id': {op: object_id}})
+    return expanded
+
+
+def conversation_branches(db, user_id, friend_id):
+    """$or branches selecting the direct messages between two users."""
+    return direct_branches(user_id, friend_id, is_complete(db, CONVERSATION_BACKFILL))
+
+
+def direct_branches(user_id, friend_id, backfilled):
+    """conversation_branches once the backfill state is known (main.py reads it through Motor)."""
+    if backfilled:
+        # Every DM carries conversation_id: one seek on the (conversation_id, timestamp) index
+        return [{'conversation_id': conversation_id(user_id, friend_id)}]
+    # Until the backfill finishes, fall back to the (sender, recipient, timestamp) index
+    return [
+        {'sender_id': user_id, 'recipient_id': friend_id},
+        {'sender_id': friend_id, 'recipient_id': user_id}
+    ]
+
+
+def serialize_private_message(msg):
+    return {
+        "id": str(msg['_id']),
+        "sender_id": str(msg['sender_id']),
+        "recipient_id": str(msg['recipient_id']),
+        "content": msg['content'],
+        "timestamp": msg['timestamp'].isoformat()
+    }
+
+
+def resolve_positions(db, last_seen):
+    """
+    Maps each last-seen marker (a message id or a history cursor) to its
+    (timestamp, _id) sort key. Plain ids are resolved with one $in query.
+    Unknown ids map to None, meaning "send the latest page".
+    """
+    positions, lookups = {}, {}
+    for key, marker in last_seen.items():
+        if not marker:
+            positions[key] = None
+        elif not isinstance(marker, str):
+            raise ValueError(f"Invalid marker: {marker!r}")
+        elif '_' in marker:
+            positions[key] = decode_cursor(marker)
+        else:
+            try:
+                lookups[key] = ObjectId(marker)
+            except InvalidId:
+                raise ValueError(f"Invalid message id: {marker}")
+    if lookups:
+        docs = db.messages.find({'_id': {'$in': list(lookups.values())}}, {'timestamp': 1})
+        found = {doc['_id']: (doc['timestamp'], doc['_id']) for doc in docs}
+        for key, message_id in lookups.items():
+            positions[key] = found.get(message_id)
+    return positions
+
+
+def messages_since(db, branches, position, limit):
+    """
+    Messages matching branches strictly after position, oldest first. Without
+    a position the newest page is returned. The boolean is True when more
+    messages remain beyond this batch.
+    """
+    if position is None:
+        docs = list(db.messages.find({'$or': branches})
+                    .sort([('timestamp', -1), ('_id', -1)]).limit(limit))
+        docs.reverse()
+        return docs, False
+    docs = list(db.messages.find({'$or': keyset_branches(branches, *position, '$gt')})
+                .sort([('timestamp', 1), ('_id', 1)]).limit(limit + 1))
+    return docs[:limit], len(docs) > limit
+
+
+def global_since(db, global_history, user_cache, position, limit):
+    """Global messages after position, from the in-memory buffer when it covers the gap."""
+    if global_history.ready:
+        recent = global_history.recent()
+        if position is None:
+            return recent[-limit:], False
+        marker = str(position[1])
+        for index, payload in enumerate(recent):
+            if payload['id'] == marker:
+                newer = recent[index + 1:]
+                return newer[:limit], len(newer) > limit
+        # The last-seen message has already left the buffer; fall through to the database
+
+    docs, has_more = messages_since(db, [{'is_global': True}], position, limit)
+    senders = user_cache.get_many(doc['sender_id'] for doc in docs)
+    return [
+        serialize_global_message(doc, senders[str(doc['sender_id'])])
+        for doc in docs if str(doc['sender_id']) in senders
+    ], has_more
+
+
+def conversation_digest(db, user_id, limit=1000):
+    """
+    Compact per-friend summary for a client that has just logged in: the id
+    and timestamp of the newest message in each conversation that has any.
+    Runs on every login, so each conversation costs one index seek rather
+    than a scan of the user's whole DM history.
+    """
+    if edges_ready(db):
+        friend_ids = list_friend_ids(db, user_id, limit=limit)
+    else:
+        user_doc = db.users.find_one({'_id': user_id}, {'friends': 1}) or {}
+        friend_ids = user_doc.get('friends', [])[:limit]
+    if not friend_ids:
+        return []
+
+    if is_complete(db, CONVERSATION_BACKFILL):
+        # Sorting on the full (conversation_id, timestamp, _id) key lets $group/$first
+        # jump to the newest entry of each conversation in the index
+        friends_by_conversation = {conversation_id(user_id, f): f for f in friend_ids}
+        pipeline = [
+            {'$match': {'conversation_id': {'$in': list(friends_by_conversation)}}},
+            {'$sort': {'conversation_id': -1, 'timestamp': -1, '_id': -1}},
+            {'$group': {
+                '_id': '$conversation_id',
+                'last_message_id': {'$first': '$_id'},
+                'last_timestamp': {'$first': '$timestamp'},
+            }},
+        ]
+        latest = [(friends_by_conversation[row['_id']], row)
+                  for row in db.messages.aggregate(pipeline, hint='conversation_timestamp')]
+    else:
+        # Until the backfill finishes: newest message per friend over the (sender, recipient) index
+        latest = []
+        for friend_id in friend_ids:
+            doc = db.messages.find_one({'$or': [
+                {'sender_id': user_id, 'recipient_id': friend_id},
+                {'sender_id': friend_id, 'recipient_id': user_id},
+            ]}, {'timestamp': 1}, sort=[('timestamp', -1), ('_id', -1)])
+            if doc:
+                latest.append((friend_id, {'last_message_id': doc['_id'], 'last_timestamp': doc['timestamp']}))
+    return [{
+        'unique_id': str(friend_id),
+        'last_message_id': str(row['last_message_id']),
+        'last_timestamp': row['last_timestamp'].isoformat(),
+    } for friend_id, row in latest]
@@ -0,0 +1,205 @@
+# In-memory username typeahead index serving prefix search without MongoDB.
+
+import bisect
+import gzip
+import json
+import os
+import threading
+import time
+from datetime import timedelta
+from bson.objectid import ObjectId
+
+# Rough per-entry cost of the parallel lists (list slots, tuple, str headers).
+ENTRY_OVERHEAD_BYTES = 200
+
+
+class UsernameIndex:
+    """
+    Sorted array of lowercased usernames answering top-N prefix queries with
+    two binary searches. Built from mongo.db.users at startup (or reloaded
+    from a snapshot and topped up with users created since), updated on
+    registration, and refreshed with users registered on other workers by a
+    background task every refresh_interval, never on the search path. If the
+    collection exceeds the memory budget the index marks
+    itself not ready and callers fall back to the database query.
+
+    The refresh watermark only advances from database scans, and each scan
+    re-reads skew seconds before it: ids are generated on the inserting
+    worker, so a user committed after the last scan (or created on a worker
+    with a slower clock) can carry a smaller id than one already seen.
+    """
+    def __init__(self, memory_budget_mb=64, refresh_interval=30, snapshot_path=None, skew=5.0):
+        self.enabled = False
+        self.ready = False
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self.refresh_interval = refresh_interval
+        self.snapshot_path = snapshot_path
+        self.skew = skew
+        self._mongo = None
+        self._socketio = None
+        self._refresher_started = False
+        self._keys = []      # sorted lowercased usernames
+        self._entries = []   # (username, str(user_id)), parallel to _keys
+        self._ids = set()
+        self._bytes = 0
+        self._last_id = None  # newest _id seen by a database scan
+        self._last_refresh = 0.0
+        self._lock = threading.Lock()
+
+    def init_app(self, app, mongo, socketio):
+        """Loads settings from the app config and builds the index if enabled."""
+        self._mongo = mongo
+        self._socketio = socketio
+        self.enabled = app.config.get('TYPEAHEAD_ENABLED', False)
+        self.memory_budget = app.config.get('TYPEAHEAD_MEMORY_MB', 64) * 1024 * 1024
+        self.refresh_interval = app.config.get('TYPEAHEAD_REFRESH_INTERVAL', self.refresh_interval)
+        self.snapshot_path = app.config.get('TYPEAHEAD_SNAPSHOT_PATH') or None
+        self.skew = app.config.get('TYPEAHEAD_REFRESH_SKEW', self.skew)
+        if self.enabled:
+            try:
+                self.load()
+            except Exception as e:
+                print(f"Typeahead index unavailable, falling back to MongoDB search: {e}")
+
+    # --- Building ---
+
+    def load(self):
+        """Reloads from the snapshot when one exists, then pulls in any newer users."""
+        if self.snapshot_path and os.path.exists(self.snapshot_path):
+            self._load_snapshot()
+            print(f"Typeahead index restored {len(self._keys)} usernames from snapshot.")
+        self.ready = self.refresh(force=True)
+        if not self.ready:
+            print("Typeahead index exceeds its memory budget; search falls back to MongoDB.")
+
+    def refresh(self, force=False):
+        """
+        Adds users created since the last refresh (e.g. registered on another
+        worker). Returns False if they would not fit in the memory budget.
+        """
+        now = time.monotonic()
+        if not force and now - self._last_refresh < self.refresh_interval:
+            return self.ready
+        self._last_refresh = now
+        query = {}
+        if self._last_id is not None:
+            since = self._last_id.generation_time - timedelta(seconds=self.skew)
+            query = {'_id': {'$gt': ObjectId.from_datetime(since)}}
+        batch, batch_bytes, newest = [], 0, self._last_id
+        for doc in self._mongo.db.users.find(query, {'username': 1}).sort('_id', 1):
+            newest = doc['_id'] if newest is None else max(newest, doc['_id'])
+            if str(doc['_id']) in self._ids:
+                continue  # re-read by the overlap window
+            batch.append((doc['username'], str(doc['_id'])))
+            batch_bytes += len(doc['username']) * 2 + ENTRY_OVERHEAD_BYTES
+            if self._bytes + batch_bytes > self.memory_budget:
+                self.ready = False
+                return False
+        self.extend(batch)
+        self._last_id = newest
+        return True
+
+    def _start_refresher(self):
+        # Started on first use, once the Socket.IO server (and its async mode) is set up
+        with self._lock:
+            if self._refresher_started:
+                return
+            self._refresher_started = True
+        self._socketio.start_background_task(self._refresh_loop)
+
+    def _refresh_loop(self):
+        while True:
+            self._socketio.sleep(self.refresh_interval)
+            try:
+                self.ready = self.refresh(force=True)
+            except Exception as e:
+                print(f"Typeahead refresh failed: {e}")
+
+    def extend(self, entries):
+        """Adds many (username, user_id) pairs with one sort instead of one insert each."""
+        with self._lock:
+            fresh = [(username, str(user_id)) for username, user_id in entries
+                     if str(user_id) not in self._ids]
+            if not fresh:
+                return
+            merged = sorted(
+                list(zip(self._keys, self._entries)) +
+                [(username.lower(), (username, user_id)) for username, user_id in fresh],
+                key=lambda item: item[0]
+            )
+            self._keys = [key for key, _ in merged]
+            self._entries = [entry for _, entry in merged]
+            for username, user_id in fresh:
+                self._ids.add(user_id)
+                self._bytes += len(username) * 2 + ENTRY_OVERHEAD_BYTES
+
+    def add(self, user_id, username):
+        """Inserts one user; a no-op if the id is already indexed."""
+        user_id = str(user_id)
+        key = username.lower()
+        with self._lock:
+            if user_id in self._ids:
+                return
+            position = bisect.bisect_right(self._keys, key)
+            self._keys.insert(position, key)
+            self._entries.insert(position, (username, user_id))
+            self._ids.add(user_id)
+            self._bytes += len(username) * 2 + ENTRY_OVERHEAD_BYTES
+
+    # --- Querying ---
+
+    def search(self, prefix, limit=10, exclude_id=None):
+        """Returns up to limit {'unique_id', 'username'} dicts whose username starts with prefix."""
+        if not self._refresher_started and self._socketio is not None:
+            self._start_refresher()
+        prefix = prefix.lower()
+        exclude_id = str(exclude_id) if exclude_id is not None else None
+        results = []
+        with self._lock:
+            position = bisect.bisect_left(self._keys, prefix)
+            while position < len(self._keys) and len(results) < limit:
+                if not self._keys[position].startswith(prefix):
+                    break
+                username, user_id = self._entries[position]
+                if user_id != exclude_id:
+                    results.append({'unique_id': user_id, 'username': username})
+                position += 1
+        return results
+
+    # --- Snapshots ---
+
+    def save_snapshot(self, path=None):
+        """Writes the index to a gzipped JSON file so a restart can skip the full scan."""
+        path = path or self.snapshot_path
+        if not path:
+            raise ValueError("No typeahead snapshot path configured")
+        with self._lock:
+            entries = list(self._entries)
+            last_id = str(self._last_id) if self._last_id is not None else None
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump({'last_id': last_id, 'entries': entries}, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+        return len(entries)
+
+    def _load_snapshot(self):
+        with gzip.open(self.snapshot_path, 'rt', encoding='utf-8') as f:
+            snapshot = json.load(f)
+        if isinstance(snapshot, list):
+            # Older snapshots are a bare entry list; their newest id is the best watermark available
+            entries = snapshot
+            last_id = max((user_id for _, user_id in entries), default=None)
+        else:
+            entries, last_id = snapshot['entries'], snapshot.get('last_id')
+        self.extend(entries)
+        self._last_id = ObjectId(last_id) if last_id else None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'ready': self.ready,
+                'entries': len(self._keys),
+                'estimated_bytes': self._bytes,
+                'memory_budget_bytes': self.memory_budget,
+            }
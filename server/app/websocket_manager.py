@@ -1,63 +1,189 @@
 # Contains connection managers for handling real-time WebSocket communications.
 
+import asyncio
+from collections import deque
 from fastapi import WebSocket
-from typing import Dict, List, Set
+from typing import Any, Callable, Deque, Dict, Optional, Set
+from app import serialization
+from app.notifications import (new_notification, serialize_notification, frames,
+                               pending_query, ack_query, MAX_PENDING_DELIVERY)
+
+class ClientConnection:
+    """
+    A WebSocket plus its bounded outbound queue. A dedicated writer task
+    drains the queue, so a slow client only ever delays itself. The queue is
+    a plain deque with a single wakeup future rather than an asyncio.Queue,
+    and sends are not wrapped in per-send timeouts: at 10k sockets that
+    bookkeeping cost more than the sends themselves. A stuck send is caught
+    by the lag check in offer() instead.
+    """
+    def __init__(self, websocket: WebSocket, max_queue: int, send_timeout: float):
+        self.websocket = websocket
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self.pending: Deque[str] = deque()
+        self.sending_since: Optional[float] = None
+        self.writer: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Future] = None
+
+    def start(self, on_failure: Callable[["ClientConnection"], None]):
+        self.writer = asyncio.create_task(self._write_loop(on_failure))
+
+    def offer(self, message: str, now: float) -> bool:
+        """Queues a message; False if the client is lagging by max_queue messages or stuck in a send."""
+        if len(self.pending) >= self.max_queue:
+            return False
+        if self.sending_since is not None and now - self.sending_since > self.send_timeout:
+            return False
+        self.pending.append(message)
+        if self._wakeup is not None and not self._wakeup.done():
+            self._wakeup.set_result(None)
+        return True
+
+    async def _write_loop(self, on_failure):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                while not self.pending:
+                    self._wakeup = loop.create_future()
+                    await self._wakeup
+                self.sending_since = loop.time()
+                await self.websocket.send_text(self.pending.popleft())
+                self.sending_since = None
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # The socket is gone: treat as a dead consumer
+            on_failure(self)
+
+    def stop(self):
+        if self.writer is not None and self.writer is not asyncio.current_task():
+            self.writer.cancel()
+
 
 class ConnectionManager:
     """
     Manages active WebSocket connections for chat rooms.
-    A dictionary holds room IDs as keys and a list of active WebSockets as values.
+    Each room maps its WebSockets to ClientConnections, so joins and leaves
+    are O(1). Broadcasting only enqueues onto each connection's bounded
+    outbound queue; a client whose queue is full (lagging by max_queue
+    messages) or whose current send has taken longer than send_timeout is
+    evicted on the next broadcast.
     """
-    def __init__(self):
-        self.active_connections: Dict[str, List[WebSocket]] = {}
+    def __init__(self, max_queue: int = 256, send_timeout: float = 5.0):
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self.active_connections: Dict[str, Dict[WebSocket, ClientConnection]] = {}
+        self.evicted = 0
 
     async def connect(self, room_id: str, websocket: WebSocket):
         """Accepts and stores a new WebSocket connection for a given room."""
         await websocket.accept()
-        if room_id not in self.active_connections:
-            self.active_connections[room_id] = []
-        self.active_connections[room_id].append(websocket)
+        connection = ClientConnection(websocket, self.max_queue, self.send_timeout)
+        self.active_connections.setdefault(room_id, {})[websocket] = connection
+        connection.start(lambda conn: self._evict(room_id, conn))
         print(f"New connection in room: {room_id}. Total: {len(self.active_connections[room_id])}")
 
     def disconnect(self, room_id: str, websocket: WebSocket):
         """Removes a WebSocket connection from a room."""
-        if room_id in self.active_connections:
-            self.active_connections[room_id].remove(websocket)
-            if not self.active_connections[room_id]:
-                del self.active_connections[room_id]
-            print(f"Connection closed in room: {room_id}.")
+        room = self.active_connections.get(room_id)
+        if room is None:
+            return
+        connection = room.pop(websocket, None)
+        if connection is not None:
+            connection.stop()
+        if not room:
+            del self.active_connections[room_id]
+        print(f"Connection closed in room: {room_id}.")
 
     async def broadcast(self, room_id: str, message: str):
-        """Broadcasts a message to all clients in a specific room."""
-        if room_id in self.active_connections:
-            for connection in self.active_connections[room_id]:
-                await connection.send_text(message)
+        """Queues a message for every client in a room without waiting on any of them."""
+        room = self.active_connections.get(room_id)
+        if not room:
+            return
+        now = asyncio.get_running_loop().time()
+        slow = [connection for connection in room.values() if not connection.offer(message, now)]
+        for connection in slow:
+            self._evict(room_id, connection)
+
+    async def broadcast_json(self, room_id: str, payload: Any):
+        """Encodes payload once and shares the same string with every client in the room."""
+        await self.broadcast(room_id, serialization.dumps(payload))
+
+    def _evict(self, room_id: str, connection: ClientConnection):
+        """Drops a lagging or broken consumer and closes its socket in the background."""
+        room = self.active_connections.get(room_id)
+        if room is None or room.get(connection.websocket) is not connection:
+            return
+        self.evicted += 1
+        self.disconnect(room_id, connection.websocket)
+        asyncio.create_task(self._close(connection.websocket))
+        print(f"Evicted slow consumer from room: {room_id}.")
+
+    @staticmethod
+    async def _close(websocket: WebSocket):
+        try:
+            await websocket.close(code=1013)  # Try again later
+        except Exception:
+            pass
 
 class NotificationManager:
     """
     Manages active WebSocket connections for user-specific notifications.
-    A dictionary holds user IDs as keys and their active WebSocket as the value.
+    A dictionary holds user IDs as keys and the set of that user's open
+    sockets (one per tab/device) as the value.
+
+    With an outbox (a Motor collection) attached, notifications for offline
+    users are persisted instead of dropped, delivered in batched frames on
+    reconnect and removed when the client acknowledges them.
     """
-    def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
+    def __init__(self, outbox=None):
+        self.active_connections: Dict[str, Set[WebSocket]] = {}
+        self.outbox = outbox
 
     async def connect(self, user_id: str, websocket: WebSocket):
         """Accepts and stores a new WebSocket connection for a given user."""
         await websocket.accept()
-        self.active_connections[user_id] = websocket
+        self.active_connections.setdefault(user_id, set()).add(websocket)
         print(f"Notification socket connected for user: {user_id}")
 
-    def disconnect(self, user_id: str):
-        """Removes a user's WebSocket connection."""
-        if user_id in self.active_connections:
-            del self.active_connections[user_id]
+    def disconnect(self, user_id: str, websocket: WebSocket):
+        """Removes one of a user's WebSocket connections."""
+        sockets = self.active_connections.get(user_id)
+        if sockets is not None:
+            sockets.discard(websocket)
+            if not sockets:
+                del self.active_connections[user_id]
             print(f"Notification socket disconnected for user: {user_id}")
 
     async def send_personal_notification(self, user_id: str, message: str):
-        """Sends a notification to a specific user if they are connected."""
-        if user_id in self.active_connections:
-            websocket = self.active_connections[user_id]
-            await websocket.send_text(message)
+        """Sends a notification to every connection of a user, or queues it if they are offline."""
+        sockets = self.active_connections.get(user_id)
+        if sockets:
+            for websocket in list(sockets):
+                await websocket.send_text(message)
             print(f"Sent notification to {user_id}: {message}")
+        elif self.outbox is not None:
+            await self.outbox.insert_one(new_notification(user_id, "message", message))
         else:
-            print(f"User {user_id} not connected for notifications.")
\ No newline at end of file
+            print(f"User {user_id} not connected for notifications.")
+
+    async def deliver_pending(self, user_id: str, websocket: WebSocket, frame_size: int):
+        """Sends a reconnecting user's queued notifications a frame at a time."""
+        if self.outbox is None:
+            return
+        docs = await self.outbox.find(pending_query(user_id)) \
+            .sort([("created_at", 1), ("_id", 1)]).to_list(MAX_PENDING_DELIVERY)
+        for frame in frames([serialize_notification(doc) for doc in docs], frame_size):
+            await websocket.send_text(serialization.dumps({"type": "notifications", "items": frame}))
+
+    async def ack(self, user_id: str, ids) -> int:
+        """Removes acknowledged notifications in one delete."""
+        if self.outbox is None or not ids:
+            return 0
+        result = await self.outbox.delete_many(ack_query(user_id, ids))
+        return result.deleted_count
+
+    async def send_personal_json(self, user_id: str, payload: Any):
+        """Encodes payload with the shared fast encoder and sends it to one user."""
+        await self.send_personal_notification(user_id, serialization.dumps(payload))
@@ -0,0 +1,29 @@
+# Selects the Socket.IO worker runtime. Must be imported before Flask/PyMongo
+# so that eventlet/gevent can monkey-patch the standard library first.
+
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ASYNC_MODES = ('threading', 'eventlet', 'gevent')
+
+
+def configured_async_mode():
+    """Returns the runtime named by SOCKETIO_ASYNC_MODE (default: threading)."""
+    mode = os.getenv("SOCKETIO_ASYNC_MODE", "threading").lower()
+    if mode not in ASYNC_MODES:
+        raise ValueError(f"SOCKETIO_ASYNC_MODE must be one of {', '.join(ASYNC_MODES)}, got '{mode}'")
+    return mode
+
+
+def monkey_patch():
+    """Patches blocking I/O for the green-thread runtimes; a no-op for threading."""
+    mode = configured_async_mode()
+    if mode == 'eventlet':
+        import eventlet
+        eventlet.monkey_patch()
+    elif mode == 'gevent':
+        from gevent import monkey
+        monkey.patch_all()
+    return mode
@@ -0,0 +1,129 @@
+# Throughput of the same REST reads on main.py (ASGI + Motor) and wsgi.py (Flask + PyMongo).
+#
+# Start both deployments against the same MongoDB, e.g.
+#
+#   AUTH_TOKENS_ENABLED=true SECRET_KEY=... uvicorn main:app --port 8000
+#   AUTH_TOKENS_ENABLED=true SECRET_KEY=... gunicorn -k eventlet -w 1 -b :5000 wsgi:app
+#
+# then drive each in turn with the same number of concurrent keep-alive
+# clients for the same duration:
+#
+#   python bench/asgi_vs_wsgi.py --clients 50 --seconds 10
+#
+# Each client is a thread with its own connection, logged in as a bench user
+# (registered on first use) with the session cookie a browser would send, or
+# --auth bearer for the access token. {user_id} in a path is replaced with
+# the bench user's id. The load generator is itself Python; if its CPU is
+# saturated, run several copies and add up the results.
+
+import argparse
+import http.client
+import json
+import threading
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import urlsplit
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] if ordered else 0.0
+
+
+def connect(base_url):
+    parts = urlsplit(base_url)
+    return http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+
+
+def post_json(base_url, path, body):
+    conn = connect(base_url)
+    conn.request('POST', path, body=json.dumps(body), headers={'Content-Type': 'application/json'})
+    response = conn.getresponse()
+    data = response.read()
+    cookies = SimpleCookie()
+    for header in response.headers.get_all('Set-Cookie') or []:
+        cookies.load(header)
+    conn.close()
+    return response.status, json.loads(data or b'{}'), cookies
+
+
+def log_in(base_url, username, password, auth):
+    """Registers the bench user if needed, logs in and returns (request headers, user id)."""
+    post_json(base_url, '/api/auth/register',
+              {'username': username, 'email': f'{username}@bench.invalid', 'password': password})
+    status, body, cookies = post_json(base_url, '/api/auth/login', {'username': username, 'password': password})
+    if status != 200:
+        raise SystemExit(f'{base_url}: login failed with {status}: {body}')
+    if auth == 'bearer':
+        if 'access_token' not in body:
+            raise SystemExit(f'{base_url}: no access token in the login response; set AUTH_TOKENS_ENABLED=true')
+        headers = {'Authorization': f"Bearer {body['access_token']}"}
+    else:
+        headers = {'Cookie': '; '.join(f'{name}={morsel.value}' for name, morsel in cookies.items())}
+    return headers, body['user']['id']
+
+
+def run(base_url, path, headers, clients, seconds):
+    """Returns (requests completed, errors, latencies) for `clients` threads over `seconds`."""
+    deadline = time.monotonic() + seconds
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+
+    def client():
+        conn = connect(base_url)
+        local, failed = [], 0
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                conn.request('GET', path, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                ok = response.status == 200
+            except (OSError, http.client.HTTPException):
+                ok = False
+                conn.close()
+                conn = connect(base_url)
+            if ok:
+                local.append(time.perf_counter() - started)
+            else:
+                failed += 1
+        conn.close()
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(latencies), errors[0], latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare main.py and wsgi.py under the same load.')
+    parser.add_argument('--asgi-url', default='http://127.0.0.1:8000', help='main.py (uvicorn)')
+    parser.add_argument('--wsgi-url', default='http://127.0.0.1:5000', help='wsgi.py')
+    parser.add_argument('--paths', default='/api/messages/global,/api/messages/{user_id}',
+                        help='comma-separated GET paths')
+    parser.add_argument('--clients', type=int, default=50, help='concurrent keep-alive clients')
+    parser.add_argument('--seconds', type=float, default=10.0, help='duration per path and server')
+    parser.add_argument('--auth', choices=['cookie', 'bearer'], default='cookie')
+    parser.add_argument('--username', default='bench_user')
+    parser.add_argument('--password', default='bench-password')
+    args = parser.parse_args()
+
+    print(f"{args.clients} clients, {args.seconds:g} s per run, {args.auth} auth")
+    print(f"{'server':<8}{'path':<40}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for name, base_url in (('asgi', args.asgi_url), ('wsgi', args.wsgi_url)):
+        headers, user_id = log_in(base_url, args.username, args.password, args.auth)
+        for path in args.paths.split(','):
+            path = path.replace('{user_id}', user_id)
+            run(base_url, path, headers, args.clients, min(1.0, args.seconds))  # warm up
+            done, errors, latencies = run(base_url, path, headers, args.clients, args.seconds)
+            print(f"{name:<8}{path:<40}{done / args.seconds:>10.0f}"
+                  f"{percentile(latencies, 50) * 1000:>10.2f}{percentile(latencies, 99) * 1000:>10.2f}{errors:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+# Per-request cost of authenticating a Flask request: session cookie versus JWT.
+#
+# Issues GET requests through the Flask test client against one
+# @login_required route, authenticated with the app's real flask_login
+# loaders:
+#   session hit   signed session cookie, user served from the warm UserCache
+#   session miss  signed session cookie, cache emptied before every request,
+#                 so each request pays one users.find round trip (--rtt-ms)
+#   bearer jwt    'Authorization: Bearer' access token, claims only, no read
+# An unauthenticated route is measured too so the framework's own overhead
+# can be subtracted. Users come from a bench/fakedb.py collection.
+#
+#   python bench/auth_overhead.py --requests 5000 --rtt-ms 1
+
+import argparse
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson.objectid import ObjectId
+from flask import Flask, jsonify
+from flask_login import current_user, login_required, login_user
+from app import login, user_cache
+from app.models import User
+from app.security import create_session_tokens, init_session_tokens
+from fakedb import FakeCollection
+
+
+def build_app(rtt):
+    app = Flask(__name__)
+    app.config.update(SECRET_KEY='bench-only-secret', AUTH_TOKENS_ENABLED=True)
+    init_session_tokens(app)
+    users = FakeCollection([{'_id': ObjectId(), 'username': 'alice', 'password': b'x'}], rtt)
+    user_cache._mongo = SimpleNamespace(db=SimpleNamespace(users=users))
+    login.init_app(app)
+
+    @app.route('/login')
+    def do_login():
+        login_user(User(users.docs[0]), remember=True)
+        return jsonify({'ok': True})
+
+    @app.route('/public')
+    def public():
+        return jsonify({'ok': True})
+
+    @app.route('/me')
+    @login_required
+    def me():
+        return jsonify({'unique_id': current_user.unique_id})
+
+    return app, users
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run(client, path, requests, headers=None, before=None):
+    samples = []
+    for _ in range(requests):
+        if before:
+            before()
+        started = time.perf_counter()
+        response = client.get(path, headers=headers)
+        samples.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.status_code
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark session versus token authentication.')
+    parser.add_argument('--requests', type=int, default=5000, help='requests per mode')
+    parser.add_argument('--rtt-ms', type=float, default=1.0, help='simulated MongoDB round trip')
+    args = parser.parse_args()
+
+    app, users = build_app(args.rtt_ms / 1000)
+    session_client = app.test_client()
+    session_client.get('/login')
+    bearer_client = app.test_client()
+    with app.app_context():
+        user = users.docs[0]
+        token = create_session_tokens(str(user['_id']), user['username'])['access_token']
+    bearer = {'Authorization': f'Bearer {token}'}
+
+    modes = [
+        ('unauthenticated', lambda: run(bearer_client, '/public', args.requests)),
+        ('session hit', lambda: run(session_client, '/me', args.requests)),
+        ('session miss', lambda: run(session_client, '/me', args.requests, before=user_cache.clear)),
+        ('bearer jwt', lambda: run(bearer_client, '/me', args.requests, headers=bearer)),
+    ]
+    print(f"{args.requests} requests per mode, rtt {args.rtt_ms} ms")
+    print(f"{'mode':<16}{'mean us':>10}{'p50 us':>10}{'p99 us':>10}{'db reads':>10}")
+    for name, measure in modes:
+        users.round_trips = 0
+        measure()  # warm up the path and the cache
+        users.round_trips = 0
+        samples = measure()
+        mean = sum(samples) / len(samples)
+        print(f"{name:<16}{mean * 1e6:>10.1f}{percentile(samples, 50) * 1e6:>10.1f}"
+              f"{percentile(samples, 99) * 1e6:>10.1f}{users.round_trips:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+# Broadcast to 10k simulated sockets in one room: serial sends vs ConnectionManager.
+#
+# Most fake sockets complete a send after --send-us of CPU without
+# yielding, like a socket with room in its buffer; a few are slow (each send
+# waits --slow-ms). The serial baseline is the original manager, which
+# awaited send_text for each socket in a list, so every slow client delayed
+# the whole room. ConnectionManager only enqueues onto per-connection
+# bounded queues and evicts clients that fall --max-queue messages behind.
+# Waking a writer per socket is not free: with --slow 0 the serial loop
+# delivers sooner, so compare both runs before tuning max_queue.
+#
+#   python bench/broadcast_fanout.py --sockets 10000 --slow 5 --messages 40
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import serialization
+from app.websocket_manager import ConnectionManager
+
+ROOM = 'bench'
+
+
+class FakeWebSocket:
+    def __init__(self, delay=0.0, cost=0.0, on_receive=None):
+        self.delay = delay
+        self.cost = cost
+        self.on_receive = on_receive
+        self.received = 0
+        self.closed_with = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message):
+        if self.delay:
+            await asyncio.sleep(self.delay)  # a full socket buffer; healthy sends complete without yielding
+        deadline = time.perf_counter() + self.cost
+        while time.perf_counter() < deadline:
+            pass  # framing and transport.write
+        self.received += 1
+        if self.on_receive is not None:
+            self.on_receive(message)
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+
+class SerialConnectionManager:
+    """The list-based manager ConnectionManager replaced, kept here as the baseline."""
+    def __init__(self):
+        self.active_connections = {}
+
+    async def connect(self, room_id, websocket):
+        await websocket.accept()
+        self.active_connections.setdefault(room_id, []).append(websocket)
+
+    def disconnect(self, room_id, websocket):
+        self.active_connections[room_id].remove(websocket)
+        if not self.active_connections[room_id]:
+            del self.active_connections[room_id]
+
+    async def broadcast(self, room_id, message):
+        for connection in self.active_connections.get(room_id, []):
+            await connection.send_text(message)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run(manager, sockets, slow, messages, slow_delay, send_cost, interval):
+    # Per message: fast clients still waiting for it, and when it reached the last of them
+    waiting = {}
+    delivered_at = {}
+
+    def on_receive(message):
+        index = int(message.split(':', 1)[0])
+        waiting[index] -= 1
+        if not waiting[index]:
+            delivered_at[index] = time.perf_counter()
+
+    clients = [FakeWebSocket(slow_delay, send_cost) for _ in range(slow)]
+    clients += [FakeWebSocket(cost=send_cost, on_receive=on_receive) for _ in range(sockets - slow)]
+    for websocket in clients:
+        await manager.connect(ROOM, websocket)
+
+    # Each chat message arrives on its own handler task at a fixed rate, as it
+    # would from separate senders; latency runs from that arrival
+    payload = serialization.dumps({'sender': 'bench', 'content': 'x' * 200})
+    call_times = []
+
+    async def handler(index):
+        call = time.perf_counter()
+        await manager.broadcast(ROOM, f'{index}:{payload}')
+        call_times.append(time.perf_counter() - call)
+
+    started = time.perf_counter()
+    arrivals, handlers = [], []
+    for index in range(messages):
+        arrivals.append(started + index * interval)
+        waiting[index] = sockets - slow
+        await asyncio.sleep(max(0.0, arrivals[-1] - time.perf_counter()))
+        handlers.append(asyncio.create_task(handler(index)))
+    await asyncio.gather(*handlers)
+    while len(delivered_at) < messages:
+        await asyncio.sleep(0.01)
+    latencies = [delivered_at[index] - arrivals[index] for index in range(messages)]
+
+    remaining = [websocket for websocket in clients if websocket.closed_with is None]
+    started = time.perf_counter()
+    for websocket in reversed(remaining):
+        manager.disconnect(ROOM, websocket)
+    disconnect_all = time.perf_counter() - started
+    await asyncio.sleep(0)  # let the cancelled writers finish
+
+    return {
+        'broadcast_ms': sum(call_times) / messages * 1000,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'evicted_slow': sum(1 for websocket in clients[:slow] if websocket.closed_with == 1013),
+        'evicted_fast': sum(1 for websocket in clients[slow:] if websocket.closed_with == 1013),
+        'disconnect_ms': disconnect_all * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark room broadcast fan-out.')
+    parser.add_argument('--sockets', type=int, default=10000)
+    parser.add_argument('--slow', type=int, default=5, help='number of slow clients')
+    parser.add_argument('--slow-ms', type=float, default=1000.0, help='time a slow client takes per send')
+    parser.add_argument('--send-us', type=float, default=10.0, help='CPU cost of one send')
+    parser.add_argument('--messages', type=int, default=40)
+    parser.add_argument('--interval-ms', type=float, default=250.0, help='time between chat messages')
+    parser.add_argument('--max-queue', type=int, default=16, help='lag threshold before eviction')
+    args = parser.parse_args()
+
+    print(f"{args.sockets} sockets in one room ({args.send_us} us/send), {args.slow} slow "
+          f"({args.slow_ms} ms/send), {args.messages} broadcasts every {args.interval_ms} ms")
+    print(f"{'manager':<10}{'handler ms':>12}{'delivery p50 ms':>17}{'p99 ms':>9}"
+          f"{'evicted slow':>14}{'evicted fast':>14}{'disconnect all ms':>19}")
+    for name, manager in (('serial', SerialConnectionManager()),
+                          ('queued', ConnectionManager(max_queue=args.max_queue))):
+        with contextlib.redirect_stdout(io.StringIO()):  # the managers log every join, leave and eviction
+            result = asyncio.run(run(manager, args.sockets, args.slow, args.messages, args.slow_ms / 1000,
+                                     args.send_us / 1e6, args.interval_ms / 1000))
+        print(f"{name:<10}{result['broadcast_ms']:>12.2f}{result['p50_ms']:>17.1f}{result['p99_ms']:>9.1f}"
+              f"{result['evicted_slow']:>14}{result['evicted_fast']:>14}{result['disconnect_ms']:>19.1f}")
+
+
+if __name__ == '__main__':
+    main()
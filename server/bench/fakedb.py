@@ -0,0 +1,89 @@
+# In-memory stand-ins for PyMongo collections used by the benchmarks.
+#
+# Every find/find_one/insert costs one simulated round trip (time.sleep(rtt))
+# and is counted, so a benchmark can report how many round trips a code path
+# makes as well as how long it takes. Only the query operators the benchmarked
+# paths use are supported: equality, $in, $gt/$gte/$lt and $exists.
+
+import threading
+import time
+
+
+def matches(doc, query):
+    for field, condition in query.items():
+        value = doc.get(field)
+        if isinstance(condition, dict):
+            for op, operand in condition.items():
+                if op == '$in' and value not in operand:
+                    return False
+                if op == '$gt' and not (value is not None and value > operand):
+                    return False
+                if op == '$gte' and not (value is not None and value >= operand):
+                    return False
+                if op == '$lt' and not (value is not None and value < operand):
+                    return False
+                if op == '$exists' and (field in doc) != operand:
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+
+def project(doc, projection):
+    if not projection:
+        return dict(doc)
+    return {key: value for key, value in doc.items() if key == '_id' or projection.get(key)}
+
+
+class FakeCursor:
+    def __init__(self, collection, query, projection):
+        self.collection = collection
+        self.query = query
+        self.projection = projection
+        self._sort = None
+        self._limit = 0
+
+    def sort(self, keys, direction=None):
+        self._sort = [(keys, direction)] if isinstance(keys, str) else keys
+        return self
+
+    def limit(self, limit):
+        self._limit = limit
+        return self
+
+    def __iter__(self):
+        self.collection.round_trip()
+        docs = [doc for doc in self.collection.docs if matches(doc, self.query)]
+        for key, direction in reversed(self._sort or []):
+            docs.sort(key=lambda doc: doc[key], reverse=direction == -1)
+        if self._limit:
+            docs = docs[:self._limit]
+        return iter([project(doc, self.projection) for doc in docs])
+
+
+class FakeCollection:
+    def __init__(self, docs=(), rtt=0.001):
+        self.docs = list(docs)
+        self.rtt = rtt
+        self.round_trips = 0
+        self._lock = threading.Lock()
+
+    def round_trip(self):
+        with self._lock:
+            self.round_trips += 1
+        if self.rtt:
+            time.sleep(self.rtt)
+
+    def find(self, query=None, projection=None):
+        return FakeCursor(self, query or {}, projection)
+
+    def find_one(self, query=None, projection=None):
+        self.round_trip()
+        for doc in self.docs:
+            if matches(doc, query or {}):
+                return project(doc, projection)
+        return None
+
+    def insert_one(self, doc):
+        self.round_trip()
+        self.docs.append(doc)
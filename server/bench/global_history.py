@@ -0,0 +1,95 @@
+# Round trips and latency of GET /api/messages/global as the page grows.
+#
+# Compares the original handler (one users.find_one per message), the batched
+# handler (one messages query plus a single $in for the distinct senders
+# through a cold UserCache), the same with a warm cache, and the in-memory
+# GlobalHistory buffer. Collections are bench/fakedb.py stand-ins that sleep
+# --rtt-ms per round trip.
+#
+#   python bench/global_history.py --counts 10,100,1000 --senders 20 --rtt-ms 1
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson.objectid import ObjectId
+from app.cache import UserCache
+from app.history import GlobalHistory, serialize_global_message
+from fakedb import FakeCollection
+
+
+def fake_mongo(count, senders, rtt):
+    users = [{'_id': ObjectId(), 'username': f'user{i}', 'password': b'x'} for i in range(senders)]
+    start = datetime.now(timezone.utc) - timedelta(hours=1)
+    messages = [{
+        '_id': ObjectId(), 'sender_id': users[i % senders]['_id'], 'content': f'message {i}',
+        'timestamp': start + timedelta(seconds=i), 'is_global': True,
+    } for i in range(count)]
+    return SimpleNamespace(db=SimpleNamespace(users=FakeCollection(users, rtt),
+                                              messages=FakeCollection(messages, rtt)))
+
+
+def per_message(mongo, user_cache, history, limit):
+    """The handler before batching: one find_one per message."""
+    result = []
+    for msg in mongo.db.messages.find({'is_global': True}).sort('timestamp', 1).limit(limit):
+        sender = mongo.db.users.find_one({'_id': msg['sender_id']})
+        if sender:
+            result.append(serialize_global_message(msg, sender))
+    return result
+
+
+def batched(mongo, user_cache, history, limit):
+    """The current database path: one page query, one $in for the cache misses."""
+    messages = list(mongo.db.messages.find({'is_global': True})
+                    .sort([('timestamp', -1), ('_id', -1)]).limit(limit))
+    messages.reverse()
+    senders = user_cache.get_many(msg['sender_id'] for msg in messages)
+    return [serialize_global_message(msg, senders[str(msg['sender_id'])])
+            for msg in messages if str(msg['sender_id']) in senders]
+
+
+def buffered(mongo, user_cache, history, limit):
+    return history.recent()
+
+
+def measure(handler, mongo, user_cache, history, limit):
+    mongo.db.users.round_trips = mongo.db.messages.round_trips = 0
+    started = time.perf_counter()
+    result = handler(mongo, user_cache, history, limit)
+    elapsed = time.perf_counter() - started
+    return len(result), mongo.db.users.round_trips + mongo.db.messages.round_trips, elapsed * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the global history endpoint.')
+    parser.add_argument('--counts', default='10,50,100,500,1000', help='messages per page')
+    parser.add_argument('--senders', type=int, default=20, help='distinct senders in the room')
+    parser.add_argument('--rtt-ms', type=float, default=1.0, help='simulated MongoDB round trip')
+    args = parser.parse_args()
+
+    print(f"{args.senders} distinct senders, rtt {args.rtt_ms} ms")
+    print(f"{'messages':>8}  {'path':<16}{'round trips':>12}{'ms':>10}")
+    for count in (int(c) for c in args.counts.split(',')):
+        mongo = fake_mongo(count, args.senders, args.rtt_ms / 1000)
+        user_cache = UserCache(maxsize=count + args.senders)
+        user_cache._mongo = mongo
+        history = GlobalHistory(size=count)
+        history._mongo, history._user_cache = mongo, UserCache()
+        history._user_cache._mongo = mongo
+        history.load()
+        runs = [('per-message', per_message), ('batched cold', batched),
+                ('batched warm', batched), ('buffer', buffered)]
+        for name, handler in runs:
+            returned, round_trips, ms = measure(handler, mongo, user_cache, history, count)
+            assert returned == count, f'{name} returned {returned} of {count} messages'
+            print(f"{count:>8}  {name:<16}{round_trips:>12}{ms:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+# p99 latency of an unrelated endpoint while a login storm hits the same worker.
+#
+# Models the threading runtime (one thread per request): `logins` threads
+# check passwords back to back while a probe issues a small, unrelated
+# request every interval and records how long after its scheduled arrival
+# it completed.
+# Compares bcrypt inline on the request threads (HASH_POOL_WORKERS=0) with
+# the bounded PasswordHasher process pool.
+#
+#   python bench/login_storm.py --logins 16 --seconds 5 --rounds 12
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bcrypt
+from app import serialization
+from app.hashing import PasswordHasher, HasherBusy
+
+# Roughly a friends-list response: encode a page of profiles
+FRIENDS_PAGE = [{'username': f'user{i}', 'unique_id': f'{i:024x}'} for i in range(200)]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def unrelated_request():
+    for _ in range(5):
+        serialization.dumps(FRIENDS_PAGE)
+
+
+def run(workers, logins, seconds, rounds, interval):
+    hasher = PasswordHasher(rounds=rounds, workers=workers, max_pending=logins, queue_timeout=seconds)
+    hashed = bcrypt.hashpw(b'correct horse', bcrypt.gensalt(rounds))
+    if workers:
+        hasher.check('correct horse', hashed)  # start the pool outside the measurement
+    stop = threading.Event()
+    counts = {'logins': 0, 'busy': 0}
+    latencies = []
+    lock = threading.Lock()
+
+    def login_loop():
+        while not stop.is_set():
+            try:
+                hasher.check('correct horse', hashed)
+                key = 'logins'
+            except HasherBusy:
+                key = 'busy'
+            with lock:
+                counts[key] += 1
+
+    def probe(scheduled):
+        unrelated_request()
+        with lock:
+            latencies.append(time.perf_counter() - scheduled)
+
+    storm = [threading.Thread(target=login_loop) for _ in range(logins)]
+    for thread in storm:
+        thread.start()
+    # Latency runs from each request's scheduled arrival, so a stalled
+    # dispatcher shows up as latency instead of as fewer samples
+    probes = []
+    started = time.perf_counter()
+    for k in range(int(seconds / interval)):
+        scheduled = started + k * interval
+        time.sleep(max(0.0, scheduled - time.perf_counter()))
+        thread = threading.Thread(target=probe, args=(scheduled,))
+        thread.start()
+        probes.append(thread)
+    stop.set()
+    for thread in storm + probes:
+        thread.join()
+
+    return {
+        'mode': f'pool({workers})' if workers else 'inline',
+        'logins_per_sec': counts['logins'] / seconds,
+        'busy': counts['busy'],
+        'probes': len(latencies),
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure request latency during a login storm.')
+    parser.add_argument('--logins', type=int, default=16, help='concurrent login threads')
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--rounds', type=int, default=12, help='bcrypt work factor')
+    parser.add_argument('--workers', type=int, default=2, help='HASH_POOL_WORKERS for the pooled run')
+    parser.add_argument('--interval-ms', type=float, default=10.0, help='time between probe requests')
+    args = parser.parse_args()
+
+    baseline = []
+    for _ in range(int(args.seconds * 1000 / args.interval_ms)):
+        started = time.perf_counter()
+        unrelated_request()
+        baseline.append(time.perf_counter() - started)
+    print(f"{args.logins} login threads, bcrypt cost {args.rounds}, {os.cpu_count()} CPU(s); "
+          f"idle probe p99 {percentile(baseline, 99) * 1000:.2f} ms")
+    print(f"{'mode':<10}{'logins/sec':>12}{'busy':>6}{'probes':>8}{'p50 ms':>9}{'p99 ms':>9}")
+    for workers in (0, args.workers):
+        result = run(workers, args.logins, args.seconds, args.rounds, args.interval_ms / 1000)
+        print(f"{result['mode']:<10}{result['logins_per_sec']:>12.1f}{result['busy']:>6}{result['probes']:>8}"
+              f"{result['p50_ms']:>9.2f}{result['p99_ms']:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
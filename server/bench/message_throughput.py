@@ -0,0 +1,132 @@
+# Messages/sec through the Socket.IO send path with inline vs asynchronous persistence.
+#
+# Replays the work handle_send_message does per message (build the document,
+# persist it, emit) from several concurrent senders against a fake collection
+# that sleeps for a simulated database round trip. Compares:
+#   inline       insert_one before the emit (threading mode)
+#   background   insert_one in a background task (eventlet/gevent mode; a thread here)
+#   write-behind MessageWriter batching into insert_many (MESSAGE_WRITE_BEHIND)
+#
+#   python bench/message_throughput.py --senders 16 --messages 200 --rtt-ms 2
+
+import argparse
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson.objectid import ObjectId
+from app import serialization
+from app.persistence import MessageWriter
+
+
+class SlowCollection:
+    """Stands in for mongo.db.messages: every call costs one round trip."""
+    def __init__(self, rtt, per_doc=0.0):
+        self.rtt = rtt
+        self.per_doc = per_doc
+        self.stored = 0
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def insert_one(self, doc):
+        time.sleep(self.rtt + self.per_doc)
+        with self._lock:
+            self.stored += 1
+            self.calls += 1
+
+    def insert_many(self, docs, ordered=True):
+        time.sleep(self.rtt + self.per_doc * len(docs))
+        with self._lock:
+            self.stored += len(docs)
+            self.calls += 1
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def make_persist(mode, collection):
+    """Returns (persist, drain) for one mode, mirroring events.persist_message."""
+    if mode == 'inline':
+        return collection.insert_one, lambda: None
+    if mode == 'background':
+        threads = []
+        def persist(doc):
+            thread = threading.Thread(target=collection.insert_one, args=(doc,))
+            thread.start()
+            threads.append(thread)
+        return persist, lambda: [thread.join() for thread in threads]
+    writer = MessageWriter()
+    writer._mongo = SimpleNamespace(db=SimpleNamespace(messages=collection))
+    writer.enabled = True
+    writer.start()
+    return writer.submit, writer.stop
+
+
+def run(mode, senders, messages, rtt, per_doc):
+    collection = SlowCollection(rtt, per_doc)
+    persist, drain = make_persist(mode, collection)
+    latencies = []
+    lock = threading.Lock()
+
+    def sender(sender_id, recipient_id):
+        local = []
+        for i in range(messages):
+            started = time.perf_counter()
+            doc = {'_id': ObjectId(), 'sender_id': sender_id, 'recipient_id': recipient_id,
+                   'content': f'message {i}', 'timestamp': datetime.now(timezone.utc), 'is_global': False}
+            persist(doc)
+            serialization.dumps({'id': str(doc['_id']), 'sender_id': str(sender_id),
+                                 'recipient_id': str(recipient_id), 'content': doc['content'],
+                                 'timestamp': doc['timestamp'].isoformat()})  # the emit
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=sender, args=(ObjectId(), ObjectId())) for _ in range(senders)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    delivered = time.perf_counter() - started
+    drain()
+    durable = time.perf_counter() - started
+
+    total = senders * messages
+    assert collection.stored == total, f'{mode}: {collection.stored} of {total} messages stored'
+    return {
+        'mode': mode,
+        'msgs_per_sec': total / delivered,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'durable_s': durable,
+        'db_calls': collection.calls,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare message persistence modes.')
+    parser.add_argument('--senders', type=int, default=16)
+    parser.add_argument('--messages', type=int, default=200, help='messages per sender')
+    parser.add_argument('--rtt-ms', type=float, default=2.0, help='simulated database round trip')
+    parser.add_argument('--per-doc-us', type=float, default=20.0, help='simulated server cost per document')
+    parser.add_argument('--modes', default='inline,background,write-behind')
+    args = parser.parse_args()
+
+    print(f"{args.senders} senders x {args.messages} messages, rtt {args.rtt_ms} ms")
+    print(f"{'mode':<14}{'msgs/sec':>10}{'p50 ms':>9}{'p99 ms':>9}{'durable s':>11}{'db calls':>10}")
+    for mode in args.modes.split(','):
+        result = run(mode, args.senders, args.messages, args.rtt_ms / 1000, args.per_doc_us / 1e6)
+        print(f"{result['mode']:<14}{result['msgs_per_sec']:>10.0f}{result['p50_ms']:>9.3f}"
+              f"{result['p99_ms']:>9.3f}{result['durable_s']:>11.2f}{result['db_calls']:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+# CPU per broadcast: encoding per emit/per client vs encoding once with orjson.
+#
+# Socket.IO: drives a real python-socketio Server whose Engine.IO send is
+# stubbed out (each packet is still Engine.IO-encoded per recipient, as the
+# transport would). Compares the old direct-message path (two emits, stdlib
+# json) with one emit to both rooms using app.serialization, and a global
+# room broadcast under both encoders.
+# WebSocket rooms: ConnectionManager fed one json.dumps per client (what
+# calling Starlette's send_json per socket costs) vs broadcast_json (one
+# encode, the same string shared by every queue). Delivery through the
+# writer tasks is included in both.
+#
+#   python bench/serialize_broadcast.py --sockets 10000
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import socketio
+from bson.objectid import ObjectId
+from app import serialization
+from app.websocket_manager import ConnectionManager
+
+ROOM = 'global_chat'
+
+
+def message_payload(content_length):
+    return {
+        'id': str(ObjectId()), 'sender_id': str(ObjectId()), 'recipient_id': str(ObjectId()),
+        'username': 'someone', 'content': 'x' * content_length,
+        'timestamp': '2026-10-18T03:00:00.000000+00:00',
+    }
+
+
+def cpu_us(fn, repeat):
+    started = time.process_time()
+    for _ in range(repeat):
+        fn()
+    return (time.process_time() - started) / repeat * 1e6
+
+
+def socketio_server(json_module, room_size, tabs):
+    server = socketio.Server(async_mode='threading', json=json_module)
+    server._send_eio_packet = lambda eio_sid, packet: packet.encode()
+    for i in range(room_size):
+        server.manager.enter_room(server.manager.connect(f'g{i}', '/'), '/', ROOM)
+    users = ('sender', 'recipient')
+    for user in users:
+        for tab in range(tabs):
+            server.manager.enter_room(server.manager.connect(f'{user}{tab}', '/'), '/', user)
+    return server
+
+
+def bench_socketio(room_size, payload, repeat):
+    rows = []
+    for name, json_module in (('stdlib json', json), ('orjson', serialization)):
+        server = socketio_server(json_module, room_size, tabs=3)
+        two_emits = cpu_us(lambda: (server.emit('receive_message', payload, to='recipient'),
+                                    server.emit('receive_message', payload, to='sender')), repeat * 100)
+        one_emit = cpu_us(lambda: server.emit('receive_message', payload, to=['recipient', 'sender']),
+                          repeat * 100)
+        room = cpu_us(lambda: server.emit('receive_global_message', payload, to=ROOM), repeat)
+        rows.append((name, two_emits, one_emit, room))
+    return rows
+
+
+class FakeWebSocket:
+    async def accept(self):
+        pass
+
+    async def send_text(self, message):
+        pass
+
+
+async def bench_connection_manager(sockets, payload, repeat):
+    manager = ConnectionManager(max_queue=repeat + 1)
+    clients = [FakeWebSocket() for _ in range(sockets)]
+    for websocket in clients:
+        await manager.connect(ROOM, websocket)
+
+    loop = asyncio.get_running_loop()
+    started = time.process_time()
+    for _ in range(repeat):
+        now = loop.time()
+        for connection in manager.active_connections[ROOM].values():
+            # As starlette.websockets.WebSocket.send_json encodes
+            connection.offer(json.dumps(payload, separators=(',', ':'), ensure_ascii=False), now)
+        await asyncio.sleep(0)
+    per_client = (time.process_time() - started) / repeat * 1e6
+
+    started = time.process_time()
+    for _ in range(repeat):
+        await manager.broadcast_json(ROOM, payload)
+        await asyncio.sleep(0)  # let every writer deliver
+    shared = (time.process_time() - started) / repeat * 1e6
+    return per_client, shared
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure CPU per broadcast for each encoding path.')
+    parser.add_argument('--sockets', type=int, default=10000, help='clients in the broadcast room')
+    parser.add_argument('--content', type=int, default=200, help='message length in characters')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    payload = message_payload(args.content)
+
+    print(f"Socket.IO, {args.content}-char message; DM to 3 tabs each side, room of {args.sockets}")
+    print(f"{'encoder':<13}{'DM 2 emits us':>15}{'DM 1 emit us':>14}{'room emit ms':>14}")
+    for name, two_emits, one_emit, room in bench_socketio(args.sockets, payload, args.repeat):
+        print(f"{name:<13}{two_emits:>15.1f}{one_emit:>14.1f}{room / 1000:>14.2f}")
+
+    with contextlib.redirect_stdout(io.StringIO()):  # the manager logs every join
+        per_client, shared = asyncio.run(bench_connection_manager(args.sockets, payload, args.repeat))
+    print(f"\nConnectionManager, room of {args.sockets} (CPU ms per broadcast)")
+    print(f"{'json.dumps per client':<26}{per_client / 1000:>8.2f}")
+    print(f"{'broadcast_json once':<26}{shared / 1000:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+# Microbenchmark: UsernameIndex.search vs the case-insensitive regex path.
+#
+# Builds the in-memory typeahead index from N synthetic usernames and times
+# top-10 prefix queries against it. The regex path is modelled as in
+# bench/username_search.py (a collection scan, since an 'i' regex cannot use
+# the index). Also reports build time, the index's memory estimate and how
+# long a snapshot reload takes.
+#
+#   python bench/typeahead_search.py --users 1000000
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson.objectid import ObjectId
+from app.typeahead import UsernameIndex
+from username_search import synthetic_usernames, sample_queries, regex_scan, timed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the typeahead index.')
+    parser.add_argument('--users', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=3, help='regex repetitions (the index runs 1000x more)')
+    parser.add_argument('--memory-mb', type=int, default=512)
+    args = parser.parse_args()
+
+    usernames = synthetic_usernames(args.users)
+    random.Random(3).shuffle(usernames)
+    entries = [(username, str(ObjectId())) for username in usernames]
+
+    index = UsernameIndex(memory_budget_mb=args.memory_mb)
+    started = time.perf_counter()
+    index.extend(entries)
+    build_s = time.perf_counter() - started
+    stats = index.stats()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'typeahead.json.gz')
+        index.save_snapshot(path)
+        restored = UsernameIndex(memory_budget_mb=args.memory_mb, snapshot_path=path)
+        started = time.perf_counter()
+        restored._load_snapshot()
+        reload_s = time.perf_counter() - started
+
+    print(f"{args.users} users: build {build_s:.2f} s, snapshot reload {reload_s:.2f} s, "
+          f"~{stats['estimated_bytes'] / 2 ** 20:.0f} MB estimated")
+    print(f"{'query':<18}{'regex us':>12}{'index us':>10}{'results':>9}")
+    for query in sample_queries(sorted(usernames)):
+        (regex_found, _), regex_us = timed(lambda: regex_scan(usernames, query), args.repeat)
+        found, index_us = timed(lambda: index.search(query, limit=10), args.repeat * 1000)
+        assert len(found) == len(regex_found)
+        print(f"{query!r:<18}{regex_us:>12.1f}{index_us:>10.2f}{len(found):>9}")
+
+
+if __name__ == '__main__':
+    main()
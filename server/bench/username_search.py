@@ -0,0 +1,135 @@
+# Username search over a 1M-user synthetic collection: case-insensitive regex vs prefix range.
+#
+# With --mongo-uri the users are inserted into a scratch database on a real
+# server, both query shapes from friends.search_users run against it, and
+# explain() reports the keys and documents each one examined. Without it,
+# the two plans are modelled in process: the regex as a scan of every
+# username (what a case-insensitive $regex does, since it cannot use the
+# index), the prefix range as a bisect on the sorted username_lower index.
+#
+#   python bench/username_search.py --users 1000000
+#   python bench/username_search.py --users 1000000 --mongo-uri mongodb://localhost:27017
+
+import argparse
+import bisect
+import os
+import random
+import re
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.routes.friends import prefix_range
+
+LIMIT = 10
+
+
+def synthetic_usernames(count, seed=1):
+    rng = random.Random(seed)
+    alphabet = string.ascii_letters + string.digits + '_'
+    names = set()
+    while len(names) < count:
+        names.add(rng.choice(string.ascii_letters) + ''.join(rng.choice(alphabet) for _ in range(rng.randint(4, 14))))
+    return sorted(names)
+
+
+def sample_queries(usernames, seed=2):
+    """Prefixes from common to absent, typed the way a search box sends them."""
+    rng = random.Random(seed)
+    name = rng.choice(usernames)
+    return [name[:1], name[:3].upper(), name[:6], name, 'zzzz~']
+
+
+def regex_scan(usernames, query):
+    pattern = re.compile(f'^{re.escape(query)}', re.IGNORECASE)
+    found, examined = [], 0
+    for username in usernames:  # insertion order, as a collection scan sees it
+        examined += 1
+        if pattern.match(username):
+            found.append(username)
+            if len(found) == LIMIT:
+                break
+    return found, examined
+
+
+def range_scan(index, query):
+    """index is the sorted list of (username_lower, username) pairs."""
+    bounds = prefix_range(query.lower())
+    start = bisect.bisect_left(index, (bounds['$gte'],))
+    found = []
+    for username_lower, username in index[start:start + LIMIT]:
+        if '$lt' in bounds and username_lower >= bounds['$lt']:
+            break
+        found.append(username)
+    return found, len(found)
+
+
+def timed(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return result, (time.perf_counter() - started) / repeat * 1e6
+
+
+def run_in_process(count, repeat):
+    usernames = synthetic_usernames(count)
+    random.Random(3).shuffle(usernames)
+    index = sorted((username.lower(), username) for username in usernames)
+    print(f"{count} users, in-process model")
+    print(f"{'query':<18}{'regex us':>12}{'examined':>10}{'range us':>10}{'examined':>10}")
+    for query in sample_queries(usernames):
+        (regex_found, regex_examined), regex_us = timed(lambda: regex_scan(usernames, query), repeat)
+        (range_found, range_examined), range_us = timed(lambda: range_scan(index, query), repeat * 100)
+        assert len(regex_found) == len(range_found)  # same matches; each plan returns its first ten
+        print(f"{query!r:<18}{regex_us:>12.1f}{regex_examined:>10}{range_us:>10.2f}{range_examined:>10}")
+
+
+def run_on_mongo(uri, count, repeat):
+    from pymongo import ASCENDING, MongoClient
+    client = MongoClient(uri)
+    users = client['chatsphere_bench']['users']
+    if users.estimated_document_count() != count:
+        users.drop()
+        usernames = synthetic_usernames(count)
+        for start in range(0, count, 10000):
+            users.insert_many([{'username': name, 'username_lower': name.lower()}
+                               for name in usernames[start:start + 10000]], ordered=False)
+        users.create_index([('username', ASCENDING)])
+        users.create_index([('username_lower', ASCENDING)], name='username_lower')
+    usernames = [doc['username'] for doc in users.aggregate([{'$sample': {'size': 1000}}])]
+
+    print(f"{count} users on {uri}")
+    print(f"{'query':<18}{'regex ms':>10}{'docs':>10}{'range ms':>10}{'keys':>8}")
+    for query in sample_queries(sorted(usernames)):
+        regex = {'username': {'$regex': f'^{re.escape(query)}', '$options': 'i'}}
+        ranged = {'username_lower': prefix_range(query.lower())}
+        plans = []
+        for filter_, sort in ((regex, None), (ranged, 'username_lower')):
+            def search():
+                cursor = users.find(filter_, {'username': 1}).limit(LIMIT)
+                return list(cursor.sort(sort, 1) if sort else cursor)
+            _, us = timed(search, repeat)
+            cursor = users.find(filter_, {'username': 1}).limit(LIMIT)
+            stats = (cursor.sort(sort, 1) if sort else cursor).explain()['executionStats']
+            plans.append((us / 1000, stats['totalDocsExamined'], stats['totalKeysExamined']))
+        (regex_ms, regex_docs, _), (range_ms, _, range_keys) = plans
+        print(f"{query!r:<18}{regex_ms:>10.2f}{regex_docs:>10}{range_ms:>10.2f}{range_keys:>8}")
+    client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark username prefix search.')
+    parser.add_argument('--users', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--mongo-uri', default='', help='run against a real server (uses the chatsphere_bench db)')
+    args = parser.parse_args()
+    if args.mongo_uri:
+        run_on_mongo(args.mongo_uri, args.users, args.repeat)
+    else:
+        run_in_process(args.users, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 # server/config.py
 import os
 from dotenv import load_dotenv
+from async_runtime import configured_async_mode
 
 # Load variables from .env file
 load_dotenv()
@@ -9,3 +10,113 @@ class Config:
     SECRET_KEY = os.getenv("SECRET_KEY", "dev_key")  
     MONGO_URI = os.getenv("MONGO_URI")
     FRONTEND_URLS = os.getenv("FRONTEND_URLS", "")
+
+    # In-process user profile cache (see app/cache.py)
+    USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+    USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "300"))  # seconds
+
+    # /api/metrics requires this value in the X-Metrics-Token header; empty disables it.
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+    # Private message history pagination
+    MESSAGE_PAGE_SIZE = int(os.getenv("MESSAGE_PAGE_SIZE", "50"))
+    MESSAGE_PAGE_SIZE_MAX = int(os.getenv("MESSAGE_PAGE_SIZE_MAX", "200"))
+
+    # Socket.IO worker runtime: threading, eventlet or gevent (see async_runtime.py).
+    # In the green-thread modes message persistence runs after delivery. Parsed by the
+    # same function that decides whether to monkey-patch, so the two always agree.
+    SOCKETIO_ASYNC_MODE = configured_async_mode()
+
+    # Write-behind message persistence (see app/persistence.py)
+    MESSAGE_WRITE_BEHIND = os.getenv("MESSAGE_WRITE_BEHIND", "false").lower() == "true"
+    MESSAGE_WRITE_BATCH_SIZE = int(os.getenv("MESSAGE_WRITE_BATCH_SIZE", "500"))
+    MESSAGE_WRITE_FLUSH_INTERVAL = float(os.getenv("MESSAGE_WRITE_FLUSH_INTERVAL", "0.05"))  # seconds
+    MESSAGE_WRITE_QUEUE_SIZE = int(os.getenv("MESSAGE_WRITE_QUEUE_SIZE", "10000"))
+    MESSAGE_WRITE_PUT_TIMEOUT = float(os.getenv("MESSAGE_WRITE_PUT_TIMEOUT", "1.0"))  # seconds
+
+    # Cross-process Socket.IO fan-out (see app/pubsub.py). Empty means a single
+    # process; local:///path for same-host workers; redis:// etc. otherwise.
+    SOCKETIO_MESSAGE_QUEUE = os.getenv("SOCKETIO_MESSAGE_QUEUE", "")
+    SOCKETIO_CHANNEL = os.getenv("SOCKETIO_CHANNEL", "chatsphere")
+
+    # In-memory username typeahead (see app/typeahead.py)
+    TYPEAHEAD_ENABLED = os.getenv("TYPEAHEAD_ENABLED", "false").lower() == "true"
+    TYPEAHEAD_MEMORY_MB = int(os.getenv("TYPEAHEAD_MEMORY_MB", "64"))
+    TYPEAHEAD_REFRESH_INTERVAL = int(os.getenv("TYPEAHEAD_REFRESH_INTERVAL", "30"))  # seconds
+    TYPEAHEAD_REFRESH_SKEW = float(os.getenv("TYPEAHEAD_REFRESH_SKEW", "5.0"))  # seconds
+    TYPEAHEAD_SNAPSHOT_PATH = os.getenv("TYPEAHEAD_SNAPSHOT_PATH", "")
+
+    # Pending friend request pagination
+    PENDING_PAGE_SIZE = int(os.getenv("PENDING_PAGE_SIZE", "50"))
+    PENDING_PAGE_SIZE_MAX = int(os.getenv("PENDING_PAGE_SIZE_MAX", "500"))
+
+    # Friends list pagination
+    FRIENDS_PAGE_SIZE = int(os.getenv("FRIENDS_PAGE_SIZE", "500"))
+    FRIENDS_PAGE_SIZE_MAX = int(os.getenv("FRIENDS_PAGE_SIZE_MAX", "1000"))
+
+    # Stateless signed-token auth (see app/security.py). When enabled, login and
+    # register also return an access/refresh token pair. Tokens are signed with
+    # SECRET_KEY, so token mode refuses to start while it has its default value.
+    AUTH_TOKENS_ENABLED = os.getenv("AUTH_TOKENS_ENABLED", "false").lower() == "true"
+
+    # Password hashing (see app/hashing.py). HASH_POOL_WORKERS=0 hashes inline, as on
+    # serverless runtimes without POSIX semaphores (vercel.json sets it).
+    BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+    HASH_POOL_WORKERS = int(os.getenv("HASH_POOL_WORKERS", "2"))
+    HASH_POOL_MAX_PENDING = int(os.getenv("HASH_POOL_MAX_PENDING", "32"))
+    HASH_POOL_QUEUE_TIMEOUT = float(os.getenv("HASH_POOL_QUEUE_TIMEOUT", "2.0"))  # seconds
+
+    # Token-bucket rate limits (see app/ratelimit.py): rule -> (tokens per second, burst).
+    # Set RATE_LIMIT_STORAGE_URL to a redis:// URL to share buckets across workers.
+    RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+    RATE_LIMIT_STORAGE_URL = os.getenv("RATE_LIMIT_STORAGE_URL", "")
+    RATE_LIMITS = {
+        'send_message': (5, 20),          # per user
+        'send_global_message': (2, 10),   # per user
+        'global_room': (200, 400),        # whole global room, per process/store
+        'send_room_message': (5, 20),     # per user
+        'search_users': (10, 20),         # per user
+        'auth': (1, 10),                  # per client address
+    }
+
+    # In-memory buffer of recent global messages (see app/history.py).
+    # Mode: local (single worker), refresh (multi-worker, bounded staleness) or off.
+    GLOBAL_HISTORY_SIZE = int(os.getenv("GLOBAL_HISTORY_SIZE", "100"))
+    GLOBAL_HISTORY_MODE = os.getenv("GLOBAL_HISTORY_MODE", "local")
+    GLOBAL_HISTORY_REFRESH_INTERVAL = float(os.getenv("GLOBAL_HISTORY_REFRESH_INTERVAL", "1.0"))  # seconds
+    GLOBAL_HISTORY_SKEW = float(os.getenv("GLOBAL_HISTORY_SKEW", "5.0"))  # seconds
+
+    # Retention of global chat messages in seconds, enforced by a TTL index; 0 keeps them forever.
+    GLOBAL_MESSAGE_TTL = int(os.getenv("GLOBAL_MESSAGE_TTL", "3600"))
+
+    # Delta sync: maximum conversations per /api/messages/sync request
+    SYNC_MAX_CONVERSATIONS = int(os.getenv("SYNC_MAX_CONVERSATIONS", "100"))
+
+    # Group chat membership cache (see app/rooms.py)
+    ROOM_MEMBERSHIP_TTL = int(os.getenv("ROOM_MEMBERSHIP_TTL", "300"))  # seconds
+    ROOM_MEMBERSHIP_RECHECK = float(os.getenv("ROOM_MEMBERSHIP_RECHECK", "5.0"))  # seconds
+
+    # Presence tracking (see app/presence.py). Set PRESENCE_STORE_URL to a
+    # redis:// URL to share connection counts across workers.
+    PRESENCE_STORE_URL = os.getenv("PRESENCE_STORE_URL", "")
+    PRESENCE_DEBOUNCE = float(os.getenv("PRESENCE_DEBOUNCE", "2.0"))  # seconds
+    # A worker's counts expire this long after its last heartbeat (e.g. after a crash).
+    PRESENCE_WORKER_TTL = int(os.getenv("PRESENCE_WORKER_TTL", "30"))  # seconds
+
+    # Notification outbox delivery (see app/notifications.py)
+    NOTIFICATION_FRAME_SIZE = int(os.getenv("NOTIFICATION_FRAME_SIZE", "200"))
+    NOTIFICATION_MAX_DELIVERY = int(os.getenv("NOTIFICATION_MAX_DELIVERY", "1000"))
+    # Unacknowledged notifications are removed this long after creation (0 keeps them).
+    NOTIFICATION_TTL = int(os.getenv("NOTIFICATION_TTL", str(7 * 24 * 3600)))  # seconds
+
+    # MongoDB connection pool, shared by PyMongo and Motor (see app/mongo_metrics.py).
+    # 0 leaves maxIdleTimeMS / waitQueueTimeoutMS / socketTimeoutMS at the driver default.
+    MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+    MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+    MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "0"))
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "0"))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "30000"))
+    MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "20000"))
+    MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "0"))
+    MONGO_READ_PREFERENCE = os.getenv("MONGO_READ_PREFERENCE", "primary")
+    MONGO_MONITORING_ENABLED = os.getenv("MONGO_MONITORING_ENABLED", "true").lower() == "true"
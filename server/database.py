@@ -2,49 +2,111 @@
 
 import pymongo
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from config import Config
+from app.indexes import GLOBAL_ONLY, GLOBAL_TTL_INDEX, OBSOLETE_INDEXES
 
-async def init_db(db: AsyncIOMotorDatabase):
+async def init_db(db: AsyncIOMotorDatabase, global_ttl: int = Config.GLOBAL_MESSAGE_TTL):
     """
     Initializes database collections and creates necessary indexes.
-    This function is called on application startup.
+    This function is called on application startup. global_ttl is the
+    retention of global chat messages in seconds (0 keeps them forever); it
+    defaults to GLOBAL_MESSAGE_TTL, as for the Flask app's ensure_indexes.
     """
     # --- User Collection ---
     # Ensure a unique index on 'username' and 'unique_id' for fast lookups and to prevent duplicates.
     await db.users.create_index("username", unique=True)
     await db.users.create_index("unique_id", unique=True)
+    await db.users.create_index("username_lower")
     print("Users collection indexes checked/created.")
 
     # --- Messages Collection ---
-    # Create a TTL (Time-To-Live) index on 'createdAt' for the global chat room.
-    # This automatically deletes messages from the 'global' room after a specified time.
-    # We apply this index only to documents where 'room_id' is 'global'.
+    # Global chat messages are written with is_global/timestamp, so both the
+    # history index and the TTL that expires them must key on those fields.
+    # The TTL follows the same name and setting as app/indexes.py, and is
+    # adjusted in place when GLOBAL_MESSAGE_TTL changes.
     try:
-        # Check if the TTL index already exists
-        index_info = await db.messages.index_information()
-        ttl_index_name = "createdAt_1_global_ttl"
-
-        if ttl_index_name not in index_info:
+        existing = (await db.messages.index_information()).get(GLOBAL_TTL_INDEX)
+        if not global_ttl:
+            if existing:
+                await db.messages.drop_index(GLOBAL_TTL_INDEX)
+                print("TTL index dropped; global chat messages are kept.")
+        elif existing is None:
             print("Creating TTL index for global chat messages...")
             await db.messages.create_index(
-                [("createdAt", pymongo.ASCENDING)],
-                name=ttl_index_name,
-                expireAfterSeconds=3600,  # 1 hour
-                partialFilterExpression={"room_id": "global"}
+                [("timestamp", pymongo.ASCENDING)],
+                name=GLOBAL_TTL_INDEX,
+                expireAfterSeconds=global_ttl,
+                partialFilterExpression=GLOBAL_ONLY
             )
             print("TTL index created successfully.")
+        elif existing.get("expireAfterSeconds") != global_ttl:
+            await db.command("collMod", "messages",
+                             index={"name": GLOBAL_TTL_INDEX, "expireAfterSeconds": global_ttl})
+            print(f"TTL index updated to {global_ttl} seconds.")
         else:
             print("TTL index already exists.")
 
     except Exception as e:
         print(f"An error occurred while creating TTL index: {e}")
 
-    # Create a standard index on room_id for efficient querying of chat histories.
-    await db.messages.create_index("room_id")
+    # Partial index serving the global history query, sorted by (timestamp, _id).
+    await db.messages.create_index(
+        [("is_global", pymongo.ASCENDING),
+         ("timestamp", pymongo.ASCENDING),
+         ("_id", pymongo.ASCENDING)],
+        name="global_timestamp",
+        partialFilterExpression=GLOBAL_ONLY
+    )
+    # Group chat history, paged by (timestamp, _id); only room messages are indexed.
+    await db.messages.create_index(
+        [("room_id", pymongo.ASCENDING),
+         ("timestamp", pymongo.ASCENDING),
+         ("_id", pymongo.ASCENDING)],
+        name="room_timestamp",
+        partialFilterExpression={"room_id": {"$exists": True}}
+    )
+    # Compound index for paginated private history between two users.
+    await db.messages.create_index(
+        [("sender_id", pymongo.ASCENDING),
+         ("recipient_id", pymongo.ASCENDING),
+         ("timestamp", pymongo.ASCENDING),
+         ("_id", pymongo.ASCENDING)],
+        name="sender_recipient_timestamp"
+    )
+    await db.messages.create_index(
+        [("conversation_id", pymongo.ASCENDING),
+         ("timestamp", pymongo.ASCENDING),
+         ("_id", pymongo.ASCENDING)],
+        name="conversation_timestamp"
+    )
     print("Messages collection indexes checked/created.")
 
     # --- Friend Requests Collection ---
-    # Index on to_user_id for quickly finding requests for a specific user.
-    await db.friend_requests.create_index("to_user_id")
+    # Compound index for a user's pending requests, paged by _id.
+    await db.friend_requests.create_index(
+        [("to_user_id", pymongo.ASCENDING),
+         ("status", pymongo.ASCENDING),
+         ("_id", pymongo.ASCENDING)],
+        name="to_user_status"
+    )
     print("Friend requests collection indexes checked/created.")
 
-    print("Database initialization complete.")
\ No newline at end of file
+    # --- Friendships Collection ---
+    # One document per directed edge, unique per (user_id, friend_id).
+    await db.friendships.create_index(
+        [("user_id", pymongo.ASCENDING), ("friend_id", pymongo.ASCENDING)],
+        name="user_friend", unique=True
+    )
+    print("Friendships collection indexes checked/created.")
+
+    # --- Obsolete Indexes ---
+    # Superseded indexes listed in app/indexes.py (e.g. room_id_1, to_user_id_1).
+    for collection, name in OBSOLETE_INDEXES:
+        try:
+            if name in await db[collection].index_information():
+                await db[collection].drop_index(name)
+                print(f"Dropped obsolete index {name} on {collection}.")
+        except Exception as e:
+            print(f"An error occurred while dropping index {name} on {collection}: {e}")
+
+    print("Database initialization complete.")
@@ -1,18 +1,63 @@
-# Main application file to initialize and configure the FastAPI app.
+# ASGI entry point: the Flask blueprints plus the native WebSocket managers in one server.
+#
+#   uvicorn main:app --host 0.0.0.0 --port 8000
+#
+# Served natively on the event loop, with MongoDB I/O through Motor:
+#   GET /api/messages/global and GET /api/messages/<friend id> (the chat
+#   window's history reads), /ws/chat/<room> and /ws/notifications/<user>.
+# Every other REST endpoint is the Flask app (the same blueprints wsgi.py
+# serves) behind a WSGI bridge, i.e. sync PyMongo in a worker thread pool.
+# Socket.IO clients keep using wsgi.py/run.py; with SOCKETIO_MESSAGE_QUEUE set
+# they also receive global messages posted here.
+#
+# Everything here authenticates with the signed access tokens of
+# app/security.py (the native history routes also accept the Flask session
+# cookie), so token mode is on by default for this entry point and startup
+# fails if it is turned off. Point the client's VITE_API_URL at this server
+# so logins return a token. Compare with wsgi.py using bench/asgi_vs_wsgi.py.
 
+import asyncio
 import os
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.middleware.cors import CORSMiddleware
+from datetime import datetime, timezone
+from a2wsgi import WSGIMiddleware
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+from fastapi import FastAPI, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from flask_login.config import COOKIE_NAME as REMEMBER_COOKIE_NAME
+from flask_login.utils import decode_cookie
+from itsdangerous import BadSignature
 from motor.motor_asyncio import AsyncIOMotorClient
-from dotenv import load_dotenv
+from starlette.convertors import Convertor, register_url_convertor
 
-# Import routers and other modules
-from database import init_db
-from routers import auth, users, chat
-from websocket_manager import ConnectionManager, NotificationManager
+from config import Config
+from app import create_app, serialization, mongo_metrics, limiter, socketio, user_cache, global_history
+from app.events import GLOBAL_ROOM as SOCKETIO_GLOBAL_ROOM, allow_global_message, new_global_message
+from app.history import serialize_global_message
+from app.migrations import is_complete_async, CONVERSATION_BACKFILL
+from app.rooms import serialize_room_message
+from app.security import decode_session_token, session_tokens_enabled
+from app.sync import decode_cursor, direct_branches, encode_cursor, keyset_branches, serialize_private_message
+from app.websocket_manager import ConnectionManager, NotificationManager
 
-# Load environment variables from .env file
-load_dotenv()
+GLOBAL_ROOM = "global"
+
+
+class ASGIConfig(Config):
+    # The /ws/* endpoints only accept access tokens, so token mode defaults to on here.
+    AUTH_TOKENS_ENABLED = os.getenv("AUTH_TOKENS_ENABLED", "true").lower() == "true"
+    # This process serves no Socket.IO clients; it only emits through SOCKETIO_MESSAGE_QUEUE,
+    # from worker threads, so it never needs green threads of its own.
+    SOCKETIO_ASYNC_MODE = "threading"
+
+
+# --- Flask app (REST API) ---
+# create_app also creates the indexes the shared queries rely on.
+flask_app, _ = create_app(ASGIConfig)
+if not session_tokens_enabled():
+    raise RuntimeError("main.py authenticates WebSockets with access tokens; set AUTH_TOKENS_ENABLED=true")
+# Without a message queue, Socket.IO clients (on other processes) cannot be reached from here.
+relay_to_socketio = bool(flask_app.config.get("SOCKETIO_MESSAGE_QUEUE"))
 
 # --- App Initialization ---
 app = FastAPI(
@@ -21,20 +66,6 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# --- CORS Middleware ---
-# Allows the React client (running on a different port) to communicate with the API.
-origins = [
-    "http://localhost:5173",  # Default Vite dev server port
-    "http://127.0.0.1:5173",
-]
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
 
 # --- Database Connection ---
 @app.on_event("startup")
@@ -42,13 +73,15 @@ async def startup_db_client():
     """
     Connect to MongoDB on application startup.
     """
-    mongodb_url = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
-    app.mongodb_client = AsyncIOMotorClient(mongodb_url)
-    app.db = app.mongodb_client["chatsphere"]
+    # Same pool settings and listeners as the Flask app's PyMongo client
+    app.mongodb_client = AsyncIOMotorClient(
+        Config.MONGO_URI, **mongo_metrics.client_options(flask_app.config)
+    )
+    app.db = app.mongodb_client.get_default_database("chatsphere")
+    notification_manager.outbox = app.db.notifications
     print("Connected to MongoDB...")
-    # Initialize database collections and indexes
-    await init_db(app.db)
-    print("Database initialized.")
+    if not relay_to_socketio:
+        print("SOCKETIO_MESSAGE_QUEUE is not set: Socket.IO clients will not see global messages sent here.")
 
 
 @app.on_event("shutdown")
@@ -65,11 +98,86 @@ async def shutdown_db_client():
 chat_manager = ConnectionManager()
 notification_manager = NotificationManager()
 
-# --- API Routers ---
-# Include the REST API endpoints from the routers.
-app.include_router(auth.router, tags=["Authentication"], prefix="/api/auth")
-app.include_router(users.router, tags=["Users & Friends"], prefix="/api")
-app.include_router(chat.router, tags=["Chat Rooms"], prefix="/api/chatrooms")
+# Fire-and-forget tasks (message writes, Socket.IO relays). The event loop only
+# keeps weak references to tasks, so they are held here until they finish.
+background_tasks = set()
+
+
+def spawn(coro):
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+
+def websocket_identity(websocket: WebSocket):
+    """
+    Returns (user_id, username) from the signed access token in the 'token'
+    query parameter, or (None, None) if it is missing or invalid.
+    """
+    claims = decode_session_token(websocket.query_params.get("token") or "")
+    if not claims or not ObjectId.is_valid(claims["sub"]):
+        return None, None
+    return claims["sub"], claims.get("username")
+
+
+async def can_join(room_id: str, user_id: str) -> bool:
+    """Everyone may join the global room; group rooms require membership."""
+    if room_id == GLOBAL_ROOM:
+        return True
+    try:
+        room = await app.db.chatrooms.find_one(
+            {"_id": ObjectId(room_id), "members": ObjectId(user_id)}, {"_id": 1}
+        )
+    except InvalidId:
+        return False
+    return room is not None
+
+
+async def persist(message_doc: dict):
+    try:
+        await app.db.messages.insert_one(message_doc)
+    except Exception as e:
+        print(f"Failed to persist message {message_doc['_id']}: {e}")
+
+
+def chat_message(room_id: str, user_id: str, username: str, content: str):
+    """
+    Builds the document and the Socket.IO wire payload for a chat message.
+    Global messages go through the same history buffer as the Socket.IO
+    global chat.
+    """
+    if room_id == GLOBAL_ROOM:
+        message_doc, message_data = new_global_message(user_id, username, content)
+    else:
+        message_doc = {
+            "_id": ObjectId(),
+            "room_id": ObjectId(room_id),
+            "sender_id": ObjectId(user_id),
+            "recipient_id": None,
+            "content": content,
+            "timestamp": datetime.now(timezone.utc),
+            "is_global": False,
+        }
+        message_data = serialize_room_message(message_doc, username)
+    return message_doc, message_data
+
+
+def native_payload(room_id: str, user_id: str, username: str, message_data: dict) -> dict:
+    """What /ws/chat clients receive: only fields the server sets, in the names they read."""
+    return {
+        **message_data,
+        "room_id": room_id,
+        "author_id": user_id,
+        "author_username": username,
+        "createdAt": message_data["timestamp"],
+    }
+
+
+def allow_message(room_id: str, user_id: str) -> bool:
+    if room_id == GLOBAL_ROOM:
+        return allow_global_message(user_id)
+    return limiter.allow("send_room_message", user_id)
 
 
 # --- WebSocket Endpoints ---
@@ -77,11 +185,10 @@ app.include_router(chat.router, tags=["Chat Rooms"], prefix="/api/chatrooms")
 @app.websocket("/ws/chat/{room_id}")
 async def websocket_chat_endpoint(websocket: WebSocket, room_id: str):
     """
-    WebSocket endpoint for real-time chat in both global and private rooms.
+    WebSocket endpoint for real-time chat in both global and group rooms.
     """
-    # The user ID is passed as a query parameter for identification
-    user_id = websocket.query_params.get("user_id")
-    if not user_id:
+    user_id, username = websocket_identity(websocket)
+    if not user_id or not await can_join(room_id, user_id):
         await websocket.close(code=1008)
         return
 
@@ -89,32 +196,213 @@ async def websocket_chat_endpoint(websocket: WebSocket, room_id: str):
     try:
         while True:
             # Wait for a message from the client
-            data = await websocket.receive_text()
-            # Broadcast the message to all clients in the same room
-            await chat_manager.broadcast(room_id, data)
+            try:
+                data = serialization.loads(await websocket.receive_text())
+            except ValueError:
+                continue
+            content = data.get("content") if isinstance(data, dict) else None
+            if not content or not isinstance(content, str):
+                continue
+            # Both may block (a Redis round trip for shared rate limits, the history buffer's lock)
+            if not await run_in_threadpool(allow_message, room_id, user_id):
+                await websocket.send_text(serialization.dumps({"type": "rate_limited"}))
+                continue
+
+            message_doc, message_data = await run_in_threadpool(chat_message, room_id, user_id, username, content)
+            # Deliver first; the write does not hold up the broadcast
+            spawn(persist(message_doc))
+            await chat_manager.broadcast_json(room_id, native_payload(room_id, user_id, username, message_data))
+            if room_id == GLOBAL_ROOM and relay_to_socketio:
+                # Socket.IO clients of the global chat (served by wsgi.py) see it through the queue
+                spawn(run_in_threadpool(socketio.emit, "receive_global_message", message_data,
+                                        to=SOCKETIO_GLOBAL_ROOM))
     except WebSocketDisconnect:
-        chat_manager.disconnect(room_id, websocket)
         print(f"Client {user_id} disconnected from room {room_id}")
+    finally:
+        chat_manager.disconnect(room_id, websocket)
 
 
 @app.websocket("/ws/notifications/{user_id}")
 async def websocket_notification_endpoint(websocket: WebSocket, user_id: str):
     """
     WebSocket endpoint for sending real-time notifications to a specific user.
+    Only the user named in the access token may open it.
     """
+    token_user_id, _ = websocket_identity(websocket)
+    if not token_user_id or token_user_id != user_id:
+        await websocket.close(code=1008)
+        return
+
     await notification_manager.connect(user_id, websocket)
     try:
-        # Keep the connection alive to receive notifications
+        await notification_manager.deliver_pending(
+            user_id, websocket, flask_app.config["NOTIFICATION_FRAME_SIZE"]
+        )
+        # The only client message is a bulk acknowledgement: {"ack": ["<id>", ...]}
         while True:
-            # This endpoint primarily listens; it doesn't expect incoming messages
-            # from the client, but we need a loop to keep it open.
-            await websocket.receive_text() # This will block until a message is received or connection is closed.
+            try:
+                data = serialization.loads(await websocket.receive_text())
+            except ValueError:
+                continue
+            if isinstance(data, dict) and isinstance(data.get("ack"), list):
+                try:
+                    await notification_manager.ack(user_id, data["ack"])
+                except ValueError:
+                    continue
     except WebSocketDisconnect:
-        notification_manager.disconnect(user_id)
         print(f"Notification socket for user {user_id} disconnected.")
+    finally:
+        notification_manager.disconnect(user_id, websocket)
 
 # Add a reference to the notification manager to the app state
 # so it can be accessed from the REST endpoints to send notifications.
 app.state.notification_manager = notification_manager
 
-print("FastAPI app setup complete. Waiting for uvicorn to start...")
\ No newline at end of file
+# --- Native REST endpoints ---
+# The chat window's history reads, served with Motor. They mirror
+# app/routes/messages.py, which still serves them under wsgi.py.
+
+class ObjectIdConvertor(Convertor):
+    """Path segments that are ObjectIds, so /api/messages/digest etc. still reach Flask."""
+    regex = "[0-9a-fA-F]{24}"
+
+    def convert(self, value):
+        return value
+
+    def to_string(self, value):
+        return str(value)
+
+
+register_url_convertor("objectid", ObjectIdConvertor())
+
+frontend_urls = flask_app.config.get("FRONTEND_URLS", "")
+allowed_origins = {url.strip() for url in frontend_urls.split(",")} if frontend_urls else set()
+session_serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+session_max_age = int(flask_app.permanent_session_lifetime.total_seconds())
+
+
+def json_response(request: Request, body, status_code: int = 200, headers=None) -> Response:
+    """A JSON response with the CORS headers Flask-CORS adds to the bridged routes."""
+    headers = dict(headers or {})
+    origin = request.headers.get("origin")
+    if origin in allowed_origins:
+        headers.update({
+            "Access-Control-Allow-Origin": origin,
+            "Access-Control-Allow-Credentials": "true",
+            "Access-Control-Expose-Headers": "X-Prev-Cursor, X-Next-Cursor",
+            "Vary": "Origin",
+        })
+    return Response(serialization.dumps(body), status_code=status_code,
+                    media_type="application/json", headers=headers)
+
+
+def cookie_user_id(cookies) -> str:
+    """The flask_login user id in the Flask session cookie, else in the remember-me cookie."""
+    value = cookies.get(flask_app.config["SESSION_COOKIE_NAME"])
+    if value:
+        try:
+            user_id = session_serializer.loads(value, max_age=session_max_age).get("_user_id")
+        except BadSignature:
+            user_id = None
+        if user_id:
+            return user_id
+    remember = cookies.get(flask_app.config.get("REMEMBER_COOKIE_NAME", REMEMBER_COOKIE_NAME))
+    if remember:
+        return decode_cookie(remember, key=flask_app.config["SECRET_KEY"])
+    return None
+
+
+async def request_user_id(request: Request):
+    """
+    The caller's user id, authenticated as the Flask app would: a Bearer
+    access token (claims only), or a session of a user that still exists.
+    """
+    header = request.headers.get("authorization", "")
+    if header.startswith("Bearer "):
+        claims = decode_session_token(header[len("Bearer "):])
+        user_id = claims["sub"] if claims else None
+        return user_id if user_id and ObjectId.is_valid(user_id) else None
+    user_id = cookie_user_id(request.cookies)
+    if not user_id or not ObjectId.is_valid(user_id):
+        return None
+    found = await user_cache.get_many_async(app.db.users, [user_id])
+    return user_id if user_id in found else None
+
+
+def unauthorized(request: Request) -> Response:
+    return json_response(request, {"error": "Unauthorized access"}, 401)
+
+
+def page_size(request: Request) -> int:
+    default = flask_app.config.get("MESSAGE_PAGE_SIZE", 50)
+    maximum = flask_app.config.get("MESSAGE_PAGE_SIZE_MAX", 200)
+    try:
+        limit = int(request.query_params.get("limit", default))
+    except ValueError:
+        limit = default
+    return max(1, min(limit, maximum))
+
+
+@app.get("/api/messages/global")
+async def global_message_history(request: Request):
+    """Returns the most recent global messages, oldest first."""
+    if not await request_user_id(request):
+        return unauthorized(request)
+    if global_history.ready:
+        if global_history.mode == "refresh":
+            # May pull other workers' messages through PyMongo
+            return json_response(request, await run_in_threadpool(global_history.recent))
+        return json_response(request, global_history.recent())
+
+    messages = await (app.db.messages.find({"is_global": True})
+                      .sort([("timestamp", -1), ("_id", -1)]).limit(100).to_list(None))
+    messages.reverse()
+    senders = await user_cache.get_many_async(app.db.users, (msg["sender_id"] for msg in messages))
+    return json_response(request, [
+        serialize_global_message(msg, senders[str(msg["sender_id"])])
+        for msg in messages if str(msg["sender_id"]) in senders
+    ])
+
+
+@app.get("/api/messages/{friend_id:objectid}")
+async def private_message_history(request: Request, friend_id: str):
+    """
+    One page of private message history with a friend; the same parameters
+    (?before, ?after, ?limit) and cursor headers as the Flask route.
+    """
+    user_id = await request_user_id(request)
+    if not user_id:
+        return unauthorized(request)
+    user_id, friend_id = ObjectId(user_id), ObjectId(friend_id)
+    before = request.query_params.get("before")
+    after = request.query_params.get("after")
+    limit = page_size(request)
+
+    branches = direct_branches(user_id, friend_id, await is_complete_async(app.db, CONVERSATION_BACKFILL))
+    try:
+        if after:
+            branches = keyset_branches(branches, *decode_cursor(after), "$gt")
+        elif before:
+            branches = keyset_branches(branches, *decode_cursor(before), "$lt")
+    except ValueError as e:
+        return json_response(request, {"error": str(e)}, 400)
+
+    direction = 1 if after else -1
+    messages = await (app.db.messages.find({"is_global": False, "$or": branches})
+                      .sort([("timestamp", direction), ("_id", direction)]).limit(limit).to_list(None))
+    if direction == -1:
+        messages.reverse()
+
+    headers = {}
+    if messages:
+        headers = {"X-Prev-Cursor": encode_cursor(messages[0]), "X-Next-Cursor": encode_cursor(messages[-1])}
+    return json_response(request, [serialize_private_message(msg) for msg in messages], headers=headers)
+
+
+# --- REST API ---
+# Everything else is served by the Flask blueprints (CORS included), running
+# in a worker thread pool. Routes registered above take precedence; requests
+# they do not match by method (e.g. CORS preflights) fall through to Flask.
+app.mount("/", WSGIMiddleware(flask_app))
+
+print("ASGI app setup complete. Waiting for uvicorn to start...")
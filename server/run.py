@@ -1,3 +1,6 @@
+import async_runtime
+async_runtime.monkey_patch()
+
 from app import create_app, mongo # Import 'mongo', not 'db'
 
 # The create_app factory now returns two objects
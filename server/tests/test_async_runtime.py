@@ -0,0 +1,16 @@
+import importlib
+
+import pytest
+
+import async_runtime
+import config
+
+
+def test_config_uses_the_normalised_runtime(monkeypatch):
+    monkeypatch.setenv('SOCKETIO_ASYNC_MODE', 'Eventlet')
+    assert importlib.reload(config).Config.SOCKETIO_ASYNC_MODE == 'eventlet'
+    monkeypatch.setenv('SOCKETIO_ASYNC_MODE', 'asyncio')
+    with pytest.raises(ValueError):
+        async_runtime.configured_async_mode()
+    monkeypatch.delenv('SOCKETIO_ASYNC_MODE')
+    importlib.reload(config)
@@ -0,0 +1,81 @@
+import asyncio
+from types import SimpleNamespace
+
+from bson.objectid import ObjectId
+
+from app import cache as cache_module
+from app.cache import RateCounter, UserCache
+
+
+class FakeUsers:
+    def __init__(self, docs):
+        self.docs = {doc['_id']: doc for doc in docs}
+        self.queries = 0
+
+    def find(self, query, projection=None):
+        self.queries += 1
+        return [self.docs[_id] for _id in query['_id']['$in'] if _id in self.docs]
+
+
+def make_cache(count):
+    users = FakeUsers([{'_id': ObjectId(), 'username': f'user{i}'} for i in range(count)])
+    cache = UserCache()
+    cache._mongo = SimpleNamespace(db=SimpleNamespace(users=users))
+    return cache, users
+
+
+def test_only_session_loader_hits_count_as_saved_reads():
+    cache, users = make_cache(100)
+    ids = list(users.docs)
+    cache.get_many(ids)
+    cache.get_many(ids)  # 100 hits, but the uncached path would have been one $in
+    assert cache.stats()['db_reads_saved_per_sec'] == 0
+
+    cache.load_session_user(ids[0])
+    cache.load_session_user(ids[1])
+    assert cache.stats()['db_reads_saved_per_sec'] > 0
+    assert cache.stats()['loader_hits'] == 2
+
+
+def test_misses_are_resolved_with_one_query():
+    cache, users = make_cache(10)
+    found = cache.get_many(list(users.docs) + [ObjectId()])
+    assert len(found) == 10
+    assert users.queries == 1
+
+
+def test_rate_covers_only_the_time_since_startup_within_the_first_window(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(cache_module.time, 'monotonic', lambda: clock[0])
+    counter = RateCounter(window=60)
+    clock[0] += 9
+    for _ in range(20):
+        counter.add()
+    assert counter.rate() == 20 / 10  # seconds 1000..1009
+
+    clock[0] += 100
+    for _ in range(60):
+        counter.add()
+    assert counter.rate() == 60 / 60
+
+
+class FakeMotorUsers:
+    def __init__(self, users):
+        self.users = users
+
+    def find(self, query, projection=None):
+        docs = self.users.find(query, projection)
+        async def to_list(length):
+            return docs
+        return SimpleNamespace(to_list=to_list)
+
+
+def test_async_lookups_share_the_cache_with_sync_ones():
+    cache, users = make_cache(10)
+    ids = list(users.docs)
+    cache.get_many(ids[:5])
+    found = asyncio.run(cache.get_many_async(FakeMotorUsers(users), ids + [ObjectId()]))
+    assert len(found) == 10
+    assert users.queries == 2  # the second query only asked for the five misses
+    assert asyncio.run(cache.get_many_async(FakeMotorUsers(users), ids)) == found
+    assert users.queries == 2
@@ -0,0 +1,56 @@
+import asyncio
+from collections import defaultdict
+
+from database import init_db
+
+
+class FakeCollection:
+    def __init__(self, indexes=None):
+        self.indexes = dict(indexes or {})
+
+    async def index_information(self):
+        return dict(self.indexes)
+
+    async def create_index(self, keys, name=None, **options):
+        if isinstance(keys, str):
+            keys = [(keys, 1)]
+        name = name or '_'.join(f'{field}_{direction}' for field, direction in keys)
+        self.indexes.setdefault(name, {'key': keys, **options})
+        return name
+
+    async def drop_index(self, name):
+        del self.indexes[name]
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.collections = defaultdict(FakeCollection)
+        self.commands = []
+
+    def __getitem__(self, name):
+        return self.collections[name]
+
+    def __getattr__(self, name):
+        return self.collections[name]
+
+    async def command(self, *args, **kwargs):
+        self.commands.append((args, kwargs))
+
+
+def test_init_db_drops_the_room_id_index_and_uses_the_configured_ttl():
+    db = FakeDatabase()
+    db.messages.indexes['room_id_1'] = {'key': [('room_id', 1)]}
+    asyncio.run(init_db(db, global_ttl=600))
+
+    assert 'room_id_1' not in db.messages.indexes
+    assert 'room_timestamp' in db.messages.indexes
+    assert db.messages.indexes['timestamp_global_ttl']['expireAfterSeconds'] == 600
+
+
+def test_init_db_adjusts_an_existing_ttl_in_place():
+    db = FakeDatabase()
+    db.messages.indexes['timestamp_global_ttl'] = {'key': [('timestamp', 1)], 'expireAfterSeconds': 3600}
+    asyncio.run(init_db(db, global_ttl=600))
+
+    assert db.commands == [(('collMod', 'messages'),
+                            {'index': {'name': 'timestamp_global_ttl', 'expireAfterSeconds': 600}})]
@@ -0,0 +1,47 @@
+import os
+
+import bcrypt
+import pytest
+
+from app import hashing
+from app.hashing import PasswordHasher, HasherBusy
+
+
+def test_inline_and_pooled_hashes_verify():
+    for workers in (0, 1):
+        hasher = PasswordHasher(rounds=4, workers=workers)
+        hashed = hasher.hash('hunter2')
+        assert hasher.check('hunter2', hashed)
+        assert not hasher.check('wrong', hashed)
+
+
+def test_falls_back_inline_when_the_platform_has_no_process_pool(monkeypatch):
+    def no_semaphores(*args, **kwargs):
+        raise OSError(38, 'Function not implemented')
+    monkeypatch.setattr(hashing, 'ProcessPoolExecutor', no_semaphores)
+    hasher = PasswordHasher(rounds=4, workers=2)
+    assert bcrypt.checkpw(b'pw', hasher.hash('pw'))
+    assert hasher.workers == 0
+
+
+def test_broken_pool_is_replaced():
+    hasher = PasswordHasher(rounds=4, workers=1)
+    executor = hasher._pool()
+    executor.submit(os._exit, 1).exception()  # kill the worker, breaking the pool
+    assert hasher.check('pw', hasher.hash('pw'))
+    assert hasher._pool() is not executor
+
+
+def test_needs_rehash_compares_the_stored_cost():
+    hasher = PasswordHasher(rounds=5, workers=0)
+    assert hasher.needs_rehash(bcrypt.hashpw(b'pw', bcrypt.gensalt(4)))
+    assert not hasher.needs_rehash(bcrypt.hashpw(b'pw', bcrypt.gensalt(5)))
+
+
+def test_full_queue_raises_busy():
+    hasher = PasswordHasher(rounds=4, workers=1, max_pending=1, queue_timeout=0.01)
+    hasher._slots.acquire()  # one login already queued
+    with pytest.raises(HasherBusy):
+        hasher.hash('pw')
+    hasher._slots.release()
+    assert hasher.check('pw', hasher.hash('pw'))
@@ -0,0 +1,58 @@
+import asyncio
+from types import SimpleNamespace
+
+from pymongo import monitoring
+
+from app.mongo_metrics import PoolMetrics
+
+ADDRESS = ('localhost', 27017)
+
+
+def test_checkout_waits_use_the_duration_on_each_event():
+    pool = PoolMetrics()
+    # Two checkouts interleaved on one thread, as greenlets or coroutines would be
+    pool.connection_check_out_started(monitoring.ConnectionCheckOutStartedEvent(ADDRESS))
+    pool.connection_check_out_started(monitoring.ConnectionCheckOutStartedEvent(ADDRESS))
+    pool.connection_checked_out(monitoring.ConnectionCheckedOutEvent(ADDRESS, 1, 0.0004))
+    pool.connection_checked_out(monitoring.ConnectionCheckedOutEvent(ADDRESS, 2, 0.2))
+    pool.connection_checked_in(monitoring.ConnectionCheckedInEvent(ADDRESS, 1))
+
+    stats = pool.stats()
+    assert stats['checkouts'] == 2
+    assert stats['in_use'] == 1
+    assert stats['max_in_use'] == 2
+    assert stats['checkout_wait']['count'] == 2
+    assert stats['checkout_wait']['buckets']['le_1'] == 1
+    assert stats['checkout_wait']['buckets']['le_250'] == 1
+    assert pool._waiting == {}
+
+
+def test_failed_checkouts_are_counted_by_reason():
+    pool = PoolMetrics()
+    for reason in (monitoring.ConnectionCheckOutFailedReason.TIMEOUT,
+                   monitoring.ConnectionCheckOutFailedReason.CONN_ERROR):
+        pool.connection_check_out_started(monitoring.ConnectionCheckOutStartedEvent(ADDRESS))
+        pool.connection_check_out_failed(monitoring.ConnectionCheckOutFailedEvent(ADDRESS, reason, 0.5))
+
+    stats = pool.stats()
+    assert (stats['checkout_timeouts'], stats['checkout_failures'], stats['in_use']) == (1, 1, 0)
+    assert stats['checkout_wait']['buckets']['le_500'] == 2
+
+
+def test_without_durations_concurrent_tasks_on_one_thread_are_timed_separately():
+    # Older drivers send no duration; each waiting task must still be matched to its own start
+    pool = PoolMetrics()
+
+    async def checkout(wait):
+        pool.connection_check_out_started(SimpleNamespace(address=ADDRESS))
+        await asyncio.sleep(wait)
+        pool.connection_checked_out(SimpleNamespace(address=ADDRESS, connection_id=1))
+
+    async def main():
+        await asyncio.gather(checkout(0.3), checkout(0.0))
+
+    asyncio.run(main())
+    wait = pool.stats()['checkout_wait']
+    assert wait['count'] == 2
+    assert wait['buckets']['le_1'] == 1
+    assert wait['max_ms'] >= 300
@@ -0,0 +1,51 @@
+import pytest
+from bson.objectid import ObjectId
+
+from app.indexes import ensure_ttl
+from app.notifications import ack_query, frames, new_notification, serialize_notification
+
+
+def test_five_hundred_pending_items_arrive_in_three_frames():
+    user_id = ObjectId()
+    items = [serialize_notification(new_notification(user_id, 'friend_request', {'n': i})) for i in range(500)]
+    batches = frames(items, 200)
+    assert [len(batch) for batch in batches] == [200, 200, 100]
+    assert [item['payload']['n'] for batch in batches for item in batch] == list(range(500))
+
+
+def test_ack_query_is_scoped_to_the_user_and_rejects_bad_ids():
+    user_id, item_id = ObjectId(), ObjectId()
+    assert ack_query(user_id, [str(item_id)]) == {'user_id': user_id, '_id': {'$in': [item_id]}}
+    with pytest.raises(ValueError):
+        ack_query(user_id, ['not-an-id'])
+
+
+class FakeCollection:
+    def __init__(self, indexes=None):
+        self.indexes = indexes or {}
+        self.created = []
+
+    def index_information(self):
+        return self.indexes
+
+    def create_index(self, keys, **options):
+        self.created.append((keys, options))
+
+
+class FakeDB(dict):
+    def __init__(self, **collections):
+        super().__init__(collections)
+        self.commands = []
+
+    def command(self, *args, **kwargs):
+        self.commands.append((args, kwargs))
+
+
+def test_notification_ttl_is_created_then_adjusted_in_place():
+    db = FakeDB(notifications=FakeCollection())
+    ensure_ttl(db, 'notifications', 'created_at_ttl', 'created_at', 3600)
+    assert db['notifications'].created == [([('created_at', 1)], {'name': 'created_at_ttl', 'expireAfterSeconds': 3600})]
+
+    db = FakeDB(notifications=FakeCollection({'created_at_ttl': {'expireAfterSeconds': 3600}}))
+    ensure_ttl(db, 'notifications', 'created_at_ttl', 'created_at', 60)
+    assert db.commands == [(('collMod', 'notifications'), {'index': {'name': 'created_at_ttl', 'expireAfterSeconds': 60}})]
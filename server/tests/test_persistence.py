@@ -0,0 +1,50 @@
+import queue
+import threading
+import time
+from types import SimpleNamespace
+
+from app.persistence import MessageWriter
+
+
+class SlowCollection:
+    def __init__(self, rtt=0.0):
+        self.rtt = rtt
+        self.batches = []
+        self.inserted = threading.Event()
+
+    def insert_many(self, docs, ordered=True):
+        time.sleep(self.rtt)
+        self.batches.append(list(docs))
+        self.inserted.set()
+
+
+def writer_for(collection, **kwargs):
+    writer = MessageWriter(**kwargs)
+    writer._mongo = SimpleNamespace(db=SimpleNamespace(messages=collection))
+    writer.enabled = True
+    return writer
+
+
+def test_submit_does_not_wait_for_the_database():
+    collection = SlowCollection(rtt=0.2)
+    writer = writer_for(collection, flush_interval=0.01)
+    writer.start()
+    started = time.perf_counter()
+    for i in range(100):
+        writer.submit({'_id': i})
+    assert time.perf_counter() - started < 0.1
+    writer.stop()
+    assert sorted(doc['_id'] for batch in collection.batches for doc in batch) == list(range(100))
+    # 100 messages cost a handful of round trips, not 100
+    assert len(collection.batches) < 10
+    assert writer.stats()['flushed'] == 100
+
+
+def test_full_queue_writes_inline_instead_of_dropping():
+    collection = SlowCollection()
+    writer = writer_for(collection, put_timeout=0.01)
+    writer._queue = queue.Queue(maxsize=1)  # no flusher thread draining it
+    writer.submit({'_id': 1})
+    writer.submit({'_id': 2})
+    assert collection.batches == [[{'_id': 2}]]
+    assert writer.stats()['inline_writes'] == 1
@@ -0,0 +1,105 @@
+import importlib
+from types import SimpleNamespace
+
+import pytest
+from bson.objectid import ObjectId
+
+from app.presence import MemoryPresenceStore, PresenceTracker, RedisPresenceStore
+
+
+class FakeSocketIO:
+    def __init__(self):
+        self.emitted = []
+
+    def emit(self, event, data, to=None):
+        self.emitted.append((event, to, data))
+
+    def start_background_task(self, target):
+        pass
+
+
+presence_module = importlib.import_module('app.presence')
+
+
+def make_tracker(store, socketio):
+    tracker = PresenceTracker()
+    tracker._store = store
+    tracker._socketio = socketio
+    tracker._mongo = SimpleNamespace(db=None)
+    return tracker
+
+
+@pytest.fixture
+def friends(monkeypatch):
+    graph = {}
+    monkeypatch.setattr(presence_module, 'friend_ids_of_many',
+                        lambda db, user_ids: {uid: graph.get(uid, []) for uid in user_ids})
+    return graph
+
+
+def test_reload_within_the_debounce_window_broadcasts_nothing(friends):
+    alice, bob = ObjectId(), ObjectId()
+    friends[alice] = [bob]
+    socketio = FakeSocketIO()
+    tracker = make_tracker(MemoryPresenceStore(), socketio)
+    tracker.connect(alice, 'sid-1')
+    tracker.flush()
+    assert socketio.emitted == [('presence', str(bob), [{'user_id': str(alice), 'online': True}])]
+
+    tracker.disconnect('sid-1')
+    tracker.connect(alice, 'sid-2')
+    tracker.flush()
+    assert len(socketio.emitted) == 1
+
+
+def redis_store(server):
+    fakeredis = pytest.importorskip('fakeredis')
+    return RedisPresenceStore(None, client=fakeredis.FakeRedis(server=server))
+
+
+@pytest.fixture
+def redis_server():
+    fakeredis = pytest.importorskip('fakeredis')
+    return fakeredis.FakeServer()
+
+
+def test_last_disconnect_on_another_worker_is_announced(friends, redis_server):
+    alice, bob = ObjectId(), ObjectId()
+    friends[alice] = [bob]
+    socketio = FakeSocketIO()
+    worker_a = make_tracker(redis_store(redis_server), socketio)
+    worker_b = make_tracker(redis_store(redis_server), socketio)
+
+    worker_a.connect(alice, 'a-1')
+    worker_b.connect(alice, 'b-1')
+    worker_a.flush()
+    worker_b.flush()
+    worker_a.disconnect('a-1')
+    worker_a.flush()
+    assert [update for _, _, batch in socketio.emitted for update in batch] == \
+        [{'user_id': str(alice), 'online': True}]
+
+    worker_b.disconnect('b-1')
+    worker_b.flush()
+    assert socketio.emitted[-1] == ('presence', str(bob), [{'user_id': str(alice), 'online': False}])
+
+
+def test_crashed_worker_counts_expire_and_are_announced(friends, redis_server):
+    alice, bob = ObjectId(), ObjectId()
+    friends[alice] = [bob]
+    socketio = FakeSocketIO()
+    crashed = make_tracker(redis_store(redis_server), socketio)
+    survivor = make_tracker(redis_store(redis_server), socketio)
+    crashed.connect(alice, 'c-1')
+    crashed.flush()
+    survivor.connect(ObjectId(), 's-1')
+
+    # The crashed worker stops heartbeating; its counts expire
+    client = crashed._store._client
+    client.delete(crashed._store.counts_key)
+    assert survivor.online([alice]) == set()
+
+    survivor.heartbeat()
+    survivor.flush()
+    assert socketio.emitted[-1] == ('presence', str(bob), [{'user_id': str(alice), 'online': False}])
+    assert crashed._store.worker_id.encode() not in client.smembers('presence:workers')
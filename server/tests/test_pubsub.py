@@ -0,0 +1,80 @@
+import multiprocessing
+import threading
+import time
+
+from app.pubsub import LocalSocketManager
+
+WORKERS = 3
+
+
+def run_worker(url, channel, ready, received):
+    """A Socket.IO worker's client manager; emits it receives are reported back."""
+    manager = LocalSocketManager(url, channel=channel)
+    manager._handle_emit = lambda data: received.put((data['room'], data['data']))
+    threading.Thread(target=manager._thread, daemon=True).start()
+    ready.set()
+    time.sleep(30)
+
+
+def emit_packet(room, data):
+    return {'method': 'emit', 'event': 'receive_global_message', 'data': data,
+            'namespace': '/', 'room': room, 'skip_sid': None, 'callback': None,
+            'host_id': 'publisher'}
+
+
+def test_emit_reaches_every_worker(tmp_path):
+    url = f'local://{tmp_path}'
+    context = multiprocessing.get_context('fork')
+    received = context.Queue()
+    workers = []
+    for _ in range(WORKERS):
+        ready = context.Event()
+        process = context.Process(target=run_worker, args=(url, 'test', ready, received), daemon=True)
+        process.start()
+        assert ready.wait(10)
+        workers.append(process)
+
+    try:
+        publisher = LocalSocketManager(url, channel='test', write_only=True)
+        publisher._publish(emit_packet('global_chat', {'content': 'hello'}))
+        deliveries = [received.get(timeout=5) for _ in range(WORKERS)]
+        assert deliveries == [('global_chat', {'content': 'hello'})] * WORKERS
+        assert publisher.stats()['peers'] == WORKERS
+    finally:
+        for process in workers:
+            process.terminate()
+
+
+def test_publish_drops_instead_of_blocking_on_a_stalled_worker(tmp_path):
+    stalled = LocalSocketManager(f'local://{tmp_path}', channel='test')
+    publisher = LocalSocketManager(f'local://{tmp_path}', channel='test', write_only=True)
+    try:
+        started = time.monotonic()
+        for i in range(100):
+            publisher._publish(emit_packet('global_chat', {'n': i}))
+        assert time.monotonic() - started < 1.0
+        assert publisher.dropped > 0
+    finally:
+        stalled.close()
+
+
+def test_peer_list_follows_workers_joining_and_leaving(tmp_path):
+    publisher = LocalSocketManager(f'local://{tmp_path}', channel='test', write_only=True)
+    assert publisher._peer_paths() == []
+    worker = LocalSocketManager(f'local://{tmp_path}', channel='test')
+    assert publisher._peer_paths() == [worker._path]
+    worker.close()
+    assert publisher._peer_paths() == []
+
+
+def test_oversized_event_is_counted_instead_of_raising(tmp_path, capsys):
+    worker = LocalSocketManager(f'local://{tmp_path}', channel='test')
+    publisher = LocalSocketManager(f'local://{tmp_path}', channel='test', write_only=True)
+    try:
+        publisher._publish(emit_packet('global_chat', {'content': 'x' * (4 * 1024 * 1024)}))
+        stats = publisher.stats()
+        assert stats['oversized'] == 1
+        assert stats['last_lost']['room'] == 'global_chat'
+        assert 'datagram limit' in capsys.readouterr().out
+    finally:
+        worker.close()
@@ -0,0 +1,66 @@
+import threading
+
+from app import limiter
+from app.ratelimit import MemoryBucketStore, RateLimiter
+
+
+def make_limiter(rules):
+    rate_limiter = RateLimiter()
+    rate_limiter.rules = dict(rules)
+    return rate_limiter
+
+
+def test_bucket_table_never_grows_past_max_keys():
+    store = MemoryBucketStore(max_keys=100)
+    for i in range(1000):
+        store.consume(f'user:{i}', rate=1, burst=5)  # all active, none idle long enough to sweep
+    assert len(store) == 100
+
+
+def test_eviction_drops_the_least_recently_used_bucket():
+    store = MemoryBucketStore(max_keys=2)
+    store.consume('a', rate=0.001, burst=1)
+    store.consume('b', rate=0.001, burst=1)
+    assert not store.consume('a', rate=0.001, burst=1)  # 'a' is now the most recent
+    store.consume('c', rate=0.001, burst=1)              # evicts 'b'
+    assert not store.consume('a', rate=0.001, burst=1)  # 'a' kept its empty bucket
+    assert store.consume('b', rate=0.001, burst=1)      # 'b' starts over
+
+
+def test_refund_returns_a_token_without_exceeding_burst():
+    rate_limiter = make_limiter({'send': (0.001, 1)})
+    assert rate_limiter.allow('send', 'alice')
+    assert not rate_limiter.allow('send', 'alice')
+    rate_limiter.refund('send', 'alice')
+    rate_limiter.refund('send', 'alice')
+    assert rate_limiter.allow('send', 'alice')
+    assert not rate_limiter.allow('send', 'alice')
+
+
+def test_rejections_are_counted_across_threads():
+    rate_limiter = make_limiter({'send': (0.001, 1)})
+    rate_limiter.allow('send', 'alice')
+
+    def flood():
+        for _ in range(2000):
+            rate_limiter.allow('send', 'alice')
+
+    threads = [threading.Thread(target=flood) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert rate_limiter.stats()['rejected'] == 8 * 2000
+
+
+def test_full_global_room_does_not_spend_the_senders_token(monkeypatch):
+    from app.events import allow_global_message
+    monkeypatch.setattr(limiter, 'enabled', True)
+    monkeypatch.setattr(limiter, 'rules', {'send_global_message': (0.001, 1), 'global_room': (0.001, 1)})
+    monkeypatch.setattr(limiter, '_store', MemoryBucketStore())
+
+    assert allow_global_message('alice')
+    assert not allow_global_message('bob')  # the room is full
+    limiter.rules['global_room'] = (0.001, 10)
+    limiter._store._buckets.pop('global_room:global_chat')
+    assert allow_global_message('bob')      # the rejected attempt cost bob nothing
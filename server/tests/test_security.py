@@ -0,0 +1,46 @@
+from types import SimpleNamespace
+
+import pytest
+from jose import jwt
+
+from app import security
+
+
+def app_with(**config):
+    return SimpleNamespace(config=config)
+
+
+@pytest.fixture(autouse=True)
+def reset_session_key():
+    yield
+    security.init_session_tokens(app_with(AUTH_TOKENS_ENABLED=False))
+
+
+def test_tokens_round_trip_with_the_app_secret():
+    security.init_session_tokens(app_with(AUTH_TOKENS_ENABLED=True, SECRET_KEY='s3cret-for-tests'))
+    tokens = security.create_session_tokens('abc', 'alice')
+    claims = security.decode_session_token(tokens['access_token'])
+    assert claims['sub'] == 'abc' and claims['username'] == 'alice'
+    assert security.decode_session_token(tokens['refresh_token'], token_type='refresh')['jti'] == tokens['refresh_jti']
+    assert security.decode_session_token(tokens['refresh_token']) is None
+
+
+def test_no_token_is_accepted_while_token_mode_is_off():
+    forged = jwt.encode({'sub': 'victim', 'type': 'access'}, security.SECRET_KEY, algorithm=security.ALGORITHM)
+    security.init_session_tokens(app_with(AUTH_TOKENS_ENABLED=False, SECRET_KEY='dev_key'))
+    assert not security.session_tokens_enabled()
+    assert security.decode_session_token(forged) is None
+    with pytest.raises(RuntimeError):
+        security.create_session_tokens('abc', 'alice')
+
+
+@pytest.mark.parametrize('secret', ['', 'dev_key', 'a_super_secret_key_that_should_be_in_env'])
+def test_token_mode_refuses_default_secrets(secret):
+    with pytest.raises(RuntimeError):
+        security.init_session_tokens(app_with(AUTH_TOKENS_ENABLED=True, SECRET_KEY=secret))
+
+
+def test_tokens_signed_with_the_old_module_fallback_are_rejected():
+    security.init_session_tokens(app_with(AUTH_TOKENS_ENABLED=True, SECRET_KEY='s3cret-for-tests'))
+    forged = jwt.encode({'sub': 'victim', 'type': 'access'}, security.SECRET_KEY, algorithm=security.ALGORITHM)
+    assert security.decode_session_token(forged) is None
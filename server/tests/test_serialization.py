@@ -0,0 +1,53 @@
+import asyncio
+import json
+
+from app import serialization
+from app.websocket_manager import ConnectionManager
+
+
+def test_dumps_matches_the_stdlib_encoding():
+    payload = {'id': 'abc', 'content': 'héllo "quoted"', 'n': 3, 'tags': [1, 2.5, None, True]}
+    encoded = serialization.dumps(payload)
+    assert isinstance(encoded, str)
+    assert json.loads(encoded) == payload
+    assert serialization.loads(encoded) == payload
+    assert ' ' not in serialization.dumps({'a': [1, 2]})
+
+
+def test_non_string_keys_fall_back_to_the_stdlib():
+    assert json.loads(serialization.dumps({1: 'one'})) == {'1': 'one'}
+
+
+class RecordingWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message):
+        self.sent.append(message)
+
+
+def test_broadcast_json_encodes_once_for_the_whole_room(monkeypatch):
+    calls = []
+    real_dumps = serialization.dumps
+
+    def counting_dumps(obj, **kwargs):
+        calls.append(obj)
+        return real_dumps(obj, **kwargs)
+    monkeypatch.setattr(serialization, 'dumps', counting_dumps)
+
+    async def scenario():
+        manager = ConnectionManager()
+        clients = [RecordingWebSocket() for _ in range(50)]
+        for websocket in clients:
+            await manager.connect('room', websocket)
+        await manager.broadcast_json('room', {'content': 'hi'})
+        await asyncio.sleep(0)
+        return clients
+
+    clients = asyncio.run(scenario())
+    assert len(calls) == 1
+    first = clients[0].sent[0]
+    assert all(websocket.sent[0] is first for websocket in clients)
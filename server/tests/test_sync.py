@@ -0,0 +1,48 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+from bson.objectid import ObjectId
+
+from app import migrations, sync
+from app.friendships import FRIENDSHIP_MIGRATION
+
+
+class FakeMessages:
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = []
+
+    def aggregate(self, pipeline, **kwargs):
+        self.calls.append((pipeline, kwargs))
+        return self.rows
+
+
+def test_resolve_positions_rejects_non_string_markers():
+    with pytest.raises(ValueError):
+        sync.resolve_positions(None, {'global': 12345})
+
+
+def test_resolve_positions_decodes_cursors_without_a_query():
+    message_id = ObjectId()
+    positions = sync.resolve_positions(None, {'dm:x': f'1700000000000_{message_id}', 'global': None})
+    assert positions['dm:x'][1] == message_id
+    assert positions['global'] is None
+
+
+def test_digest_groups_newest_per_conversation_on_the_index(monkeypatch):
+    monkeypatch.setattr(migrations, '_completed', {migrations.CONVERSATION_BACKFILL, FRIENDSHIP_MIGRATION})
+    user_id, friend_id = ObjectId(), ObjectId()
+    monkeypatch.setattr(sync, 'list_friend_ids', lambda db, uid, limit: [friend_id])
+    now = datetime.now(timezone.utc)
+    message_id = ObjectId()
+    messages = FakeMessages([{'_id': sync.conversation_id(user_id, friend_id),
+                              'last_message_id': message_id, 'last_timestamp': now}])
+
+    digest = sync.conversation_digest(SimpleNamespace(messages=messages), user_id)
+
+    assert digest == [{'unique_id': str(friend_id), 'last_message_id': str(message_id),
+                       'last_timestamp': now.isoformat()}]
+    pipeline, options = messages.calls[0]
+    assert options == {'hint': 'conversation_timestamp'}
+    assert list(pipeline[1]['$sort']) == ['conversation_id', 'timestamp', '_id']
@@ -0,0 +1,108 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from bson.objectid import ObjectId
+
+from app.typeahead import UsernameIndex
+
+
+class FakeUsers:
+    """The slice of a pymongo collection UsernameIndex.refresh uses."""
+    def __init__(self):
+        self.docs = []
+        self.scans = 0
+
+    def insert(self, username, created):
+        doc = {'_id': ObjectId.from_datetime(created), 'username': username}
+        # from_datetime zeroes the counter bytes; keep ids unique but time-ordered
+        doc['_id'] = ObjectId(str(doc['_id'])[:8] + ObjectId().binary.hex()[8:])
+        self.docs.append(doc)
+        return doc['_id']
+
+    def find(self, query, projection=None):
+        self.scans += 1
+        low = query.get('_id', {}).get('$gt')
+        return FakeCursor([doc for doc in self.docs if low is None or doc['_id'] > low])
+
+
+class FakeCursor(list):
+    def sort(self, key, direction):
+        return FakeCursor(sorted(self, key=lambda doc: doc[key], reverse=direction == -1))
+
+
+def make_index(users):
+    index = UsernameIndex(skew=5.0)
+    index._mongo = SimpleNamespace(db=SimpleNamespace(users=users))
+    return index
+
+
+def test_local_add_does_not_hide_older_ids_from_other_workers():
+    users = FakeUsers()
+    now = datetime.now(timezone.utc)
+    users.insert('alice', now - timedelta(minutes=5))
+    index = make_index(users)
+    assert index.refresh(force=True)
+
+    # Registered on this worker, then another worker's insert with a slightly older id commits
+    local_id = users.insert('bob', now)
+    index.add(local_id, 'bob')
+    users.insert('carol', now - timedelta(seconds=1))
+
+    assert index.refresh(force=True)
+    assert [user['username'] for user in index.search('')] == ['alice', 'bob', 'carol']
+
+
+def test_overlap_window_is_deduplicated():
+    users = FakeUsers()
+    now = datetime.now(timezone.utc)
+    users.insert('dave', now)
+    index = make_index(users)
+    index.refresh(force=True)
+    index.refresh(force=True)
+    assert index.stats()['entries'] == 1
+
+
+def test_snapshot_keeps_the_scan_watermark(tmp_path):
+    users = FakeUsers()
+    now = datetime.now(timezone.utc)
+    users.insert('erin', now - timedelta(minutes=1))
+    index = make_index(users)
+    index.refresh(force=True)
+    index.add(users.insert('frank', now), 'frank')
+    index.save_snapshot(str(tmp_path / 'typeahead.json.gz'))
+
+    restored = make_index(users)
+    restored.snapshot_path = str(tmp_path / 'typeahead.json.gz')
+    restored._load_snapshot()
+    assert restored._last_id == index._last_id
+
+
+class ThreadedSocketIO:
+    """start_background_task/sleep as Flask-SocketIO provides them in threading mode."""
+    def start_background_task(self, target):
+        threading.Thread(target=target, daemon=True).start()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+def test_search_never_scans_and_the_background_task_picks_up_new_users():
+    users = FakeUsers()
+    now = datetime.now(timezone.utc)
+    users.insert('gina', now - timedelta(minutes=1))
+    index = make_index(users)
+    index.refresh_interval = 0.2
+    index._socketio = ThreadedSocketIO()
+    index.ready = index.refresh(force=True)
+    scans = users.scans
+
+    assert [user['username'] for user in index.search('g')] == ['gina']
+    assert users.scans == scans  # the request path did not touch the collection
+
+    users.insert('gus', now)  # registered on another worker
+    deadline = time.monotonic() + 3
+    while time.monotonic() < deadline and len(index.search('g')) < 2:
+        time.sleep(0.01)
+    assert [user['username'] for user in index.search('g')] == ['gina', 'gus']
@@ -0,0 +1,127 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.websocket_manager import ConnectionManager, NotificationManager
+
+
+class FakeWebSocket:
+    def __init__(self, delay=0.0, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.sent = []
+        self.closed_with = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message):
+        if self.fail:
+            raise RuntimeError('connection reset')
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.sent.append(message)
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_stalled_client_is_evicted_without_delaying_the_room():
+    async def scenario():
+        manager = ConnectionManager(max_queue=4)
+        fast = [FakeWebSocket() for _ in range(100)]
+        stalled = FakeWebSocket(delay=3600)
+        for websocket in fast + [stalled]:
+            await manager.connect('room', websocket)
+        for i in range(10):
+            await manager.broadcast('room', f'm{i}')
+            await settle()
+        return manager, fast, stalled
+
+    manager, fast, stalled = asyncio.run(scenario())
+    assert all(websocket.sent == [f'm{i}' for i in range(10)] for websocket in fast)
+    assert stalled.closed_with == 1013
+    assert stalled not in manager.active_connections['room']
+    assert manager.evicted == 1
+
+
+def test_send_stuck_past_the_timeout_is_evicted_on_the_next_broadcast():
+    async def scenario():
+        manager = ConnectionManager(send_timeout=0.01)
+        stuck = FakeWebSocket(delay=3600)
+        await manager.connect('room', stuck)
+        await manager.broadcast('room', 'first')
+        await asyncio.sleep(0.05)
+        await manager.broadcast('room', 'second')
+        await settle()
+        return manager, stuck
+
+    manager, stuck = asyncio.run(scenario())
+    assert stuck.closed_with == 1013
+    assert 'room' not in manager.active_connections
+
+
+def test_broken_socket_is_dropped():
+    async def scenario():
+        manager = ConnectionManager()
+        healthy, broken = FakeWebSocket(), FakeWebSocket(fail=True)
+        await manager.connect('room', healthy)
+        await manager.connect('room', broken)
+        await manager.broadcast('room', 'hello')
+        await settle()
+        return manager, healthy
+
+    manager, healthy = asyncio.run(scenario())
+    assert list(manager.active_connections['room']) == [healthy]
+    assert healthy.sent == ['hello']
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, keys):
+        return self
+
+    async def to_list(self, length):
+        return self.docs[:length]
+
+
+class FakeOutbox:
+    def __init__(self):
+        self.docs = []
+
+    async def insert_one(self, doc):
+        self.docs.append(doc)
+
+    def find(self, query):
+        return FakeCursor([doc for doc in self.docs if doc['user_id'] == query['user_id']])
+
+    async def delete_many(self, query):
+        ids = set(query['_id']['$in'])
+        before = len(self.docs)
+        self.docs = [doc for doc in self.docs if doc['_id'] not in ids]
+        return SimpleNamespace(deleted_count=before - len(self.docs))
+
+
+def test_offline_notifications_are_queued_delivered_and_acked():
+    async def scenario():
+        outbox = FakeOutbox()
+        manager = NotificationManager(outbox=outbox)
+        user_id = '5f0000000000000000000001'
+        for i in range(3):
+            await manager.send_personal_notification(user_id, f'note {i}')
+        websocket = FakeWebSocket()
+        await manager.connect(user_id, websocket)
+        await manager.deliver_pending(user_id, websocket, frame_size=2)
+        ids = [str(doc['_id']) for doc in outbox.docs]
+        acked = await manager.ack(user_id, ids)
+        return outbox, websocket, acked
+
+    outbox, websocket, acked = asyncio.run(scenario())
+    assert len(websocket.sent) == 2  # three items in frames of two
+    assert acked == 3 and outbox.docs == []
@@ -1,3 +1,6 @@
+import async_runtime
+async_runtime.monkey_patch()
+
 from app import create_app, socketio
 
 app, socketio = create_app()